@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+"""
+Collect queues at high metric rates: a single Queue shared by all collector
+threads versus ShardedQueue with one shard per thread and work stealing.
+
+WORKERS collector threads take metrics and sample for WORK_US microseconds
+each.  Throughput is measured with a dispatcher thread putting NUM_ITEMS
+metrics back to back.  Latency, from put to get, is measured with metrics
+put at RATE per second in bursts of BURST, as EventCheckerThread does when
+many metrics are due at once.
+
+    $ python benchmarks/collect_queue_benchmark.py
+"""
+
+import threading
+import time
+from Queue import Queue
+
+from liota.core.sharded_queue import ShardedQueue
+from liota.lib.utilities.histogram import Histogram
+
+NUM_ITEMS = 100000
+WORK_US = 20
+RATE = 10000
+BURST = 100
+DURATION_S = 3
+WORKERS = (8, 32, 64)
+
+
+def _collector(queue, shard, latency, lock):
+    latencies = []
+    while True:
+        if isinstance(queue, ShardedQueue):
+            item = queue.get(shard)
+        else:
+            item = queue.get()
+        if item is None:
+            break
+        latencies.append((time.time() - item) * 1000)
+        end = time.time() + WORK_US / 1000000.0
+        while time.time() < end:
+            pass
+    with lock:
+        for value in latencies:
+            latency.record(value)
+
+
+def _run(queue, num_workers, dispatch):
+    latency = Histogram()
+    lock = threading.Lock()
+    workers = [threading.Thread(target=_collector,
+                                args=(queue, shard, latency, lock))
+               for shard in range(num_workers)]
+    for worker in workers:
+        worker.start()
+    start = time.time()
+    num_items = dispatch(queue)
+    for _ in workers:
+        queue.put(None)
+    for worker in workers:
+        worker.join()
+    return num_items / (time.time() - start), latency
+
+
+def _back_to_back(queue):
+    for _ in range(NUM_ITEMS):
+        queue.put(time.time())
+    return NUM_ITEMS
+
+
+def _bursts(queue):
+    period = float(BURST) / RATE
+    start = time.time()
+    num_bursts = int(DURATION_S / period)
+    for i in range(num_bursts):
+        delay = start + i * period - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        for _ in range(BURST):
+            queue.put(time.time())
+    return num_bursts * BURST
+
+
+def main():
+    print "%-8s %-8s %14s %16s %16s" % (
+        "queue", "workers", "max metrics/s",
+        "mean at %d/s" % RATE, "p99 at %d/s" % RATE)
+    for num_workers in WORKERS:
+        for name, create_queue in (
+                ("shared", Queue),
+                ("sharded", lambda: ShardedQueue(num_workers))):
+            rate, _ = _run(create_queue(), num_workers, _back_to_back)
+            _, latency = _run(create_queue(), num_workers, _bursts)
+            print "%-8s %-8d %14.0f %13.2f ms %13.2f ms" % (
+                name, num_workers, rate, latency.mean(),
+                latency.percentile(99))
+
+
+if __name__ == '__main__':
+    main()
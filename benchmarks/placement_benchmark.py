@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+"""
+Collector occupancy and send rate of 200 metrics with a 5 second interval,
+started in a loop, with aligned, spread and jittered placement of their
+first run.
+
+Collection is simulated in virtual time: a pool of COLLECTORS collector
+threads takes SAMPLE_MS per metric, and a metric is sent as soon as it is
+collected.
+
+    $ python benchmarks/placement_benchmark.py
+"""
+
+import heapq
+import random
+
+from liota.core.placement import Placement, ALIGNED, SPREAD, JITTER
+from liota.lib.utilities.histogram import Histogram
+
+METRICS = 200
+INTERVAL_MS = 5000
+START_SPACING_MS = 0.1
+SAMPLE_MS = 20
+COLLECTORS = 10
+SIMULATED_MS = 60000
+BUCKET_MS = 100
+
+
+def simulate(placement):
+    random.seed(0)
+    runs = [(placement.first_run_time(INTERVAL_MS, i * START_SPACING_MS), i)
+            for i in range(METRICS)]
+    heapq.heapify(runs)
+    collectors = [0.0] * COLLECTORS  # time each collector is free again
+    lag = Histogram()
+    sends_per_bucket = {}
+    while runs[0][0] < SIMULATED_MS:
+        due, metric = heapq.heappop(runs)
+        free = heapq.heappop(collectors)
+        start = max(due, free)
+        end = start + SAMPLE_MS
+        heapq.heappush(collectors, end)
+        lag.record(start - due)
+        bucket = int(end // BUCKET_MS)
+        sends_per_bucket[bucket] = sends_per_bucket.get(bucket, 0) + 1
+        heapq.heappush(runs, (due + INTERVAL_MS, metric))
+    return lag, max(sends_per_bucket.values())
+
+
+def peak_demand(placement):
+    """
+    Returns the largest number of collections which would be in progress at
+    once with as many collectors as needed.
+    """
+    random.seed(0)
+    starts = sorted(placement.first_run_time(INTERVAL_MS, i * START_SPACING_MS)
+                    % INTERVAL_MS for i in range(METRICS))
+    peak = 0
+    for t in range(INTERVAL_MS):
+        busy = sum(1 for start in starts if start <= t < start + SAMPLE_MS)
+        peak = max(peak, busy)
+    return peak
+
+
+def main():
+    print "%-8s %20s %14s %14s %18s" % (
+        "policy", "peak collector demand", "lag p99 (ms)", "lag max (ms)",
+        "peak sends/%d ms" % BUCKET_MS)
+    for policy in (ALIGNED, SPREAD, JITTER):
+        lag, peak_sends = simulate(Placement(policy, jitter_ms=INTERVAL_MS))
+        print "%-8s %20d %14.1f %14.1f %18d" % (
+            policy, peak_demand(Placement(policy, jitter_ms=INTERVAL_MS)),
+            lag.percentile(99), lag.max, peak_sends)
+    print "(%d collectors, %d ms per collection, mean occupancy %.0f%%)" % (
+        COLLECTORS, SAMPLE_MS,
+        100.0 * METRICS * SAMPLE_MS / INTERVAL_MS / COLLECTORS)
+
+
+if __name__ == '__main__':
+    main()
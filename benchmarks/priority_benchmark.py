@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+"""
+Publish latency of high priority metrics while a send queue is saturated by
+low priority metrics, with a FIFO BoundedQueue and with PriorityClassQueue
+using strict and weighted scheduling.
+
+A sender thread takes SEND_MS per metric.  Low priority metrics are offered
+at OVERLOAD times what it can send, high priority metrics every
+HIGH_PERIOD_MS.  Latency is measured from put to end of send.
+
+    $ python benchmarks/priority_benchmark.py
+"""
+
+import threading
+import time
+
+from liota.core.bounded_queue import BoundedQueue, PriorityClassQueue, \
+    DROP_OLDEST, STRICT, WEIGHTED
+from liota.lib.utilities.histogram import Histogram
+
+DURATION_S = 3
+SEND_MS = 1
+OVERLOAD = 1.5
+HIGH_PERIOD_MS = 20
+CAPACITY = 1000
+HIGH, LOW = 0, 2
+
+
+class BenchMetric(object):
+
+    def __init__(self, priority_class):
+        self.priority_class = priority_class
+        self.enqueued_at = time.time()
+
+
+def _priority_of(metric):
+    return metric.priority_class
+
+
+def _sender(queue, latency):
+    while True:
+        metric = queue.get()
+        if isinstance(metric, SystemExit):
+            return
+        time.sleep(SEND_MS / 1000.0)
+        latency[metric.priority_class].record(
+            (time.time() - metric.enqueued_at) * 1000)
+
+
+def bench(queue):
+    latency = {HIGH: Histogram(), LOW: Histogram()}
+    sender = threading.Thread(target=_sender, args=(queue, latency))
+    sender.start()
+    low_period = SEND_MS / 1000.0 / OVERLOAD
+    start = time.time()
+    next_high = start
+    num_low = 0
+    while time.time() - start < DURATION_S:
+        now = time.time()
+        if now >= next_high:
+            queue.put(BenchMetric(HIGH))
+            next_high += HIGH_PERIOD_MS / 1000.0
+        while num_low < (now - start) / low_period:
+            queue.put(BenchMetric(LOW))
+            num_low += 1
+        time.sleep(0.0005)
+    queue.put(SystemExit())
+    sender.join()
+    return latency
+
+
+def main():
+    queues = [
+        ("fifo", lambda: BoundedQueue(CAPACITY, DROP_OLDEST)),
+        ("strict", lambda: PriorityClassQueue(
+            _priority_of, (8, 4, 1), STRICT, max_wait_ms=1000,
+            capacity=CAPACITY, policy=DROP_OLDEST)),
+        ("weighted", lambda: PriorityClassQueue(
+            _priority_of, (8, 4, 1), WEIGHTED,
+            capacity=CAPACITY, policy=DROP_OLDEST)),
+    ]
+    print "%-10s %16s %16s %12s" % ("queue", "high p99 (ms)", "low p99 (ms)",
+                                    "low sent")
+    for name, create_queue in queues:
+        latency = bench(create_queue())
+        print "%-10s %16.1f %16.1f %12d" % (
+            name,
+            latency[HIGH].percentile(99),
+            latency[LOW].percentile(99),
+            latency[LOW].count
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+"""
+Memory, put and drain time of the samples buffered by METRICS metrics,
+SAMPLES (ts, v) samples each: a Queue of tuples, as RegisteredMetric used
+to buffer them, versus the columns of SampleBuffer.
+
+    $ python benchmarks/sample_buffer_benchmark.py
+"""
+
+import sys
+import time
+from Queue import Queue
+
+from liota.core.bounded_queue import SampleBuffer
+
+METRICS = 10000
+SAMPLES = 60
+
+
+def queue_bytes(queue):
+    return sys.getsizeof(queue.queue) + sum(
+        sys.getsizeof(sample) + sys.getsizeof(sample[0]) +
+        sys.getsizeof(sample[1]) for sample in queue.queue)
+
+
+def buffer_bytes(buf):
+    return sys.getsizeof(buf._timestamps) + sys.getsizeof(buf._values)
+
+
+def drain_queue(queue):
+    samples = []
+    for _ in range(queue.qsize()):
+        samples.append(queue.get(block=True))
+    return samples
+
+
+def run(name, make, num_bytes, drain):
+    now = long(time.time() * 1000)
+    buffers = [make() for _ in range(METRICS)]
+    start = time.time()
+    for i in range(SAMPLES):
+        ts = now + i * 1000
+        for buf in buffers:
+            buf.put((ts, float(i)))
+    put_ms = (time.time() - start) * 1000
+    total = sum(num_bytes(buf) for buf in buffers)
+    start = time.time()
+    for buf in buffers:
+        drain(buf)
+    drain_ms = (time.time() - start) * 1000
+    print "%-14s %12.1f %10.0f %12.0f" % (
+        name, total / 1048576.0, put_ms, drain_ms)
+
+
+def main():
+    print "%d metrics, %d samples each" % (METRICS, SAMPLES)
+    print "%-14s %12s %10s %12s" % ("buffer", "memory (MB)", "put (ms)",
+                                    "drain (ms)")
+    run("Queue", Queue, queue_bytes, drain_queue)
+    run("SampleBuffer", SampleBuffer, buffer_bytes, SampleBuffer.drain)
+
+
+if __name__ == '__main__':
+    main()
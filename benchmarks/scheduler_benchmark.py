@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+"""
+Compares EventsPriorityQueue, a heap with lazy removal, with
+TimingWheelEventQueue, a hierarchical timing wheel, at 1k, 10k and 100k
+metrics.
+
+Both queues are driven in virtual time, as EventCheckerThread drives them:
+waiting for due metrics advances a VirtualClock instead of sleeping, so the
+numbers only reflect the cost of scheduling: insertion, rescheduling of due
+metrics and cancellation of a few metrics.
+
+    $ python benchmarks/scheduler_benchmark.py
+"""
+
+import logging
+import random
+import time
+
+from liota.core.metric_handler import EventsPriorityQueue, \
+    TimingWheelEventQueue
+from liota.lib.utilities.clock import VirtualClock, use_virtual_clock
+
+SIMULATED_SECONDS = 120
+TICK_MS = 10
+CANCELLATIONS = 100
+
+
+class BenchMetric(object):
+    """
+    Stands in for RegisteredMetric, compared on next run time the same way.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.next_run_time = 0
+        self.flag_alive = True
+
+    def get_next_run_time(self):
+        return self.next_run_time
+
+    def __cmp__(self, other):
+        if not isinstance(other, BenchMetric):
+            return -1
+        return cmp(self.next_run_time, other.next_run_time)
+
+
+class SleepingCondition:
+    """
+    Stands in for the Condition EventCheckerThread waits on, a wait moves
+    the virtual clock by its timeout.
+    """
+
+    def __init__(self, lock, clock):
+        self._lock = lock
+        self._clock = clock
+
+    def __enter__(self):
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+    def acquire(self):
+        self._lock.acquire()
+
+    def release(self):
+        self._lock.release()
+
+    def wait(self, timeout=None):
+        # Metrics are always queued, waits are never unbounded
+        self._clock.advance(max(int(round(timeout * 1000)), 1))
+
+    def notify(self, n=1):
+        pass
+
+
+def _make_metrics(count):
+    random.seed(count)
+    metrics = []
+    for _ in range(count):
+        metric = BenchMetric(random.choice([1, 5, 10, 30, 60]) * 1000)
+        metric.next_run_time = random.randint(0, metric.interval)
+        metrics.append(metric)
+    return metrics
+
+
+def bench(make_queue, metrics):
+    clock = VirtualClock()
+    with use_virtual_clock(clock):
+        queue = make_queue()
+        queue.first_element_changed = SleepingCondition(queue.mutex, clock)
+        start = time.time()
+        for metric in metrics:
+            queue.put_and_notify(metric)
+        insert = time.time() - start
+
+        runs = 0
+        start = time.time()
+        while clock.now_ms < SIMULATED_SECONDS * 1000:
+            for metric in queue.get_ready_elements():
+                metric.next_run_time += metric.interval
+                queue.put_and_notify(metric)
+                runs += 1
+        reschedule = time.time() - start
+
+        start = time.time()
+        for metric in metrics[:CANCELLATIONS]:
+            queue.remove(metric)
+        cancel = time.time() - start
+    return insert, reschedule, cancel, runs
+
+
+def main():
+    # Queues log every insertion at debug level
+    logging.disable(logging.DEBUG)
+    print "%-8s %-6s %12s %12s %14s %14s" % (
+        "metrics", "queue", "insert(ms)", "runs", "per run(us)",
+        "per cancel(us)")
+    for count in [1000, 10000, 100000]:
+        for name, make_queue in [
+                ("heap", EventsPriorityQueue),
+                ("wheel", lambda: TimingWheelEventQueue(TICK_MS))]:
+            insert, reschedule, cancel, runs = bench(make_queue,
+                                                     _make_metrics(count))
+            print "%-8d %-6s %12.1f %12d %14.2f %14.2f" % (
+                count, name, insert * 1000, runs,
+                reschedule * 1000000 / max(runs, 1),
+                cancel * 1000000 / CANCELLATIONS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+"""
+Replays SIMULATED_HOURS of scheduling of METRICS metrics in virtual time
+with SchedulerHarness, with the heap and the timing wheel scheduler: lag of
+runs behind their due time, runs skipped, and how much faster than real
+time the replay is.  A random SLOW_FRACTION of metrics take SLOW_SAMPLE_MS
+to sample, the others SAMPLE_MS.
+
+    $ python benchmarks/scheduler_simulation_benchmark.py
+"""
+
+import random
+import time
+
+from liota.core.metric_handler import EventsPriorityQueue, \
+    TimingWheelEventQueue
+from liota.core.placement import Placement, SPREAD
+from liota.core.scheduler_harness import SchedulerHarness
+from liota.entities.metrics.metric import Metric
+
+METRICS = 1000
+INTERVAL = 60
+SAMPLE_MS = 20
+SLOW_SAMPLE_MS = 3000
+SLOW_FRACTION = 0.05
+COLLECTORS = 4
+SIMULATED_HOURS = 6
+
+
+def sample():
+    return 1
+
+
+def replay(event_ds):
+    random.seed(0)
+    start = time.time()
+    with SchedulerHarness(num_collectors=COLLECTORS, event_ds=event_ds,
+                          placement=Placement(SPREAD)) as harness:
+        for i in range(METRICS):
+            harness.add_metric(
+                Metric("metric-%d" % i, interval=INTERVAL,
+                       sampling_function=sample),
+                sample_ms=SLOW_SAMPLE_MS if random.random() < SLOW_FRACTION
+                else SAMPLE_MS)
+        harness.run(SIMULATED_HOURS * 3600 * 1000)
+    elapsed = time.time() - start
+    num_skipped = sum(metric.num_skipped for metric in harness.metrics)
+    return harness, num_skipped, elapsed
+
+
+def main():
+    print "%-13s %10s %14s %14s %10s %10s %10s" % (
+        "scheduler", "runs", "lag p99 (ms)", "lag max (ms)", "skipped",
+        "real (s)", "speedup")
+    for name, event_ds in (("heap", EventsPriorityQueue),
+                           ("timing_wheel",
+                            lambda: TimingWheelEventQueue(10))):
+        harness, num_skipped, elapsed = replay(event_ds)
+        print "%-13s %10d %14.1f %14.1f %10d %10.1f %10d" % (
+            name, harness.num_runs, harness.lag.percentile(99),
+            harness.lag.max, num_skipped, elapsed,
+            SIMULATED_HOURS * 3600 / elapsed)
+    print "(%d metrics every %d s, %d collectors, %d simulated hours)" % (
+        METRICS, INTERVAL, COLLECTORS, SIMULATED_HOURS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+"""
+Size, write and read time of state snapshots of 1k, 10k and 100k metrics,
+each with SAMPLES unsent samples.
+
+    $ python benchmarks/state_snapshot_benchmark.py
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from liota.core import state_snapshot
+
+METRICS = (1000, 10000, 100000)
+SAMPLES = 5
+RUNS = 5
+
+
+def make_state(num_metrics):
+    now = long(time.time() * 1000)
+    return dict(
+        ((str(uuid.uuid4()), "Graphite"),
+         (now + i % 60000, 60, SAMPLES,
+          [(now - j * 60000, float(i + j)) for j in range(SAMPLES)]))
+        for i in range(num_metrics))
+
+
+def best_of(function):
+    best = None
+    for _ in range(RUNS):
+        start = time.time()
+        function()
+        elapsed = (time.time() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "state")
+    try:
+        print "%8s %10s %10s %10s" % ("metrics", "size (KB)", "write (ms)",
+                                      "read (ms)")
+        for num_metrics in METRICS:
+            state = make_state(num_metrics)
+            write_ms = best_of(lambda: state_snapshot.write(path, state))
+            read_ms = best_of(lambda: state_snapshot.read(path))
+            assert dict(state_snapshot.read(path).items()) == state
+            print "%8d %10d %10.1f %10.1f" % (
+                num_metrics, os.path.getsize(path) / 1024, write_ms, read_ms)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
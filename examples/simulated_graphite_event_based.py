@@ -30,7 +30,6 @@
 #  THE POSSIBILITY OF SUCH DAMAGE.                                            #
 # ----------------------------------------------------------------------------#
 
-import Queue
 import random
 import time
 import thread
@@ -43,23 +42,16 @@ from liota.lib.utilities.utility import read_user_config
 # getting values from conf file
 config = read_user_config('sampleProp.conf')
 
-comms_channel = Queue.Queue() # channel between device and a udm used for a metric
-
-#simulates a device putting data into a comms channel at random intervals
-def simulated_event_device(write_channel):
+#simulates a device pushing data into a registered metric at random intervals
+def simulated_event_device(reg_metric):
     while(True):
         time.sleep(random.randint(1,10))
-        write_channel.put(random.randint(1,300))
-
-# starting the simulated device
-thread.start_new_thread(simulated_event_device, (comms_channel,))
-
-def udm1():
-    return comms_channel.get(block=True)
+        reg_metric.push(random.randint(1,300))
 
 #---------------------------------------------------------------------------
 # In this example, we demonstrate how an event stream of data can be directed to graphite
-# data center component using Liota by setting sampling_interval_sec parameter to zero.
+# data center component using Liota. The metric has no sampling function, the device
+# pushes its values, so no collector thread is parked waiting for events.
 
 if __name__ == '__main__':
 
@@ -78,8 +70,11 @@ if __name__ == '__main__':
         unit=None,
         interval=0,
         aggregation_size=6,
-        sampling_function=udm1
+        sampling_function=None
     )
     reg_content_metric = graphite.register(content_metric)
     graphite.create_relationship(graphite_reg_edge_system, reg_content_metric)
     reg_content_metric.start_collecting()
+
+    # starting the simulated device
+    thread.start_new_thread(simulated_event_device, (reg_content_metric,))
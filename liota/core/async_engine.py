@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import logging
+from threading import Thread
+
+from liota.lib.utilities.clock import monotonic as _time, monotonic_ms
+
+try:
+    import trollius as asyncio
+    from trollius import From
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    asyncio = None
+
+log = logging.getLogger(__name__)
+
+
+def _coroutine(func):
+    if asyncio is None:
+        return func
+    return asyncio.coroutine(func)
+
+
+def _is_coroutine_function(func):
+    return asyncio is not None and asyncio.iscoroutinefunction(func)
+
+
+class AsyncMetricEngine:
+    """
+    Alternative to the threaded metric engine of metric_handler, selected with
+    'engine = asyncio' in CORE_CFG section of liota.conf.
+
+    RegisteredMetrics are scheduled on one asyncio (trollius on Python 2.7)
+    event loop running in a dedicated thread.  Coroutine sampling functions
+    and coroutine DCCComms.send implementations run on the event loop, plain
+    ones are pushed to a thread pool executor, so existing packages run
+    unchanged.  Sends through the same DCCComms are serialized, like they are
+    in a SendLane of one thread.
+
+    A metric whose sampling function runs longer than its timeout is backed
+    off; a plain sampling function keeps its executor thread until it
+    returns, though.
+
+    AsyncMetricEngine is used in place of event_ds, hence it implements
+    put_and_notify, remove and qsize.  Putting SystemExit stops scheduling,
+    the loop stops once collections and sends in flight are done, which
+    join() waits for.
+    """
+
+    def __init__(self, executor_size=10):
+        if asyncio is None:
+            log.error("asyncio engine requires trollius package")
+            raise ImportError("asyncio engine requires trollius package")
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(ThreadPoolExecutor(executor_size))
+        self._handles = {}  # key: id(metric), value: TimerHandle
+        self._send_locks = {}  # key: id(comms), value: asyncio.Lock
+        self._tasks = set()  # Collections and sends in flight
+        self._stopping = False
+        self._thread = Thread(target=self._run, name="AsyncMetricEngine")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        log.info("Started AsyncMetricEngine")
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+        log.info("Thread exits: %s" % self._thread.name)
+
+    def qsize(self):
+        return len(self._handles)
+
+    def put_and_notify(self, item, block=True, timeout=None):
+        if isinstance(item, SystemExit):
+            self._loop.call_soon_threadsafe(self._stop)
+            return
+        self._loop.call_soon_threadsafe(self._schedule, item)
+
+    def join(self, deadline):
+        """
+        Waits until deadline, on the monotonic clock, for the loop to stop
+        once SystemExit was put.  Returns True if it did.
+        """
+        self._thread.join(max(deadline - _time(), 0))
+        return not self._thread.isAlive()
+
+    def remove(self, item):
+        self._loop.call_soon_threadsafe(self._cancel, item)
+
+    def send(self, metric):
+        """
+        Sends a metric on the loop, for values pushed from other threads.
+        """
+        self._loop.call_soon_threadsafe(self._start_send, metric)
+
+    def _stop(self):
+        self._stopping = True
+        for handle in self._handles.values():
+            handle.cancel()
+        self._handles.clear()
+        if not self._tasks:
+            self._loop.stop()
+
+    def _start_task(self, coroutine):
+        task = asyncio.ensure_future(coroutine, loop=self._loop)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        if self._stopping and not self._tasks:
+            self._loop.stop()
+
+    def _schedule(self, metric):
+        self._cancel(metric)
+        if self._stopping:
+            return
+        delay = max(metric.get_next_run_time() - monotonic_ms(), 0) / 1000.0
+        self._handles[id(metric)] = self._loop.call_later(
+            delay, self._start, metric)
+
+    def _cancel(self, metric):
+        handle = self._handles.pop(id(metric), None)
+        if handle is not None:
+            handle.cancel()
+
+    def _start(self, metric):
+        del self._handles[id(metric)]
+        if not metric.flag_alive:
+            log.debug("Discarded dead metric: %s" % str(metric))
+            return
+        metric.record_latency("schedule",
+                              monotonic_ms() - metric.get_next_run_time())
+        self._start_task(self._collect(metric))
+
+    def _start_send(self, metric):
+        self._start_task(self._send(metric))
+
+    @_coroutine
+    def _collect(self, metric):
+        log.debug("Collecting stats for metric: " + str(metric))
+        metric.count_run()
+        try:
+            start = _time()
+            if _is_coroutine_function(metric.ref_entity.sampling_function):
+                sampled = metric.sample()
+            else:
+                sampled = self._loop.run_in_executor(None, metric.sample)
+            timeout = metric.get_timeout()
+            if timeout:
+                sampled = asyncio.wait_for(sampled, timeout, loop=self._loop)
+            collected_data = yield From(sampled)
+            metric.record_latency("sample", (_time() - start) * 1000)
+            metric.record_collected_data(collected_data)
+        except asyncio.TimeoutError:
+            log.warning("Metric %s timed out" % str(metric.ref_entity.name))
+            metric.timed_out()
+        except Exception:
+            log.exception("Error collecting data for metric " + str(metric))
+            metric.collect_failed()
+        if not metric.flag_alive:
+            log.debug("Discarded dead metric: %s" % str(metric))
+            return
+        metric.set_next_run_time()
+        self._schedule(metric)
+        if metric.claim_ready_to_send():
+            yield From(self._send(metric))
+
+    @_coroutine
+    def _send(self, metric):
+        comms = metric.ref_dcc.comms
+        lock = self._send_locks.get(id(comms))
+        if lock is None:
+            lock = asyncio.Lock(loop=self._loop)
+            self._send_locks[id(comms)] = lock
+        start = _time()
+        yield From(lock.acquire())
+        metric.record_latency("send_queue", (_time() - start) * 1000)
+        try:
+            if _is_coroutine_function(comms.send):
+                log.info("Publishing values for the resource {0} ".format(
+                    metric.ref_entity.name))
+                start = _time()
+                message = metric.ref_dcc._format_data(metric)
+                formatted = _time()
+                metric.record_latency("format", (formatted - start) * 1000)
+                yield From(comms.send(message,
+                                      getattr(metric, 'msg_attr', None)))
+                metric.record_latency("send", (_time() - formatted) * 1000)
+            else:
+                yield From(self._loop.run_in_executor(None, metric.send_data))
+        except Exception:
+            log.exception("Error sending data for metric" + str(metric))
+        finally:
+            lock.release()
@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import logging
+from array import array
+from collections import deque
+from threading import Lock, Condition
+from Queue import Queue, Full
+
+from liota.lib.utilities.clock import monotonic as _time
+
+log = logging.getLogger(__name__)
+
+# Overflow policies
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+COALESCE = "coalesce"
+
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK, COALESCE)
+
+# Scheduling of priority classes
+STRICT = "strict"
+WEIGHTED = "weighted"
+
+SCHEDULING_POLICIES = (STRICT, WEIGHTED)
+
+# Typecode of arrays of 64-bit integers, for timestamps in ms and int
+# values.  Python 2 arrays have no 'q', a C long is 64 bits on most
+# platforms; where it is not, such columns are lists.
+_INT_TYPECODE = 'l' if array('l').itemsize >= 8 else None
+
+
+class BoundedQueue(Queue):
+    """
+    Queue with a capacity and an overflow policy:
+
+        *  drop_oldest  - the oldest item is dropped to make room
+        *  drop_newest  - the item being put is dropped
+        *  block        - put() waits until there is room
+        *  coalesce     - an item already queued is not queued again, if the
+                          queue is full anyway the oldest item is dropped
+
+    Dropped items are passed to on_drop, outside of the queue lock.  Items
+    which are instances of control_types (exit signals and the like) are
+    always queued, regardless of capacity.  A capacity of 0 means unbounded.
+    """
+
+    def __init__(self, capacity=0, policy=BLOCK, on_drop=None,
+                 control_types=(SystemExit,)):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError("Unsupported overflow policy: %s" % policy)
+        Queue.__init__(self)
+        self.capacity = capacity
+        self.policy = policy
+        self._on_drop = on_drop
+        self._control_types = control_types
+        self._queued_keys = {}  # key: id(item), value: count in queue
+        self.num_dropped = 0
+
+    def put(self, item, block=True, timeout=None):
+        dropped = None
+        with self.not_full:
+            if self.capacity > 0 and not isinstance(item, self._control_types):
+                if self.policy == COALESCE and id(item) in self._queued_keys:
+                    dropped = item
+                elif self._qsize() >= self.capacity:
+                    if self.policy == BLOCK:
+                        self._wait_not_full(block, timeout)
+                    elif self.policy == DROP_NEWEST:
+                        dropped = item
+                    else:
+                        dropped = self._drop_oldest(item)
+            if dropped is not item:
+                self._put(item)
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+            if dropped is not None:
+                self.num_dropped += 1
+        if dropped is not None and self._on_drop is not None:
+            self._on_drop(dropped)
+        return dropped
+
+    def _wait_not_full(self, block, timeout):
+        if not block:
+            raise Full
+        if timeout is None:
+            while self._qsize() >= self.capacity:
+                self.not_full.wait()
+        elif timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number")
+        else:
+            endtime = _time() + timeout
+            while self._qsize() >= self.capacity:
+                remaining = endtime - _time()
+                if remaining <= 0.0:
+                    raise Full
+                self.not_full.wait(remaining)
+
+    def _drop_oldest(self, item):
+        # Control items are never dropped, the oldest item which is not one
+        # makes room.  If there is none, the item being put is dropped.
+        for index, queued in enumerate(self.queue):
+            if not isinstance(queued, self._control_types):
+                self.queue.rotate(-index)
+                dropped = self._get()
+                self.queue.rotate(index)
+                return dropped
+        return item
+
+    def _put(self, item):
+        Queue._put(self, item)
+        if self.policy == COALESCE:
+            self._queued_keys[id(item)] = \
+                self._queued_keys.get(id(item), 0) + 1
+
+    def _get(self):
+        item = Queue._get(self)
+        if self.policy == COALESCE:
+            count = self._queued_keys.pop(id(item)) - 1
+            if count:
+                self._queued_keys[id(item)] = count
+        return item
+
+
+class SampleBuffer:
+    """
+    Buffer of (ts, v) samples of a RegisteredMetric, kept as two columns
+    rather than as a tuple per sample.  Timestamps, and values as long as
+    they are all ints or all floats, are stored in typed arrays; a column
+    falls back to a list when a value does not fit its array.
+
+    Capacity and overflow policy are those of BoundedQueue, except that
+    coalescing replaces the newest sample buffered with the sample being
+    put.  drain() takes all samples at once by swapping in empty columns of
+    the same types, so that the sender holds the lock once per batch, not
+    once per sample.
+    """
+
+    def __init__(self, capacity=0, policy=BLOCK, on_drop=None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError("Unsupported overflow policy: %s" % policy)
+        self.capacity = capacity
+        self.policy = policy
+        self._on_drop = on_drop
+        self.num_dropped = 0
+        self._lock = Lock()
+        self._not_full = Condition(self._lock)
+        self._timestamps, self._timestamp_types = _new_column(0)
+        # The value column is typed after the first value put
+        self._values = None
+        self._value_types = None
+        # Index of the oldest sample, those before it were dropped
+        self._start = 0
+
+    def put(self, sample, block=True, timeout=None):
+        ts, value = sample
+        dropped = None
+        with self._not_full:
+            if 0 < self.capacity <= self._qsize():
+                if self.policy == BLOCK:
+                    self._wait_not_full(block, timeout)
+                elif self.policy == DROP_NEWEST:
+                    dropped = sample
+                elif self.policy == COALESCE:
+                    dropped = self._replace_newest(ts, value)
+                else:
+                    dropped = self._pop_oldest()
+            if dropped is None or self.policy == DROP_OLDEST:
+                self._append(ts, value)
+            if dropped is not None:
+                self.num_dropped += 1
+        if dropped is not None and self._on_drop is not None:
+            self._on_drop(dropped)
+        return dropped
+
+    def drain(self):
+        """
+        Takes all samples buffered, oldest first, as a list of timestamps
+        and a list of values of the same length.
+        """
+        with self._not_full:
+            timestamps, values, start = \
+                self._timestamps, self._values, self._start
+            # Empty columns of the same types are swapped in
+            self._timestamps = timestamps[:0]
+            if values is not None:
+                self._values = values[:0]
+            self._start = 0
+            self._not_full.notify_all()
+        if values is None:
+            return [], []
+        if start:
+            timestamps, values = timestamps[start:], values[start:]
+        return _as_list(timestamps), _as_list(values)
+
+    def snapshot(self):
+        """
+        Returns a list of the samples buffered, oldest first, leaving them
+        buffered.
+        """
+        with self._lock:
+            if self._values is None:
+                return []
+            return zip(self._timestamps[self._start:],
+                       self._values[self._start:])
+
+    def qsize(self):
+        with self._lock:
+            return self._qsize()
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def _qsize(self):
+        return len(self._timestamps) - self._start
+
+    def _wait_not_full(self, block, timeout):
+        if not block:
+            raise Full
+        if timeout is None:
+            while self._qsize() >= self.capacity:
+                self._not_full.wait()
+        elif timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number")
+        else:
+            endtime = _time() + timeout
+            while self._qsize() >= self.capacity:
+                remaining = endtime - _time()
+                if remaining <= 0.0:
+                    raise Full
+                self._not_full.wait(remaining)
+
+    def _append(self, ts, value):
+        if self._values is None:
+            self._values, self._value_types = _new_column(value)
+        if self._value_types is not None and \
+                type(value) not in self._value_types:
+            self._values, self._value_types = list(self._values), None
+        try:
+            self._values.append(value)
+        except OverflowError:
+            self._values, self._value_types = list(self._values), None
+            self._values.append(value)
+        if self._timestamp_types is not None and \
+                type(ts) not in self._timestamp_types:
+            self._timestamps, self._timestamp_types = \
+                list(self._timestamps), None
+        try:
+            self._timestamps.append(ts)
+        except OverflowError:
+            self._timestamps, self._timestamp_types = \
+                list(self._timestamps), None
+            self._timestamps.append(ts)
+
+    def _replace_newest(self, ts, value):
+        dropped = (self._timestamps[-1], self._values[-1])
+        del self._timestamps[-1]
+        del self._values[-1]
+        self._append(ts, value)
+        return dropped
+
+    def _pop_oldest(self):
+        dropped = (self._timestamps[self._start], self._values[self._start])
+        self._start += 1
+        # Dropped samples are cut off once they outnumber those buffered,
+        # which keeps the columns within twice the capacity.
+        if self._start >= self.capacity:
+            del self._timestamps[:self._start]
+            del self._values[:self._start]
+            self._start = 0
+        return dropped
+
+
+_INT_TYPES = (int, long)
+
+
+def _new_column(value):
+    """
+    Returns an empty column for values of the type of value, and the types
+    of values it takes, None if it takes any.
+    """
+    if type(value) is float:
+        return array('d'), (float,)
+    if type(value) in _INT_TYPES and _INT_TYPECODE is not None:
+        return array(_INT_TYPECODE), _INT_TYPES
+    return [], None
+
+
+def _as_list(column):
+    if isinstance(column, list):
+        return column
+    return column.tolist()
+
+
+class PriorityClassQueue(BoundedQueue):
+    """
+    BoundedQueue with one FIFO per priority class, class 0 being the highest.
+    priority_of maps an item to its class.  Control items go to the lowest
+    class, so that work queued before them is done first.  Scheduling of
+    classes is either:
+
+        *  strict    - the highest class with items is served, unless the
+                       oldest item of a lower class has waited max_wait_ms,
+                       which keeps lower classes from starving
+        *  weighted  - smooth weighted round robin of classes with items,
+                       according to weights
+
+    Capacity is shared by all classes.  When dropping the oldest item, it
+    is taken from the lowest class with items.
+    """
+
+    def __init__(self, priority_of, weights, scheduling=STRICT,
+                 max_wait_ms=1000, capacity=0, policy=BLOCK, on_drop=None,
+                 control_types=(SystemExit,)):
+        if scheduling not in SCHEDULING_POLICIES:
+            raise ValueError("Unsupported scheduling policy: %s" % scheduling)
+        self._priority_of = priority_of
+        self._weights = list(weights)
+        self._scheduling = scheduling
+        self._max_wait = max_wait_ms / 1000.0
+        BoundedQueue.__init__(self, capacity, policy, on_drop, control_types)
+
+    def _init(self, maxsize):
+        # Elements of each FIFO are (enqueue time, item) pairs
+        self.queues = [deque() for _ in self._weights]
+        self._current_weights = [0] * len(self._weights)
+
+    def _qsize(self, len=len):
+        return sum(len(queue) for queue in self.queues)
+
+    def _class_of(self, item):
+        if isinstance(item, self._control_types):
+            return len(self.queues) - 1
+        return self._priority_of(item)
+
+    def _put(self, item):
+        self.queues[self._class_of(item)].append((_time(), item))
+        if self.policy == COALESCE:
+            self._queued_keys[id(item)] = \
+                self._queued_keys.get(id(item), 0) + 1
+
+    def _get(self):
+        if self._scheduling == STRICT:
+            index = self._next_strict()
+        else:
+            index = self._next_weighted()
+        return self._get_from(index)
+
+    def _get_from(self, index):
+        item = self.queues[index].popleft()[1]
+        if self.policy == COALESCE:
+            count = self._queued_keys.pop(id(item)) - 1
+            if count:
+                self._queued_keys[id(item)] = count
+        return item
+
+    def _next_strict(self):
+        highest = None
+        starved_since = _time() - self._max_wait
+        for index, queue in enumerate(self.queues):
+            if not queue:
+                continue
+            if highest is None:
+                highest = index
+            elif queue[0][0] <= starved_since:
+                return index
+        return highest
+
+    def _next_weighted(self):
+        # Smooth weighted round robin: every class with items earns its
+        # weight, the richest class is served and pays the total weight.
+        total = 0
+        richest = None
+        for index, queue in enumerate(self.queues):
+            if not queue:
+                continue
+            self._current_weights[index] += self._weights[index]
+            total += self._weights[index]
+            if richest is None or self._current_weights[index] > \
+                    self._current_weights[richest]:
+                richest = index
+        self._current_weights[richest] -= total
+        return richest
+
+    def _drop_oldest(self, item):
+        for index in range(len(self.queues) - 1, -1, -1):
+            queue = self.queues[index]
+            for position, (_, queued) in enumerate(queue):
+                if not isinstance(queued, self._control_types):
+                    queue.rotate(-position)
+                    dropped = self._get_from(index)
+                    queue.rotate(position)
+                    return dropped
+        return item
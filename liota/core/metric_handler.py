@@ -30,35 +30,84 @@
 #  THE POSSIBILITY OF SUCH DAMAGE.                                            #
 # ----------------------------------------------------------------------------#
 
-from Queue import Queue, PriorityQueue, Full
+from Queue import PriorityQueue, Full
+from collections import deque
+import ConfigParser
 import heapq
 import logging
-from threading import Thread, Condition, Lock
-from time import time as _time
+import multiprocessing
+from numbers import Number
+from threading import Thread, Condition, Event, Lock, RLock
+import time
+import weakref
 
-from liota.lib.utilities.utility import getUTCmillis
+from liota.core.async_engine import AsyncMetricEngine
+from liota.core.bounded_queue import BoundedQueue, PriorityClassQueue, \
+    BLOCK
+from liota.core.placement import Placement, SPREAD
+from liota.core.sharded_queue import ShardedQueue
+from liota.core import state_snapshot
+from liota.core.timing_wheel import TimingWheel
+from liota.lib.utilities.clock import monotonic as _time, monotonic_ms, \
+    wall_ms
 from liota.lib.utilities.utility import read_liota_config
 
 log = logging.getLogger(__name__)
 
+# Seconds between checks of collectors while draining
+DRAIN_POLL_SEC = 0.01
+
 event_ds = None
 collect_queue = None
 send_queue = None
 event_checker_thread = None
-send_thread = None
 collect_thread_pool = None
+slow_collect_thread_pool = None
+watchdog_thread = None
+snapshot_thread = None
+state_snapshot_path = None
+# State read from the state snapshot, of metrics not started yet
+restored_state = state_snapshot.Snapshot()
+restored_state_lock = Lock()
+# State keys shared by live metrics, which are not persisted
+ambiguous_state_keys = set()
+process_pool = None
+process_pool_lock = Lock()
+# Metrics started collecting, for statistics
+registered_metrics = weakref.WeakSet()
+registered_metrics_lock = Lock()
+metric_buffer_config = None
+placement = None
+collect_timeout = None
+
+# Removed metrics EventsPriorityQueue keeps at least before compacting
+COMPACTION_MIN_REMOVED = 64
 
 
 class EventsPriorityQueue(PriorityQueue):
+    """
+    Heap of metrics ordered by next run time.
+
+    Metrics are removed lazily: remove() only marks a metric removed, and it
+    is skipped once it gets to the top of the heap.  The heap is compacted
+    once removed metrics outnumber live ones, so that churn of metrics does
+    not build up dead entries.
+    """
 
     def __init__(self):
         PriorityQueue.__init__(self)
         self.first_element_changed = Condition(self.mutex)
+        self._queued = set()  # ids of items in the heap
+        self._removed = set()  # ids of items in the heap marked removed
+        self._num_compactions = 0
 
     def put_and_notify(self, item, block=True, timeout=None):
         log.debug("Adding Event:" + str(item))
         self.not_full.acquire()
         try:
+            if id(item) in self._removed:
+                # Metric started again before its dead entry was popped
+                self._compact()
             first_element_before_insertion = None
             if self._qsize() > 0:
                 first_element_before_insertion = self.queue[0]
@@ -89,50 +138,225 @@ class EventsPriorityQueue(PriorityQueue):
         finally:
             self.not_full.release()
 
+    def remove(self, item):
+        """
+        Marks a metric removed.  Returns False if it was not in the heap.
+        """
+        with self.mutex:
+            if id(item) not in self._queued or id(item) in self._removed:
+                return False
+            self._removed.add(id(item))
+            if self.queue[0] is item:
+                # EventCheckerThread should not wake up for it
+                self.first_element_changed.notify()
+            if len(self._removed) > max(
+                    COMPACTION_MIN_REMOVED,
+                    len(self._queued) - len(self._removed)):
+                self._compact()
+            return True
+
+    def qsize(self):
+        with self.mutex:
+            return self._qsize() - len(self._removed)
+
+    def get_stats_removed(self):
+        """
+        Returns number of removed metrics still in the heap, and number of
+        compactions of the heap.
+        """
+        with self.mutex:
+            return [len(self._removed), self._num_compactions]
+
+    def _put(self, item):
+        PriorityQueue._put(self, item)
+        self._queued.add(id(item))
+
+    def _get(self):
+        item = PriorityQueue._get(self)
+        self._queued.discard(id(item))
+        self._removed.discard(id(item))
+        return item
+
+    def _pop_removed(self):
+        while self._qsize() > 0 and id(self.queue[0]) in self._removed:
+            self._get()
+
+    def _compact(self):
+        self.queue = [item for item in self.queue
+                      if id(item) not in self._removed]
+        heapq.heapify(self.queue)
+        self._queued.difference_update(self._removed)
+        self._removed.clear()
+        self._num_compactions += 1
+        log.debug("Compacted heap to %d metrics" % self._qsize())
+
     def get_next_element_when_ready(self):
+        with self.first_element_changed:
+            while True:
+                self._pop_removed()
+                if self._qsize() == 0:
+                    self.first_element_changed.wait()
+                    continue
+                first_element = self.queue[0]
+                if isinstance(first_element, SystemExit):
+                    return self._get()
+                if not first_element.flag_alive:
+                    log.debug("Early termination of dead metric")
+                    return self._get()
+                timeout = (
+                    first_element.get_next_run_time() - monotonic_ms()
+                ) / 1000.0
+                if timeout <= 0:
+                    return self._get()
+                log.debug("Waiting on acquired first_element_changed LOCK "
+                         + "for: %.2f" % timeout)
+                self.first_element_changed.wait(timeout)
+
+    def get_ready_elements(self, tolerance_ms=0):
+        """
+        Waits until the first element is ready and returns it, along with all
+        other elements due within tolerance_ms, in one lock round-trip.
+        """
         self.first_element_changed.acquire()
         try:
-            isNotReady = True
-            while isNotReady:
+            while True:
+                self._pop_removed()
                 if self._qsize() > 0:
                     first_element = self.queue[0]
-                    if isinstance(first_element, SystemExit):
-                        first_element = self._get()
-                        break
-                    if not first_element.flag_alive:
-                        log.debug("Early termination of dead metric")
-                        first_element = self._get()
+                    if isinstance(first_element, SystemExit) \
+                            or not first_element.flag_alive:
                         break
                     timeout = (
-                        first_element.get_next_run_time() - getUTCmillis()
+                        first_element.get_next_run_time() - monotonic_ms()
                     ) / 1000.0
-                    log.debug("Waiting on acquired first_element_changed LOCK "
-                             + "for: %.2f" % timeout)
+                    if timeout <= 0:
+                        break
                     self.first_element_changed.wait(timeout)
                 else:
                     self.first_element_changed.wait()
-                    first_element = self.queue[0]
-                if isinstance(first_element, SystemExit):
-                    first_element = self._get()
+            horizon = monotonic_ms() + tolerance_ms
+            elements = []
+            while self._qsize() > 0:
+                first_element = self.queue[0]
+                if id(first_element) in self._removed:
+                    self._get()
+                    continue
+                if not isinstance(first_element, SystemExit) \
+                        and first_element.flag_alive \
+                        and first_element.get_next_run_time() > horizon:
                     break
-                if (first_element.get_next_run_time() - getUTCmillis()) <= 0 \
-                        or not first_element.flag_alive:
-                    isNotReady = False
-                    first_element = self._get()
-            return first_element
+                elements.append(self._get())
+            return elements
         finally:
             self.first_element_changed.release()
 
 
+class TimingWheelEventQueue:
+    """
+    Drop-in replacement of EventsPriorityQueue backed by a hierarchical timing
+    wheel, so that scheduling, rescheduling and cancellation of metrics are
+    O(1) regardless of the number of metrics registered.
+
+    EventCheckerThread is only woken up if an inserted metric is due before
+    the time it is currently sleeping until.
+    """
+
+    def __init__(self, tick_ms):
+        self.mutex = Lock()
+        self.first_element_changed = Condition(self.mutex)
+        self._wheel = TimingWheel(tick_ms=tick_ms, now_ms=monotonic_ms())
+        self._ready = deque()
+        # Time EventCheckerThread is waiting until, None if it is not waiting
+        self._wake_time = None
+
+    def qsize(self):
+        with self.mutex:
+            return len(self._ready) + len(self._wheel)
+
+    def put_and_notify(self, item, block=True, timeout=None):
+        log.debug("Adding Event:" + str(item))
+        with self.first_element_changed:
+            if isinstance(item, SystemExit):
+                self._ready.appendleft(item)
+                self.first_element_changed.notify()
+                return
+            next_run_time = item.get_next_run_time()
+            self._wheel.add(item, next_run_time)
+            if self._wake_time is not None and next_run_time < self._wake_time:
+                self.first_element_changed.notify()
+
+    def remove(self, item):
+        with self.mutex:
+            return self._wheel.remove(item)
+
+    def get_next_element_when_ready(self):
+        with self.first_element_changed:
+            while not self._ready:
+                now = monotonic_ms()
+                self._ready.extend(self._wheel.advance(now))
+                if self._ready:
+                    break
+                next_expiry = self._wheel.next_expiry()
+                if next_expiry is None:
+                    self._wake_time = float("inf")
+                    self.first_element_changed.wait()
+                else:
+                    self._wake_time = next_expiry
+                    timeout = max(next_expiry - now, 0) / 1000.0
+                    log.debug("Waiting on acquired first_element_changed LOCK "
+                              + "for: %.2f" % timeout)
+                    self.first_element_changed.wait(timeout)
+                self._wake_time = None
+            return self._ready.popleft()
+
+    def get_ready_elements(self, tolerance_ms=0):
+        """
+        Waits until the first element is ready and returns it, along with all
+        other elements due within tolerance_ms, in one lock round-trip.
+        """
+        with self.first_element_changed:
+            while not self._ready:
+                now = monotonic_ms()
+                self._ready.extend(self._wheel.advance(now))
+                if self._ready:
+                    self._ready.extend(
+                        self._wheel.advance(now + tolerance_ms))
+                    break
+                next_expiry = self._wheel.next_expiry()
+                if next_expiry is None:
+                    self._wake_time = float("inf")
+                    self.first_element_changed.wait()
+                else:
+                    self._wake_time = next_expiry
+                    self.first_element_changed.wait(
+                        max(next_expiry - now, 0) / 1000.0)
+                self._wake_time = None
+            elements = list(self._ready)
+            self._ready.clear()
+            return elements
+
+
 class EventCheckerThread(Thread):
 
-    def __init__(self, name=None):
+    def __init__(self, name=None, batch_tolerance_ms=None, chunk_size=1):
+        """
+        :param batch_tolerance_ms: If not None, all metrics due within this
+            many milliseconds are dispatched per wakeup.
+        :param chunk_size: Number of metrics per item put in collect_queue in
+            batch mode, i.e., number of metrics a collector takes at once.
+        """
         Thread.__init__(self, name=name)
         self.flag_alive = True
+        self._batch_tolerance_ms = batch_tolerance_ms
+        self._chunk_size = max(int(chunk_size), 1)
         self.start()
 
     def run(self):
         log.info("Started EventCheckerThread")
+        if self._batch_tolerance_ms is not None:
+            self._run_batch()
+            log.info("Thread exits: %s" % str(self.name))
+            return
         global event_ds
         global collect_queue
         while self.flag_alive:
@@ -145,23 +369,49 @@ class EventCheckerThread(Thread):
             if not metric.flag_alive:
                 log.debug("Discarded dead metric: %s" % str(metric))
                 continue
+            _dispatched(metric)
             collect_queue.put(metric)
+            _adjust_collect_pools()
         log.info("Thread exits: %s" % str(self.name))
 
+    def _run_batch(self):
+        global event_ds
+        global collect_queue
+        while self.flag_alive:
+            log.debug("Waiting for events...")
+            metrics = event_ds.get_ready_elements(self._batch_tolerance_ms)
+            alive_metrics = []
+            for metric in metrics:
+                if isinstance(metric, SystemExit):
+                    log.debug("Got exit signal")
+                    return
+                if not metric.flag_alive:
+                    log.debug("Discarded dead metric: %s" % str(metric))
+                    continue
+                _dispatched(metric)
+                alive_metrics.append(metric)
+            log.debug("Got %d events" % len(alive_metrics))
+            for i in range(0, len(alive_metrics), self._chunk_size):
+                collect_queue.put(alive_metrics[i:i + self._chunk_size])
+            _adjust_collect_pools()
+
 
 class SendThread(Thread):
 
-    def __init__(self, name=None):
+    def __init__(self, lane, name=None):
         Thread.__init__(self, name=name)
         self.flag_alive = True
+        self._lane = lane
         self.start()
 
     def run(self):
         log.info("Started SendThread")
-        global send_queue
         while self.flag_alive:
+            # The last metric sent must not keep its DCCComms alive while
+            # waiting, see SendLanes
+            metric = None
             log.debug("Waiting to send...")
-            metric = send_queue.get()
+            metric = self._lane.queue.get()
             if isinstance(metric, SystemExit):
                 log.debug("Got exit signal")
                 break
@@ -169,65 +419,410 @@ class SendThread(Thread):
             if not metric.flag_alive:
                 log.debug("Discarded dead metric: %s" % str(metric))
                 continue
-            metric.send_data()
+            metric.record_latency(
+                "send_queue", (_time() - metric.send_enqueued_at) * 1000)
+            try:
+                metric.send_data()
+            except Exception:
+                log.exception("Error sending data for metric" + str(metric))
+            self._lane.sent(metric)
         log.info("Thread exits: %s" % str(self.name))
 
 
+class SendLane:
+    """
+    Queue of metrics ready to be sent through one DCCComms, and the
+    SendThreads publishing them.
+    """
+
+    def __init__(self, name, concurrency=1, capacity=0, policy=BLOCK):
+        self.name = name
+        self.queue = _create_bounded_queue(capacity, policy,
+                                           on_drop=_send_dropped)
+        self._stats_lock = Lock()
+        self._num_sent = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+        self._threads = []
+        for j in range(concurrency):
+            self._threads.append(
+                SendThread(self, name="%s-%d" % (name, j + 1)))
+
+    def put(self, metric):
+        metric.send_enqueued_at = _time()
+        self.queue.put(metric)
+
+    def sent(self, metric):
+        latency = _time() - metric.send_enqueued_at
+        with self._stats_lock:
+            self._num_sent += 1
+            self._total_latency += latency
+            self._max_latency = max(self._max_latency, latency)
+
+    def stop(self):
+        for _ in self._threads:
+            self.queue.put(SystemExit())
+
+    def join(self, deadline):
+        """
+        Waits until deadline, on the monotonic clock, for the threads of the
+        lane to exit.  Returns True if they all did.
+        """
+        for thread in self._threads:
+            thread.join(max(deadline - _time(), 0))
+        return not any(thread.isAlive() for thread in self._threads)
+
+    def get_stats(self):
+        """
+        Returns name, depth, number of threads, number of metrics sent, mean
+        and max latency in milliseconds from enqueue to end of send, and
+        number of metrics dropped because the lane was full.
+        """
+        with self._stats_lock:
+            mean_latency = self._total_latency / self._num_sent \
+                if self._num_sent else 0.0
+            return [self.name,
+                    self.queue.qsize(),
+                    len(self._threads),
+                    self._num_sent,
+                    mean_latency * 1000,
+                    self._max_latency * 1000,
+                    self.queue.num_dropped]
+
+
+class SendLanes:
+    """
+    Used as send_queue.  Routes metrics ready to be sent to one SendLane per
+    DCCComms, so that a slow or blocked connection only holds up metrics
+    published through it.
+
+    Each lane runs 'send_lane_concurrency' SendThreads, unless its DCCComms
+    object has a send_lane_concurrency attribute.  Lanes are keyed by weak
+    references to their DCCComms, and retired once it is garbage collected,
+    e.g., after its package is unloaded.  Once stopped, no lane is created
+    and metrics put are counted as dropped.
+    """
+
+    def __init__(self, concurrency=1, capacity=0, policy=BLOCK):
+        self._concurrency = concurrency
+        self._capacity = capacity
+        self._policy = policy
+        self._lanes = {}  # key: weakref to DCCComms, value: SendLane
+        self._num_created = 0
+        # Reentrant, as garbage collection may retire a lane from any thread,
+        # one holding the lock included
+        self._lock = RLock()
+        self._stopped = False
+
+    def get_lane(self, comms):
+        """
+        Returns the lane of comms, created if needed, or None once stopped.
+        """
+        with self._lock:
+            if self._stopped:
+                return None
+            lane = self._lanes.get(weakref.ref(comms))
+            if lane is None:
+                self._num_created += 1
+                lane = SendLane(
+                    "Sender-%s-%d" % (type(comms).__name__,
+                                      self._num_created),
+                    getattr(comms, 'send_lane_concurrency', self._concurrency),
+                    self._capacity,
+                    self._policy
+                )
+                self._lanes[weakref.ref(comms, self._retire)] = lane
+            return lane
+
+    def _retire(self, comms_ref):
+        # Metrics queued keep their DCCComms alive, so the lane is idle and
+        # its SendThreads exit right away
+        with self._lock:
+            lane = self._lanes.pop(comms_ref, None)
+        if lane is not None:
+            log.info("Retiring send lane %s" % lane.name)
+            lane.stop()
+
+    def put(self, item):
+        if isinstance(item, SystemExit):
+            with self._lock:
+                self._stopped = True
+                for lane in self._lanes.values():
+                    lane.stop()
+            return
+        lane = self.get_lane(item.ref_dcc.comms)
+        if lane is None:
+            _send_dropped(item)
+            return
+        lane.put(item)
+
+    def qsize(self):
+        with self._lock:
+            lanes = self._lanes.values()
+        return sum(lane.queue.qsize() for lane in lanes)
+
+    def join(self, deadline):
+        """
+        Waits until deadline for the threads of all lanes to exit, once
+        stopped.  Returns ids of DCCComms objects whose lanes are still
+        sending.
+        """
+        with self._lock:
+            lanes = self._lanes.items()
+        busy_comms = set()
+        for comms_ref, lane in lanes:
+            comms = comms_ref()
+            if not lane.join(deadline) and comms is not None:
+                busy_comms.add(id(comms))
+        return busy_comms
+
+    def get_stats(self):
+        with self._lock:
+            lanes = self._lanes.values()
+        return [lane.get_stats() for lane in lanes]
+
+
+class RetireWorker:
+    """
+    Put in collect_queue by CollectionThreadPool to make one idle
+    CollectionThread exit.
+    """
+    pass
+
+
 class CollectionThread(Thread):
 
-    def __init__(self, worker_stat_lock, name=None):
+    def __init__(self, worker_stat_lock, name=None, pool=None, shard=0):
         Thread.__init__(self, name=name)
         self.daemon = True
+        # Home shard of this thread if collect_queue is a ShardedQueue
+        self.shard = shard
         self.working_obj = None
+        # Time this thread started collecting working_obj
+        self.working_since = None
+        # Set by the watchdog when working_obj timed out, this thread has
+        # been replaced in the pool and exits once it gets unstuck
+        self.abandoned = False
+        # Time this thread started waiting for work, None while working
+        self.idle_since = None
         self._worker_stat_lock = worker_stat_lock
+        self._pool = pool
         self.start()
 
     def run(self):
-        global event_ds
         global collect_queue
-        global send_queue
         while True:
-            metric = collect_queue.get()
-            log.debug("Collecting stats for metric: " + str(metric))
-            try:
-                if not metric.flag_alive:
-                    log.debug("Discarded dead metric: %s" % str(metric))
-                    continue
-                with self._worker_stat_lock:
-                    self.working_obj = metric
-                metric.collect()
-                with self._worker_stat_lock:
-                    self.working_obj = None
-                if not metric.flag_alive:
-                    log.debug("Discarded dead metric: %s" % str(metric))
-                    continue
-                metric.set_next_run_time()
-                event_ds.put_and_notify(metric)
-                if metric.is_ready_to_send():
-                    send_queue.put(metric)
-                    metric.reset_aggregation_size()
-            except Exception as e:
-                log.error("Error collecting data for metric" + str(metric))
-                raise e
+            self.idle_since = _time()
+            queue = collect_queue if self._pool is None \
+                else self._pool.get_queue()
+            if isinstance(queue, ShardedQueue):
+                item = queue.get(self.shard)
+            else:
+                item = queue.get()
+            self.idle_since = None
+            if isinstance(item, RetireWorker):
+                if self._pool is not None:
+                    self._pool.retired(self)
+                log.info("Thread exits: %s" % str(self.name))
+                return
+            # In batch dispatch mode, items are chunks of metrics
+            for metric in item if isinstance(item, list) else [item]:
+                try:
+                    self._collect(metric)
+                except Exception:
+                    log.exception("Error rescheduling metric " + str(metric))
+            if self.abandoned:
+                if self._pool is not None:
+                    self._pool.unstuck(self)
+                log.info("Thread exits: %s" % str(self.name))
+                return
+
+    def _collect(self, metric):
+        global event_ds
+        global send_queue
+        log.debug("Collecting stats for metric: " + str(metric))
+        if not metric.flag_alive:
+            log.debug("Discarded dead metric: %s" % str(metric))
+            return
+        if metric.collect_enqueued_at is not None:
+            metric.record_latency(
+                "collect_queue",
+                (_time() - metric.collect_enqueued_at) * 1000)
+        with self._worker_stat_lock:
+            self.working_obj = metric
+            self.working_since = _time()
+        try:
+            metric.collect()
+        except Exception:
+            # The metric is backed off, the thread goes on
+            log.exception("Error collecting data for metric " + str(metric))
+            metric.collect_failed()
+        finally:
+            with self._worker_stat_lock:
+                self.working_obj = None
+        if not metric.flag_alive:
+            log.debug("Discarded dead metric: %s" % str(metric))
+            return
+        metric.set_next_run_time()
+        event_ds.put_and_notify(metric)
+        send_if_ready(metric)
 
 
 class CollectionThreadPool:
+    """
+    Pool of CollectionThreads.
 
-    def __init__(self, num_threads):
-        self._num_threads = num_threads
+    Threads stuck on a metric for longer than its timeout are abandoned by
+    check_timeouts() and replaced, so that hanging sampling functions do not
+    use up the pool.  Threads died are replaced by restart_dead().  Both are
+    called by WatchdogThread.
+
+    The pool is elastic if min_threads and max_threads differ: adjust() grows
+    it toward max_threads while its queue backs up or all threads are busy,
+    and retires threads idle for longer than idle_timeout seconds, down to
+    min_threads.
+
+    Threads take metrics from collect_queue, or from the queue of their
+    collect lane if the pool is created with one.
+    """
+
+    # Minimum number of seconds between two adjustments of pool size
+    adjust_interval = 0.1
+
+    def __init__(self, num_threads, min_threads=None, max_threads=None,
+                 idle_timeout=60, queue=None, name="Collector"):
+        self._min_threads = num_threads if min_threads is None \
+            else min(min_threads, num_threads)
+        self._num_threads = num_threads if max_threads is None \
+            else max(max_threads, num_threads)
+        self._idle_timeout = idle_timeout
+        self._queue = queue
+        self._name = name
         self._pool = []
+        # Threads abandoned by check_timeouts() and not yet unstuck
+        self._stuck = []
+        self._num_timeouts = 0
+        self._num_restarted = 0
         self._worker_stat_lock = Lock()
+        self._threads_started = 0
+        self._retiring = 0
+        self._num_grown = 0
+        self._num_shrunk = 0
+        self._last_adjust_time = 0
 
         log.info("Starting " + str(num_threads) + " for collection")
-        for j in range(num_threads):
+        with self._worker_stat_lock:
+            self._start_threads(num_threads)
+
+    def _start_threads(self, num_threads):
+        for _ in range(num_threads):
+            self._threads_started += 1
             self._pool.append(CollectionThread(
                 self._worker_stat_lock,
-                name="Collector-%d" % (j + 1)
+                name="%s-%d" % (self._name, self._threads_started),
+                pool=self,
+                shard=self._threads_started - 1
             ))
 
     def get_num_threads(self):
         return self._num_threads
 
+    def get_queue(self):
+        return collect_queue if self._queue is None else self._queue
+
+    def adjust(self):
+        """
+        Grows or shrinks the pool according to the backlog of collect_queue
+        and the number of idle threads.  Called by EventCheckerThread after
+        dispatching metrics, at most once every adjust_interval seconds.
+        """
+        if self._min_threads == self._num_threads:
+            return
+        now = _time()
+        if now - self._last_adjust_time < self.adjust_interval:
+            return
+        self._last_adjust_time = now
+        queue = self.get_queue()
+        backlog = queue.qsize() if queue is not None else 0
+        with self._worker_stat_lock:
+            size = len(self._pool) - self._retiring
+            idle = [tref for tref in self._pool if tref.idle_since is not None]
+            num_grow = min(self._num_threads - size,
+                           max(backlog - len(idle), 0))
+            if num_grow == 0 and len(idle) == 0 and size < self._num_threads:
+                num_grow = 1
+            if num_grow > 0:
+                log.info("Growing collection thread pool by %d" % num_grow)
+                self._num_grown += num_grow
+                self._start_threads(num_grow)
+                return
+            num_shrink = min(
+                size - self._min_threads,
+                len([tref for tref in idle
+                     if now - tref.idle_since >= self._idle_timeout])
+            )
+            if num_shrink <= 0:
+                return
+            self._retiring += num_shrink
+        log.info("Shrinking collection thread pool by %d" % num_shrink)
+        for _ in range(num_shrink):
+            queue.put(RetireWorker())
+
+    def retired(self, tref):
+        with self._worker_stat_lock:
+            self._pool.remove(tref)
+            self._retiring -= 1
+            self._num_shrunk += 1
+
+    def check_timeouts(self):
+        """
+        Abandons threads collecting a metric for longer than its timeout, and
+        starts as many threads to replace them.  Called by WatchdogThread.
+        """
+        now = _time()
+        with self._worker_stat_lock:
+            stuck = []
+            for tref in self._pool:
+                metric = tref.working_obj
+                if metric is None:
+                    continue
+                timeout = metric.get_timeout()
+                if timeout and now - tref.working_since > timeout:
+                    stuck.append(tref)
+            if not stuck:
+                return
+            for tref in stuck:
+                log.warning("Metric %s timed out in %s, replacing thread" %
+                            (str(tref.working_obj.ref_entity.name),
+                             tref.name))
+                tref.abandoned = True
+                tref.working_obj.timed_out()
+                self._pool.remove(tref)
+                self._stuck.append(tref)
+            self._num_timeouts += len(stuck)
+            self._start_threads(len(stuck))
+
+    def restart_dead(self):
+        """
+        Replaces threads of the pool that died, so that the pool keeps its
+        size.  Threads retiring or abandoned leave the pool before exiting.
+        """
+        with self._worker_stat_lock:
+            self._stuck = [tref for tref in self._stuck if tref.isAlive()]
+            dead = [tref for tref in self._pool if not tref.isAlive()]
+            if not dead:
+                return
+            for tref in dead:
+                log.error("Collection thread %s died, restarting it" %
+                          tref.name)
+                self._pool.remove(tref)
+            self._num_restarted += len(dead)
+            self._start_threads(len(dead))
+
+    def unstuck(self, tref):
+        with self._worker_stat_lock:
+            self._stuck.remove(tref)
+
     def get_stats_working(self):
         num_working = 0
         num_alive = 0
@@ -246,7 +841,436 @@ class CollectionThreadPool:
                 num_all,
                 self._num_threads]
 
+    def get_stats_elastic(self):
+        with self._worker_stat_lock:
+            return [len(self._pool),
+                    self._min_threads,
+                    self._num_threads,
+                    self._num_grown,
+                    self._num_shrunk]
+
+    def get_stats_timeouts(self):
+        """
+        Returns number of threads abandoned and still stuck, and number of
+        timeouts since start.
+        """
+        with self._worker_stat_lock:
+            return [len(self._stuck),
+                    self._num_timeouts]
+
+    def get_stats_restarted(self):
+        with self._worker_stat_lock:
+            return self._num_restarted
+
+
+class WatchdogThread(Thread):
+    """
+    Supervises collector threads every interval seconds: replaces threads
+    stuck on metrics timing out, and threads died.
+    """
+
+    def __init__(self, pools, interval, name=None):
+        Thread.__init__(self, name=name)
+        self.daemon = True
+        self.flag_alive = True
+        self._pools = pools
+        self._interval = interval
+        self._wakeup = Event()
+        self.start()
+
+    def run(self):
+        log.info("Started WatchdogThread")
+        while self.flag_alive:
+            self._wakeup.wait(self._interval)
+            if not self.flag_alive:
+                break
+            for pool in self._pools:
+                try:
+                    pool.check_timeouts()
+                    pool.restart_dead()
+                except Exception:
+                    log.exception("Error checking collector threads")
+        log.info("Thread exits: %s" % str(self.name))
+
+    def stop(self):
+        self.flag_alive = False
+        self._wakeup.set()
+
+class SnapshotThread(Thread):
+    """
+    Writes the state snapshot every interval seconds.
+    """
+
+    def __init__(self, interval, name=None):
+        Thread.__init__(self, name=name)
+        self.daemon = True
+        self.flag_alive = True
+        self._interval = interval
+        self._wakeup = Event()
+        self.start()
+
+    def run(self):
+        log.info("Started SnapshotThread")
+        while self.flag_alive:
+            self._wakeup.wait(self._interval)
+            if not self.flag_alive:
+                break
+            try:
+                write_state_snapshot()
+            except Exception:
+                log.exception("Error writing state snapshot")
+        log.info("Thread exits: %s" % str(self.name))
+
+    def stop(self):
+        self.flag_alive = False
+        self._wakeup.set()
+
+
+class CollectLanes:
+    """
+    Used as collect_queue with 'collect_lanes = True'.  Routes metrics due
+    for collection to a fast and a slow lane, each with a queue and a
+    CollectionThreadPool of its own, so that cheap sampling functions do not
+    wait behind slow ones.
+
+    A metric goes to the slow lane once the moving average of its sampling
+    duration reaches slow_threshold_ms, and back to the fast lane once it
+    drops below half of it, unless the Metric is pinned to a lane.
+    """
+
+    def __init__(self, slow_threshold_ms):
+        self.slow_threshold_ms = slow_threshold_ms
+        self._queues = {}  # key: lane, value: queue
+        self._num_routed = {}
+
+    def add_lane(self, lane, queue):
+        self._queues[lane] = queue
+        self._num_routed[lane] = 0
+        self._lanes = sorted(self._queues)
+
+    def get_queue(self, lane):
+        return self._queues[lane]
+
+    def put(self, item):
+        # In batch dispatch mode, items are chunks of metrics
+        if isinstance(item, list):
+            chunks = {}
+            for metric in item:
+                chunks.setdefault(
+                    metric.get_lane(self.slow_threshold_ms), []
+                ).append(metric)
+            for lane, chunk in chunks.items():
+                self._num_routed[lane] += len(chunk)
+                self._queues[lane].put(chunk)
+            return
+        lane = item.get_lane(self.slow_threshold_ms)
+        self._num_routed[lane] += 1
+        self._queues[lane].put(item)
+
+    def qsize(self):
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    @property
+    def num_dropped(self):
+        return sum(queue.num_dropped for queue in self._queues.values())
+
+    def get_stats(self):
+        """
+        Returns lane, depth and number of metrics routed to it since start,
+        per lane.
+        """
+        return [[lane,
+                 self._queues[lane].qsize(),
+                 self._num_routed[lane]]
+                for lane in self._lanes]
+
+
+def get_collect_pools():
+    return [pool for pool in (collect_thread_pool, slow_collect_thread_pool)
+            if pool is not None]
+
+
+def _adjust_collect_pools():
+    for pool in get_collect_pools():
+        pool.adjust()
+
+
+def send_if_ready(metric):
+    """
+    Queues a metric for sending if enough values are buffered, from a
+    collector or from a thread pushing values.
+    """
+    if not metric.claim_ready_to_send():
+        return
+    if send_queue is not None:
+        send_queue.put(metric)
+    elif isinstance(event_ds, AsyncMetricEngine):
+        event_ds.send(metric)
+
+
+def _dispatched(metric):
+    metric.record_latency("schedule",
+                          monotonic_ms() - metric.get_next_run_time())
+    metric.collect_enqueued_at = _time()
+
+
+def _collect_dropped(item):
+    # A metric dropped from collect_queue skips this run, but has to be
+    # scheduled again.
+    metrics = item if isinstance(item, list) else [item]
+    for metric in metrics:
+        metric.count_drop("collect")
+        if metric.flag_alive:
+            metric.set_next_run_time()
+            event_ds.put_and_notify(metric)
+
+
+def _send_dropped(metric):
+    # Samples stay in the buffer of the metric and go with its next send
+    metric.count_drop("send")
+
+
+def register_metric(metric):
+    with registered_metrics_lock:
+        registered_metrics.add(metric)
+
+
+def get_registered_metrics():
+    with registered_metrics_lock:
+        return list(registered_metrics)
+
+
+def _state_key(metric):
+    return (metric.ref_entity.entity_id, type(metric.ref_dcc).__name__)
+
+
+def restore_state(metric):
+    """
+    Restores the state of a metric from the state snapshot read at
+    initialization, once.  Returns the next run time of the metric on the
+    monotonic clock, or None if it has none.
+    """
+    with restored_state_lock:
+        state = restored_state.pop(_state_key(metric))
+    if state is None:
+        return None
+    try:
+        next_run_time = metric.set_state(state)
+    except Exception:
+        log.exception("Error restoring state of metric " + str(metric))
+        return None
+    send_if_ready(metric)
+    return next_run_time
+
+
+def write_state_snapshot():
+    """
+    Writes the state of live metrics, and of metrics restored from the
+    previous snapshot but not started yet, to the state snapshot.  Metrics
+    of the same name on DCCs of the same class share a state key, their
+    state is not written, lest one restore the state of another.
+    """
+    path = state_snapshot_path
+    if not path:
+        return
+    with restored_state_lock:
+        state = dict(restored_state.items())
+    live_state = {}
+    shared_keys = {}  # key: state key, value: metric name
+    for metric in get_registered_metrics():
+        if not metric.flag_alive:
+            continue
+        key = _state_key(metric)
+        if key in live_state:
+            shared_keys[key] = metric.ref_entity.name
+        live_state[key] = metric.get_state()
+    for key, name in shared_keys.items():
+        del live_state[key]
+        state.pop(key, None)
+        if key not in ambiguous_state_keys:
+            ambiguous_state_keys.add(key)
+            log.warning("State of metrics named %s on %s DCCs is not "
+                        "persisted, they share a state key" % (name, key[1]))
+    state.update(live_state)
+    state_snapshot.write(path, state)
+
+
+def get_metric_buffer_config():
+    """
+    Returns capacity and overflow policy of sample buffers of metrics.
+    """
+    global metric_buffer_config
+    if metric_buffer_config is None:
+        metric_buffer_config = (
+            int(_read_core_config('metric_buffer_size', 0)),
+            _read_core_config('metric_buffer_policy', BLOCK)
+        )
+    return metric_buffer_config
+
+
+def get_placement():
+    """
+    Returns the Placement deciding first run times of metrics.
+    """
+    global placement
+    if placement is None:
+        placement = Placement(
+            _read_core_config('placement', SPREAD),
+            int(_read_core_config('placement_jitter_ms', 1000))
+        )
+    return placement
+
+
+def get_collect_timeout():
+    """
+    Returns seconds the sampling function of a metric without a timeout of
+    its own may run, 0 for no timeout.
+    """
+    global collect_timeout
+    if collect_timeout is None:
+        collect_timeout = float(_read_core_config('collect_timeout', 0))
+    return collect_timeout
+
+
+def sample_in_worker(sampling_function, args_required, ts=None):
+    """
+    Runs in a worker process of the collection process pool.  Samples are
+    time-stamped here, with ts if given, and sent back as plain (ts, v)
+    tuples, pint quantities are reduced to their magnitude, so that results
+    are cheap to pickle.
+    """
+    if args_required:
+        collected_data = sampling_function(1)
+    else:
+        collected_data = sampling_function()
+    if collected_data is None:
+        return None
+    if isinstance(collected_data, list):
+        return [(ts, _magnitude(v)) for ts, v in collected_data]
+    if isinstance(collected_data, tuple):
+        return collected_data[0], _magnitude(collected_data[1])
+    return wall_ms() if ts is None else ts, _magnitude(collected_data)
+
+
+def _magnitude(value):
+    if isinstance(value, Number):
+        return value
+    return getattr(value, 'magnitude', value)
+
+
+def get_process_pool():
+    """
+    Returns the process pool used by metrics sampling in process, starting it
+    on first use with 'collect_process_pool_size' worker processes.
+    """
+    global process_pool
+    with process_pool_lock:
+        if process_pool is None:
+            size = int(_read_core_config('collect_process_pool_size',
+                                         multiprocessing.cpu_count()))
+            log.info("Starting " + str(size) + " processes for collection")
+            process_pool = multiprocessing.Pool(size)
+        return process_pool
+
+
 is_initialization_done = False
+is_drained = False
+
+
+def _read_core_config(name, default):
+    """
+    Returns the value of name in CORE_CFG section of liota.conf, or default
+    if it is not configured.
+    """
+    try:
+        return read_liota_config('CORE_CFG', name)
+    except (ConfigParser.Error, NameError):
+        return default
+
+
+def _create_event_ds():
+    scheduler = _read_core_config('scheduler', 'heap')
+    if scheduler == 'timing_wheel':
+        tick_ms = int(_read_core_config('timing_wheel_tick_ms', 10))
+        log.info("Using timing wheel scheduler with %d ms ticks" % tick_ms)
+        return TimingWheelEventQueue(tick_ms)
+    if scheduler != 'heap':
+        log.error("Unsupported scheduler: %s, falling back to heap"
+                  % scheduler)
+    return EventsPriorityQueue()
+
+
+def _priority_of(item):
+    if isinstance(item, list):
+        return min(metric.priority_class for metric in item)
+    return item.priority_class
+
+
+def _create_bounded_queue(capacity, policy, on_drop,
+                          control_types=(SystemExit,)):
+    """
+    Returns a BoundedQueue, or a PriorityClassQueue if priority_scheduling
+    is 'strict' or 'weighted'.
+    """
+    scheduling = _read_core_config('priority_scheduling', 'fifo')
+    if scheduling == 'fifo':
+        return BoundedQueue(capacity, policy, on_drop=on_drop,
+                            control_types=control_types)
+    weights = map(int, _read_core_config('priority_weights', '8,4,1')
+                  .split(','))
+    if len(weights) != 3:
+        raise ValueError("priority_weights needs one weight per priority "
+                         "class: high, normal and low")
+    return PriorityClassQueue(
+        _priority_of,
+        weights,
+        scheduling=scheduling,
+        max_wait_ms=int(_read_core_config('priority_max_wait_ms', 1000)),
+        capacity=capacity,
+        policy=policy,
+        on_drop=on_drop,
+        control_types=control_types
+    )
+
+
+def _create_collect_queue(collect_thread_pool_size):
+    """
+    Returns a ShardedQueue if collect_dispatch is 'sharded', a queue created
+    by _create_bounded_queue otherwise.
+    """
+    dispatch = _read_core_config('collect_dispatch', 'shared')
+    if dispatch == 'sharded':
+        num_shards = int(_read_core_config('collect_shards',
+                                           collect_thread_pool_size))
+        log.info("Using %d collect queue shards" % num_shards)
+        return ShardedQueue(num_shards)
+    if dispatch != 'shared':
+        log.error("Unsupported collect dispatch: %s, falling back to shared"
+                  % dispatch)
+    return _create_bounded_queue(
+        int(_read_core_config('collect_queue_size', 0)),
+        _read_core_config('collect_queue_policy', BLOCK),
+        on_drop=_collect_dropped,
+        control_types=(SystemExit, RetireWorker)
+    )
+
+
+def _initialize_state_snapshot():
+    global state_snapshot_path
+    global restored_state
+    global snapshot_thread
+    state_snapshot_path = _read_core_config('state_snapshot_path', '')
+    if not state_snapshot_path:
+        return
+    start = _time()
+    with restored_state_lock:
+        restored_state = state_snapshot.read(state_snapshot_path)
+    log.info("Read state of %d metrics from %s in %.1f ms" %
+             (len(restored_state), state_snapshot_path,
+              (_time() - start) * 1000))
+    interval = float(_read_core_config('state_snapshot_interval', 60))
+    if snapshot_thread is None and interval > 0:
+        snapshot_thread = SnapshotThread(interval, name="SnapshotThread")
 
 
 def initialize():
@@ -256,38 +1280,209 @@ def initialize():
         pass
     else:
         log.debug("Initializing.............")
+        _initialize_state_snapshot()
         global event_ds
+        if _read_core_config('engine', 'threads') == 'asyncio':
+            # Metrics are collected and sent on an event loop, threads of
+            # the threaded engine are not started.
+            if event_ds is None:
+                event_ds = AsyncMetricEngine(
+                    int(_read_core_config('async_executor_size', 10)))
+            is_initialization_done = True
+            return
         if event_ds is None:
-            event_ds = EventsPriorityQueue()
+            event_ds = _create_event_ds()
         global event_checker_thread
         if event_checker_thread is None:
+            batch_tolerance_ms = None
+            if _read_core_config('batch_dispatch', 'False') == 'True':
+                batch_tolerance_ms = int(
+                    _read_core_config('batch_tolerance_ms', 0))
             event_checker_thread = EventCheckerThread(
-                name="EventCheckerThread")
+                name="EventCheckerThread",
+                batch_tolerance_ms=batch_tolerance_ms,
+                chunk_size=int(_read_core_config('collect_chunk_size', 1))
+            )
+        collect_thread_pool_size = int(read_liota_config('CORE_CFG','collect_thread_pool_size')) 
         global collect_queue
+        fast_queue = None
+        slow_queue = None
         if collect_queue is None:
-            collect_queue = Queue()
+            collect_queue = _create_collect_queue(collect_thread_pool_size)
+            if _read_core_config('collect_lanes', 'False') == 'True':
+                from liota.entities.metrics.registered_metric import \
+                    LANE_FAST, LANE_SLOW
+
+                slow_pool_size = int(_read_core_config('slow_lane_pool_size',
+                                                       5))
+                fast_queue = collect_queue
+                slow_queue = _create_collect_queue(slow_pool_size)
+                collect_queue = CollectLanes(float(_read_core_config(
+                    'slow_lane_threshold_ms', 100)))
+                collect_queue.add_lane(LANE_FAST, fast_queue)
+                collect_queue.add_lane(LANE_SLOW, slow_queue)
         global send_queue
         if send_queue is None:
-            send_queue = Queue()
-        global send_thread
-        if send_thread is None:
-            send_thread = SendThread(name="SendThread")
+            send_queue = SendLanes(
+                int(_read_core_config('send_lane_concurrency', 1)),
+                int(_read_core_config('send_queue_size', 0)),
+                _read_core_config('send_queue_policy', BLOCK)
+            )
         global collect_thread_pool
-        collect_thread_pool_size = int(read_liota_config('CORE_CFG','collect_thread_pool_size')) 
-        collect_thread_pool = CollectionThreadPool(collect_thread_pool_size)
+        collect_thread_pool = CollectionThreadPool(
+            collect_thread_pool_size,
+            min_threads=int(_read_core_config(
+                'collect_thread_pool_min_size', collect_thread_pool_size)),
+            max_threads=int(_read_core_config(
+                'collect_thread_pool_max_size', collect_thread_pool_size)),
+            idle_timeout=float(_read_core_config(
+                'collect_thread_idle_timeout', 60)),
+            queue=fast_queue
+        )
+        global slow_collect_thread_pool
+        if slow_queue is not None:
+            slow_collect_thread_pool = CollectionThreadPool(
+                slow_pool_size,
+                queue=slow_queue,
+                name="SlowCollector"
+            )
+        global watchdog_thread
+        watchdog_interval = float(_read_core_config('watchdog_interval', 1))
+        if watchdog_thread is None and watchdog_interval > 0:
+            watchdog_thread = WatchdogThread(get_collect_pools(),
+                                             watchdog_interval,
+                                             name="WatchdogThread")
         is_initialization_done = True
 
 
-def terminate():
-    global event_checker_thread
+def _wait_for_collectors(deadline):
+    if isinstance(event_ds, AsyncMetricEngine) and \
+            not event_ds.join(deadline):
+        return False
+    while True:
+        if (collect_queue is None or collect_queue.qsize() == 0) and \
+                not any(pool.get_stats_working()[0]
+                        for pool in get_collect_pools()):
+            return True
+        if _time() >= deadline:
+            return False
+        time.sleep(DRAIN_POLL_SEC)
+
+
+def flush(metrics, deadline=None, busy_comms=()):
+    """
+    Sends samples buffered by metrics through their DCCs, from the calling
+    thread, whether they reached aggregation_size or not.  Samples of
+    metrics without a DCC, of metrics whose DCCComms id is in busy_comms,
+    or left once the deadline on the monotonic clock is past, are dropped.
+
+    :return: Number of samples flushed, and number of samples dropped.
+    """
+    num_flushed = 0
+    num_dropped = 0
+    for metric in metrics:
+        num_values = metric.values.qsize()
+        if not num_values:
+            continue
+        if metric.ref_dcc is None or \
+                id(metric.ref_dcc.comms) in busy_comms or \
+                (deadline is not None and _time() >= deadline):
+            num_dropped += num_values
+            continue
+        metric.reset_aggregation_size()
+        try:
+            metric.send_data()
+            num_flushed += num_values
+        except Exception:
+            log.exception("Error flushing data for metric " + str(metric))
+            num_dropped += num_values
+    return num_flushed, num_dropped
+
+
+def drain(timeout=None):
+    """
+    Stops scheduling metrics and flushes samples they buffered, so that
+    samples short of aggregation_size are not lost on exit:
+
+        *  metrics already dispatched are collected, on the asyncio
+           engine collections and sends in flight are done
+        *  metrics queued for sending are sent by the send lanes, which
+           then exit
+        *  every live metric still buffering samples is sent through its
+           DCC, from the calling thread
+
+    Stages not done by the deadline are cut short, samples they leave in
+    buffers are dropped.  The state snapshot, if enabled, is then written
+    one last time, with samples dropped.
+
+    :param timeout: Seconds the drain may take, drain_timeout in
+        liota.conf if None.  With 0, scheduling is stopped and buffered
+        samples are dropped.
+    :return: Number of samples flushed by the final flush, and number of
+        samples dropped.
+    """
+    global is_drained
+    if timeout is None:
+        timeout = float(_read_core_config('drain_timeout', 5))
+    deadline = _time() + timeout
+    is_drained = True
     if event_checker_thread:
         event_checker_thread.flag_alive = False
-    global send_thread
-    if send_thread:
-        send_thread.flag_alive = False
-    global event_ds
     if event_ds:
         event_ds.put_and_notify(SystemExit(), timeout=0)
-    global send_queue
+    if not _wait_for_collectors(deadline):
+        log.warning("Drain: collections still running at deadline")
+    busy_comms = set()
     if send_queue:
         send_queue.put(SystemExit())
+        if isinstance(send_queue, SendLanes):
+            busy_comms = send_queue.join(deadline)
+    live_metrics = []
+    num_dropped = 0
+    for metric in get_registered_metrics():
+        if metric.flag_alive:
+            live_metrics.append(metric)
+        else:
+            num_dropped += metric.values.qsize()
+    num_flushed, num_not_flushed = flush(live_metrics, deadline, busy_comms)
+    num_dropped += num_not_flushed
+    if num_dropped:
+        log.warning("Drain: %d samples flushed, %d dropped" %
+                    (num_flushed, num_dropped))
+    else:
+        log.info("Drain: %d samples flushed" % num_flushed)
+    _write_final_state_snapshot()
+    return num_flushed, num_dropped
+
+
+def _write_final_state_snapshot():
+    global snapshot_thread
+    global state_snapshot_path
+    if snapshot_thread:
+        snapshot_thread.stop()
+        snapshot_thread.join()
+        snapshot_thread = None
+    if state_snapshot_path:
+        try:
+            write_state_snapshot()
+        except Exception:
+            log.exception("Error writing state snapshot")
+        # Metrics stopped from now on are not written over the snapshot
+        state_snapshot_path = None
+
+
+def terminate(drain_timeout=None):
+    """
+    Drains metrics, see drain(), unless they were already, and stops the
+    threads of metric handler.
+    """
+    if not is_drained:
+        drain(drain_timeout)
+    global watchdog_thread
+    if watchdog_thread:
+        watchdog_thread.stop()
+    global process_pool
+    with process_pool_lock:
+        if process_pool is not None:
+            process_pool.terminate()
+            process_pool = None
@@ -288,18 +288,23 @@ class PackageThread(Thread):
     #-----------------------------------------------------------------------
     # This method is used to handle statistical commands
 
-    def _cmd_handler_stat(self, parameter):
+    def _cmd_handler_stat(self, parameter, count=None):
         if parameter == "metrics" or parameter == "met":
             from liota.core.metric_handler \
                 import event_ds, collect_queue, send_queue, \
-                CollectionThreadPool, collect_thread_pool
+                CollectionThreadPool, collect_thread_pool, \
+                EventsPriorityQueue, get_registered_metrics
+            from liota.entities.metrics.registered_metric \
+                import LATENCY_STAGES
 
-            stats = ["n/a", "n/a", "n/a", "n/a"]
-            if isinstance(event_ds, Queue):
+            stats = ["n/a", "n/a", "n/a", "n/a", "n/a", "n/a"]
+            if event_ds is not None:
                 stats[0] = str(event_ds.qsize())
-            if isinstance(send_queue, Queue):
+            if isinstance(event_ds, EventsPriorityQueue):
+                stats[4:6] = map(str, event_ds.get_stats_removed())
+            if send_queue is not None:
                 stats[1] = str(send_queue.qsize())
-            if isinstance(collect_queue, Queue):
+            if collect_queue is not None:
                 stats[2] = str(collect_queue.qsize())
             if isinstance(collect_thread_pool, CollectionThreadPool):
                 stats[3] = collect_thread_pool.get_stats_working()[0]
@@ -307,25 +312,225 @@ class PackageThread(Thread):
                          + "Waiting queue: %s\n\t"
                          + "Sending queue: %s\n\t"
                          + "Collecting queue: %s\n\t"
-                         + "Collecting threads: %s"
+                         + "Collecting threads: %s\n\t"
+                         + "Removed metrics in waiting queue: %s\n\t"
+                         + "Compactions of waiting queue: %s"
                          ) % tuple(stats))
+            try:
+                count = 10 if count is None else int(count)
+            except ValueError:
+                log.warning("Invalid number of metrics: %s" % count)
+                return
+            metrics_slowest = sorted(
+                get_registered_metrics(),
+                key=lambda metric: metric.get_latency_ms(),
+                reverse=True
+            )[:count]
+            log.warning(("Slowest %d metrics, latency per stage "
+                         + "(mean/p99/max ms) - \n\t") % len(metrics_slowest)
+                        + "\n\t".join(map(
+                            lambda metric: "%s: %.1f ms\n\t\t" % (
+                                metric.ref_entity.name,
+                                metric.get_latency_ms()
+                            ) + ", ".join(map(
+                                lambda stage: "%s: %.1f/%.1f/%.1f" % (
+                                    stage,
+                                    metric.latency[stage].mean(),
+                                    metric.latency[stage].percentile(99),
+                                    metric.latency[stage].max
+                                ),
+                                LATENCY_STAGES
+                            )),
+                            metrics_slowest
+                        ))
+                        )
             return
         if parameter == "collection_threads" or parameter == "col":
             from liota.core.metric_handler \
-                import CollectionThreadPool, collect_thread_pool
+                import CollectionThreadPool, collect_thread_pool, \
+                slow_collect_thread_pool, collect_queue, ShardedQueue, \
+                CollectLanes, get_registered_metrics
 
-            stats = ["n/a", "n/a", "n/a", "n/a"]
+            stats = ["n/a"] * 10
             if isinstance(collect_thread_pool, CollectionThreadPool):
                 stats = map(
                     lambda n: str(n),
                     collect_thread_pool.get_stats_working()
+                    + collect_thread_pool.get_stats_elastic()[1:]
+                    + ["n/a", "n/a"]
                 )
+                queue = collect_thread_pool.get_queue()
+                if isinstance(queue, ShardedQueue):
+                    stats[8:10] = map(str, queue.get_stats()[0::2])
             log.warning(("Status of collection threads - \n\t"
                          + "Collecting: %s\n\t"
                          + "Alive: %s\n\t"
                          + "Pool: %s\n\t"
-                         + "Capacity: %s"
+                         + "Capacity: %s\n\t"
+                         + "Minimum: %s\n\t"
+                         + "Maximum: %s\n\t"
+                         + "Grown: %s\n\t"
+                         + "Shrunk: %s\n\t"
+                         + "Shards: %s\n\t"
+                         + "Stolen: %s"
                          ) % tuple(stats))
+            if not isinstance(collect_queue, CollectLanes):
+                return
+            pools = {"fast": collect_thread_pool,
+                     "slow": slow_collect_thread_pool}
+            metrics = get_registered_metrics()
+            lane_stats = []
+            for lane, depth, routed in collect_queue.get_stats():
+                working, _, num_threads, _ = \
+                    pools[lane].get_stats_working()
+                lane_stats.append((
+                    lane,
+                    depth,
+                    working,
+                    num_threads,
+                    100.0 * working / max(num_threads, 1),
+                    routed,
+                    len([metric for metric in metrics
+                         if metric.lane == lane])
+                ))
+            log.warning("Status of collect lanes - \n\t%s"
+                        % "\n\t".join(map(
+                            lambda stats: ("%s: Depth: %d, Collecting: %d, "
+                                           + "Threads: %d, "
+                                           + "Utilization: %.0f%%, "
+                                           + "Routed: %d, Metrics: %d"
+                                           ) % stats,
+                            lane_stats
+                        ))
+                        )
+            return
+        if parameter == "lanes" or parameter == "lan":
+            from liota.core.metric_handler import send_queue, SendLanes
+
+            if not isinstance(send_queue, SendLanes):
+                log.warning("Send lanes are not started")
+                return
+            log.warning("Status of send lanes - \n\t%s"
+                        % "\n\t".join(map(
+                            lambda stats: ("%s: Depth: %d, Threads: %d, "
+                                           + "Sent: %d, "
+                                           + "Mean latency: %.1f ms, "
+                                           + "Max latency: %.1f ms, "
+                                           + "Dropped: %d"
+                                           ) % tuple(stats),
+                            send_queue.get_stats()
+                        ))
+                        )
+            return
+        if parameter == "overruns" or parameter == "ove":
+            from liota.core.metric_handler import get_registered_metrics
+
+            metrics_overrun = filter(
+                lambda metric: metric.num_skipped + metric.num_late > 0,
+                get_registered_metrics()
+            )
+            log.warning("Overruns per metric (policy, skipped, late) - \n\t"
+                        + "\n\t".join(map(
+                            lambda metric: "%s: %s, %d, %d" % (
+                                metric.ref_entity.name,
+                                metric.ref_entity.overrun_policy,
+                                metric.num_skipped,
+                                metric.num_late
+                            ),
+                            sorted(metrics_overrun,
+                                   key=lambda metric: metric.ref_entity.name)
+                        ))
+                        )
+            return
+        if parameter == "drops" or parameter == "dro":
+            from liota.core.metric_handler import collect_queue, send_queue, \
+                get_registered_metrics
+
+            stats = ["n/a", "n/a"]
+            if collect_queue is not None:
+                stats[0] = str(collect_queue.num_dropped)
+            if send_queue is not None:
+                stats[1] = str(sum(map(
+                    lambda lane_stats: lane_stats[6], send_queue.get_stats())))
+            metrics_dropping = filter(
+                lambda metric: sum(metric.num_dropped.values()) > 0,
+                get_registered_metrics()
+            )
+            log.warning(("Number of metrics dropped from - \n\t"
+                         + "Collecting queue: %s\n\t"
+                         + "Sending queues: %s\n"
+                         + "Drops per metric (collect, send, buffer) - \n\t"
+                         ) % tuple(stats)
+                        + "\n\t".join(map(
+                            lambda metric: "%s: %d, %d, %d" % (
+                                metric.ref_entity.name,
+                                metric.num_dropped["collect"],
+                                metric.num_dropped["send"],
+                                metric.num_dropped["buffer"]
+                            ),
+                            sorted(metrics_dropping,
+                                   key=lambda metric: metric.ref_entity.name)
+                        ))
+                        )
+            return
+        if parameter == "errors" or parameter == "err":
+            from liota.core.metric_handler \
+                import get_collect_pools, get_registered_metrics
+
+            restarted = str(sum(map(
+                lambda pool: pool.get_stats_restarted(),
+                get_collect_pools())))
+            metrics_failing = filter(
+                lambda metric: metric.num_errors > 0,
+                get_registered_metrics()
+            )
+            log.warning(("Collection threads restarted: %s\n"
+                         + "Errors per metric (errors, runs, error rate, "
+                         + "failed in a row) - \n\t"
+                         ) % restarted
+                        + "\n\t".join(map(
+                            lambda metric: "%s: %d, %d, %.1f%%, %d" % (
+                                metric.ref_entity.name,
+                                metric.num_errors,
+                                metric.num_runs,
+                                metric.get_error_rate() * 100,
+                                metric.failures_in_row
+                            ),
+                            sorted(metrics_failing,
+                                   key=lambda metric: -metric.get_error_rate())
+                        ))
+                        )
+            return
+        if parameter == "timeouts" or parameter == "tim":
+            from liota.core.metric_handler \
+                import get_collect_pools, get_registered_metrics
+
+            stats = map(str, reduce(
+                lambda total, pool_stats: map(sum, zip(total, pool_stats)),
+                map(lambda pool: pool.get_stats_timeouts(),
+                    get_collect_pools()),
+                [0, 0]))
+            metrics_timing_out = filter(
+                lambda metric: metric.num_timeouts > 0,
+                get_registered_metrics()
+            )
+            log.warning(("Timeouts of collection threads - \n\t"
+                         + "Stuck: %s\n\t"
+                         + "Timed out: %s\n"
+                         + "Timeouts per metric (timeout, timed out, "
+                         + "failed in a row) - \n\t"
+                         ) % tuple(stats)
+                        + "\n\t".join(map(
+                            lambda metric: "%s: %.1f s, %d, %d" % (
+                                metric.ref_entity.name,
+                                metric.get_timeout(),
+                                metric.num_timeouts,
+                                metric.failures_in_row
+                            ),
+                            sorted(metrics_timing_out,
+                                   key=lambda metric: metric.ref_entity.name)
+                        ))
+                        )
             return
         if parameter == "threads" or parameter == "th":
             import threading
@@ -439,10 +644,10 @@ class PackageThread(Thread):
                     self._cmd_handler_list(msg[1])
             elif command == "stat":
                 with package_lock:
-                    if len(msg) != 2:
+                    if len(msg) != 2 and len(msg) != 3:
                         log.warning("Invalid format of command: %s" % command)
                         continue
-                    self._cmd_handler_stat(msg[1])
+                    self._cmd_handler_stat(*msg[1:])
             elif command == "load_auto":
                 with package_lock:
                     self._package_load_auto()
@@ -766,11 +971,24 @@ class PackageThread(Thread):
                         % file_name)
 
         # Clean-up
+        from liota.core.metric_handler import flush as handler_flush, \
+            get_registered_metrics
+
+        live_metrics = [metric for metric in get_registered_metrics()
+                        if metric.flag_alive]
         try:
             package_obj.clean_up()
         except Exception as er:
             log.exception("Exception in clean-up: %s" % er)
 
+        # Samples buffered by metrics the package stopped are sent, rather
+        # than dropped with them
+        num_flushed, num_dropped = handler_flush(
+            [metric for metric in live_metrics if not metric.flag_alive])
+        if num_flushed or num_dropped:
+            log.info("Flushed %d samples of package %s, dropped %d"
+                     % (num_flushed, file_name, num_dropped))
+
         # Remove dependent item from dependencies
         log.debug("Package %s depends on: %s"
                   % (file_name, " ".join(package_record.get_dependencies())))
@@ -1128,6 +1346,14 @@ class PackageThread(Thread):
                 fp.write(
                     "terminate_messenger_but_you_should_not_do_this_yourself\n")
 
+        # Buffered samples are flushed while packages still hold their
+        # metrics alive
+        log.info("Draining metric handler...")
+
+        from liota.core.metric_handler import drain as handler_drain
+
+        handler_drain()
+
         log.info("Unloading packages...")
         if not self._package_unload_list(self._packages_loaded.keys()):
             log.error("Some packages failed to unload. See log for details")
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import random
+from threading import Lock
+
+# Placement policies
+ALIGNED = "aligned"
+SPREAD = "spread"
+JITTER = "jitter"
+
+PLACEMENT_POLICIES = (ALIGNED, SPREAD, JITTER)
+
+
+def _van_der_corput(index):
+    """
+    Returns the index-th element of the base 2 van der Corput sequence:
+    0, 1/2, 1/4, 3/4, 1/8, 5/8, ...  Any prefix of it is spread evenly over
+    [0, 1), whatever its length.
+    """
+    fraction = 0.0
+    denominator = 1.0
+    while index:
+        denominator *= 2
+        fraction += (index & 1) / denominator
+        index >>= 1
+    return fraction
+
+
+class Placement:
+    """
+    Decides the first run time of metrics, so that metrics started together
+    do not all run in the same millisecond of every period:
+
+        *  aligned  - first run one interval after start
+        *  spread   - metrics sharing an interval get phases spread evenly
+                      over the interval, in the order they are started
+        *  jitter   - first run one interval after start, plus a random
+                      delay of up to jitter_ms, bounded by the interval
+
+    Metrics created with staggered=False are always aligned.
+    """
+
+    def __init__(self, policy=SPREAD, jitter_ms=1000):
+        if policy not in PLACEMENT_POLICIES:
+            raise ValueError("Unsupported placement policy: %s" % policy)
+        self.policy = policy
+        self.jitter_ms = jitter_ms
+        self._lock = Lock()
+        self._num_placed = {}  # key: interval in ms, value: count of metrics
+
+    def first_run_time(self, interval_ms, now_ms, staggered=True):
+        if not staggered or self.policy == ALIGNED or interval_ms <= 0:
+            return now_ms + interval_ms
+        if self.policy == JITTER:
+            return now_ms + interval_ms + \
+                random.uniform(0, min(self.jitter_ms, interval_ms))
+        with self._lock:
+            index = self._num_placed.get(interval_ms, 0)
+            self._num_placed[interval_ms] = index + 1
+        # Phases are relative to time 0 of the clock, so that metrics
+        # started at different times are spread too.
+        phase = _van_der_corput(index) * interval_ms
+        run_time = now_ms - now_ms % interval_ms + phase
+        if run_time <= now_ms:
+            run_time += interval_ms
+        return run_time
+
+
+def wall_clock_run_time(interval_ms, now_ms, wall_offset_ms):
+    """
+    Returns the first time after now_ms, on the monotonic clock, that the
+    wall clock is a multiple of interval_ms.  wall_offset_ms is the wall
+    clock minus the monotonic clock.  Metrics sharing an interval then run,
+    and stamp their samples, on the same wall clock instants, whenever they
+    were started.
+    """
+    if interval_ms <= 0:
+        return now_ms
+    wall_now = now_ms + wall_offset_ms
+    return wall_now - wall_now % interval_ms + interval_ms - wall_offset_ms
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+from collections import deque
+from thread import allocate_lock
+from threading import Lock
+import logging
+
+log = logging.getLogger(__name__)
+
+_EMPTY = object()
+
+
+class ShardedQueue:
+    """
+    Collect queue of one shard per collector thread, used in place of a
+    single Queue with 'collect_dispatch = sharded'.
+
+    put() appends items to the shard of an idle worker, or to the next shard
+    round robin.  A worker takes items from its own shard first, and steals
+    from the head of other shards once its own is empty, so that items do not
+    wait behind a slow metric while other workers are idle.  Shards are
+    deques, whose appends and pops are atomic, so dispatching and collecting
+    do not serialize on one mutex.  A worker going to sleep waits on a lock
+    of its own, which put() releases to wake it up, and only if no worker
+    woken up before is still looking for items.
+
+    Items are served in FIFO order per shard only, and the queue is
+    unbounded.  More workers than shards share shards.
+    """
+
+    def __init__(self, num_shards):
+        if num_shards <= 0:
+            raise ValueError("num_shards must be a positive number")
+        self._shards = [deque() for _ in range(num_shards)]
+        # (shard, waiter lock) of each worker sleeping
+        self._idle = deque()
+        # One entry per worker woken up and looking for items.  A deque, to
+        # be counted and updated atomically.
+        self._searching = deque()
+        self._next = 0
+        self._stats_lock = Lock()
+        self.num_stolen = 0
+        # Items are never dropped, kept for stats of collect_queue
+        self.num_dropped = 0
+
+    def get_num_shards(self):
+        return len(self._shards)
+
+    def put(self, item, block=True, timeout=None):
+        try:
+            shard = self._idle[-1][0]
+        except IndexError:
+            shard = self._next
+            self._next = (shard + 1) % len(self._shards)
+        self._shards[shard].append(item)
+        # Workers looking for items already will find this one, see get(),
+        # unless there are more items than workers
+        if len(self._searching) < len(self._shards[shard]):
+            self._wake_one()
+
+    def get(self, shard=0):
+        """
+        Removes and returns an item, from the given shard if it has one.
+        Blocks until an item is available.
+        """
+        shard %= len(self._shards)
+        item = self._take(shard)
+        if item is not _EMPTY:
+            return item
+        searching = False
+        while True:
+            waiter = allocate_lock()
+            waiter.acquire()
+            entry = (shard, waiter)
+            # A worker stops searching before its last check, so that either
+            # that check sees an item put in the meantime, or put() sees no
+            # worker searching and wakes one up
+            self._idle.append(entry)
+            if searching:
+                self._stop_searching()
+            item = self._take(shard)
+            if item is _EMPTY:
+                waiter.acquire()
+                searching = True
+                item = self._take(shard)
+                if item is _EMPTY:
+                    continue
+            else:
+                try:
+                    self._idle.remove(entry)
+                    return item
+                except ValueError:
+                    # Being woken up, and counted as searching, already
+                    pass
+            self._stop_searching()
+            # The last worker searching wakes up another one for items left,
+            # put() did not while it was searching
+            if not self._searching and any(self._shards):
+                self._wake_one()
+            return item
+
+    def _take(self, shard):
+        try:
+            return self._shards[shard].popleft()
+        except IndexError:
+            pass
+        # Shards with items, found without a loop in Python.  Thieves start
+        # at different shards so that they do not all go for the same one.
+        victims = filter(None, self._shards)
+        for i in range(len(victims)):
+            try:
+                item = victims[(shard + i) % len(victims)].popleft()
+            except IndexError:
+                continue
+            with self._stats_lock:
+                self.num_stolen += 1
+            return item
+        return _EMPTY
+
+    def _wake_one(self):
+        while True:
+            # The worker woken up is searching until it finds an item or
+            # sleeps.  It is counted before it leaves _idle, it may find it
+            # left and go on right away.
+            self._searching.append(None)
+            try:
+                _, waiter = self._idle.pop()
+                break
+            except IndexError:
+                self._stop_searching()
+            # Unless a worker went idle since, missing items put while this
+            # one was counted
+            if self._searching or not self._idle or not any(self._shards):
+                return
+        waiter.release()
+
+    def _stop_searching(self):
+        try:
+            self._searching.pop()
+        except IndexError:
+            # More workers woke up for one wakeup than it counted
+            pass
+
+    def qsize(self):
+        return sum(map(len, self._shards))
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def get_stats(self):
+        """
+        Returns number of shards, number of items queued, and number of
+        items stolen from other shards.
+        """
+        with self._stats_lock:
+            return [len(self._shards), self.qsize(), self.num_stolen]
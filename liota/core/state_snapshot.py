@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+"""
+Snapshot of the state of metrics, written by metric_handler so that their
+schedules and unsent samples survive restarts.  The state of a metric is
+
+    (next run time, interval, aggregation size, [(ts, v), ...])
+
+by (entity id, DCC class name) of its RegisteredMetric, the next run time
+being in wall clock milliseconds, or None if the metric is not scheduled.
+
+A snapshot file is MAGIC, a format version byte, a byte order byte, and the
+marshal of a tuple of columns: one string of all keys, sorted, and one
+array of doubles per field of all metrics, or of all samples.  Loading it
+is copying a few strings and splitting the keys, 100k metrics load in tens
+of milliseconds.  States are only decoded when popped, i.e., when their
+metric starts.
+
+Values of samples are reduced to their magnitude, samples of values that
+are not numbers nor strings are not persisted.  Integers and floats are
+stored as doubles, other values in a list beside.
+"""
+
+from array import array
+from bisect import bisect_left
+from operator import itemgetter
+import logging
+import marshal
+import os
+import sys
+from numbers import Number
+
+log = logging.getLogger(__name__)
+
+MAGIC = "LIOTASNP"
+VERSION = 1
+BYTE_ORDER = "<" if sys.byteorder == "little" else ">"
+
+_PLAIN_TYPES = (Number, basestring, type(None))
+_FLOAT_TYPES = set([float])
+_INT_TYPES = set([int, long])
+
+# Kinds of values of samples
+_FLOAT = "f"
+_INT = "i"
+_OTHER = "o"
+
+# Integers beyond are not exact in a double
+_MAX_EXACT_INT = 2 ** 53
+
+
+def plain_samples(samples):
+    """
+    Returns (ts, v) samples that can be persisted, values reduced to their
+    magnitude.
+    """
+    plain = []
+    for ts, value in samples:
+        value = getattr(value, 'magnitude', value)
+        if isinstance(value, _PLAIN_TYPES):
+            plain.append((ts, value))
+    return plain
+
+
+def _kind_of(value):
+    if isinstance(value, float):
+        return _FLOAT
+    if isinstance(value, (int, long)) and not isinstance(value, bool) and \
+            -_MAX_EXACT_INT <= value <= _MAX_EXACT_INT:
+        return _INT
+    return _OTHER
+
+
+def _encode_key(key):
+    entity_id, dcc_name = key
+    if isinstance(entity_id, unicode):
+        entity_id = entity_id.encode("utf-8")
+    return "%s\t%s" % (entity_id, dcc_name)
+
+
+class Snapshot:
+    """
+    States of metrics read from a snapshot file, decoded as they are popped.
+    Keys are sorted in the file, and looked up by bisection, which is
+    cheaper than building a dict of them for the few lookups done.
+    """
+
+    def __init__(self, columns=None):
+        if columns is None:
+            columns = ("", "", "", "", "\0" * 8, "\0" * 8, "", "", "", [])
+        (keys, next_runs, intervals, aggregations, sample_starts,
+         other_starts, timestamps, values, kinds, others) = columns
+        self._keys = keys.split("\n") if keys else []
+        self._next_runs = self._array(next_runs)
+        self._intervals = self._array(intervals)
+        self._aggregations = self._array(aggregations)
+        self._sample_starts = self._array(sample_starts)
+        self._other_starts = self._array(other_starts)
+        self._timestamps = self._array(timestamps)
+        self._values = self._array(values)
+        self._kinds = kinds
+        self._others = others
+        if not len(self._keys) == len(self._next_runs) == \
+                len(self._intervals) == len(self._aggregations) == \
+                len(self._sample_starts) - 1 == \
+                len(self._other_starts) - 1 or \
+                not len(self._timestamps) == len(self._values) == \
+                len(kinds) == self._sample_starts[-1] or \
+                len(others) != self._other_starts[-1]:
+            raise ValueError("Columns of state snapshot do not match")
+        self._popped = set()
+
+    @staticmethod
+    def _array(data):
+        column = array("d")
+        column.fromstring(data)
+        return column
+
+    def __len__(self):
+        return len(self._keys) - len(self._popped)
+
+    def pop(self, key):
+        """
+        Returns the state of a metric and forgets it, or None if there is
+        none.
+        """
+        key = _encode_key(key)
+        index = bisect_left(self._keys, key)
+        if index == len(self._keys) or self._keys[index] != key or \
+                index in self._popped:
+            return None
+        self._popped.add(index)
+        return self._decode(index)
+
+    def items(self):
+        """
+        Returns (key, state) pairs of states not popped.
+        """
+        return [(tuple(key.decode("utf-8").split("\t")), self._decode(index))
+                for index, key in enumerate(self._keys)
+                if index not in self._popped]
+
+    def _decode(self, index):
+        next_run = self._next_runs[index]
+        interval = self._intervals[index]
+        samples = []
+        other = int(self._other_starts[index])
+        for i in xrange(int(self._sample_starts[index]),
+                        int(self._sample_starts[index + 1])):
+            kind = self._kinds[i]
+            if kind == _FLOAT:
+                value = self._values[i]
+            elif kind == _INT:
+                value = long(self._values[i])
+            else:
+                value = self._others[other]
+                other += 1
+            samples.append((long(self._timestamps[i]), value))
+        return (None if next_run != next_run else long(next_run),
+                int(interval) if interval.is_integer() else interval,
+                int(self._aggregations[index]),
+                samples)
+
+
+def _kinds_of(values):
+    # Samples of a metric are usually all floats or all integers
+    types = set(map(type, values))
+    if types <= _FLOAT_TYPES:
+        return _FLOAT * len(values)
+    if types <= _INT_TYPES and \
+            -_MAX_EXACT_INT <= min(values) and max(values) <= _MAX_EXACT_INT:
+        return _INT * len(values)
+    return "".join(map(_kind_of, values))
+
+
+def write(path, state):
+    """
+    Writes a dict of states by key to path, replacing the previous snapshot
+    at once, so that a crash while writing leaves the previous one.
+    """
+    # Columns are built as lists, converted to arrays at once
+    keys = []
+    next_runs = []
+    intervals = []
+    aggregations = []
+    sample_starts = [0]
+    other_starts = [0]
+    timestamps = []
+    values = []
+    kinds = []
+    others = []
+    nan = float("nan")
+    for key, (next_run, interval, aggregation_size, samples) in sorted(
+            ((_encode_key(key), value) for key, value in state.iteritems()),
+            key=itemgetter(0)):
+        keys.append(key)
+        next_runs.append(nan if next_run is None else next_run)
+        intervals.append(interval)
+        aggregations.append(aggregation_size)
+        if samples:
+            sample_timestamps, sample_values = zip(*samples)
+            sample_kinds = _kinds_of(sample_values)
+            timestamps.extend(sample_timestamps)
+            if _OTHER in sample_kinds:
+                for kind, value in zip(sample_kinds, sample_values):
+                    if kind == _OTHER:
+                        values.append(0)
+                        others.append(value)
+                    else:
+                        values.append(value)
+            else:
+                values.extend(sample_values)
+            kinds.append(sample_kinds)
+        sample_starts.append(len(timestamps))
+        other_starts.append(len(others))
+    columns = tuple(["\n".join(keys)] +
+                    [array("d", column).tostring()
+                     for column in (next_runs, intervals, aggregations,
+                                    sample_starts, other_starts, timestamps,
+                                    values)] +
+                    ["".join(kinds), others])
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as fp:
+        fp.write(MAGIC)
+        fp.write(chr(VERSION))
+        fp.write(BYTE_ORDER)
+        marshal.dump(columns, fp, 2)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.rename(temp_path, path)
+
+
+def read(path):
+    """
+    Returns the Snapshot written to path, or an empty one if there is no
+    snapshot or it cannot be read.
+    """
+    try:
+        with open(path, "rb") as fp:
+            if fp.read(len(MAGIC)) != MAGIC or \
+                    fp.read(1) != chr(VERSION) or fp.read(1) != BYTE_ORDER:
+                log.warning("Ignored state snapshot of unknown format: %s" %
+                            path)
+                return Snapshot()
+            return Snapshot(marshal.load(fp))
+    except IOError:
+        return Snapshot()
+    except (EOFError, ValueError, TypeError):
+        log.exception("Ignored corrupt state snapshot: %s" % path)
+        return Snapshot()
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel holding items keyed on deadlines in milliseconds.
+
+    Level 0 has one slot per tick; every further level has slots as wide as a
+    full rotation of the level below.  Items parked on higher levels are
+    cascaded down whenever the level below wraps around, so insertion,
+    cancellation and rescheduling are O(1) regardless of the number of items.
+    Deadlines are rounded up to the tick resolution, items never expire early.
+
+    TimingWheel is not thread-safe, callers have to serialize access.
+    """
+
+    def __init__(self, tick_ms=10, slot_bits=8, levels=4, now_ms=0):
+        """
+        :param tick_ms: Resolution of the wheel in milliseconds.
+        :param slot_bits: Number of slots per level is 2 ** slot_bits.
+        :param levels: Number of levels of the wheel.
+        :param now_ms: Current time in milliseconds.
+        """
+        if int(tick_ms) <= 0:
+            raise ValueError("tick_ms must be a positive number")
+        if slot_bits <= 0 or levels <= 0:
+            raise ValueError("slot_bits and levels must be positive numbers")
+        self._tick_ms = int(tick_ms)
+        self._bits = slot_bits
+        self._mask = (1 << slot_bits) - 1
+        self._num_levels = levels
+        self._max_delta = (1 << (slot_bits * levels)) - 1
+        # Each slot maps id(item) to (item, expiry tick)
+        self._levels = [[{} for _ in range(1 << slot_bits)]
+                        for _ in range(levels)]
+        self._level_counts = [0] * levels
+        self._where = {}  # key: id(item), value: (level, slot)
+        # Items added with a deadline which has already passed
+        self._overdue = {}
+        self._count = 0
+        # Next tick to be processed
+        self._current = long(now_ms) // self._tick_ms
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, item):
+        return id(item) in self._where
+
+    def get_tick_ms(self):
+        return self._tick_ms
+
+    def add(self, item, deadline_ms):
+        """
+        Adds an item, or moves it if it is already in the wheel.
+
+        :param item: Any object, identified by its id().
+        :param deadline_ms: Time in milliseconds the item expires at.
+        """
+        self.remove(item)
+        # Round up, so that items are never handed out before their deadline
+        self._link(item, -(-long(deadline_ms) // self._tick_ms))
+
+    def remove(self, item):
+        """
+        Cancels an item.
+
+        :param item: Item previously added to the wheel.
+        :return: True if the item was found, False otherwise.
+        """
+        location = self._where.pop(id(item), None)
+        if location is None:
+            return False
+        level, slot = location
+        del slot[id(item)]
+        if level is not None:
+            self._level_counts[level] -= 1
+        self._count -= 1
+        return True
+
+    def advance(self, now_ms):
+        """
+        Moves the wheel forward to now_ms.
+
+        :param now_ms: Current time in milliseconds.
+        :return: List of items whose deadline has been reached.
+        """
+        target = long(now_ms) // self._tick_ms
+        expired = []
+        if self._overdue:
+            for key, (item, _) in self._overdue.iteritems():
+                del self._where[key]
+                expired.append(item)
+            self._count -= len(self._overdue)
+            self._overdue = {}
+        while self._current <= target:
+            if not self._count:
+                self._current = target + 1
+                break
+            if not self._level_counts[0]:
+                # Nothing can expire before the next cascade of the lowest
+                # non-empty level, jump straight to it.
+                level = 1
+                while not self._level_counts[level]:
+                    level += 1
+                span_mask = (1 << (self._bits * level)) - 1
+                if self._current & span_mask:
+                    boundary = (self._current | span_mask) + 1
+                    if boundary > target:
+                        self._current = target + 1
+                        break
+                    self._current = boundary
+            index = self._current & self._mask
+            if not index:
+                self._cascade()
+            slot = self._levels[0][index]
+            if slot:
+                self._levels[0][index] = {}
+                self._level_counts[0] -= len(slot)
+                self._count -= len(slot)
+                for key, (item, expires) in slot.iteritems():
+                    del self._where[key]
+                    if expires > self._current:
+                        # Deadline was beyond the range of the wheel
+                        self._link(item, expires)
+                    else:
+                        expired.append(item)
+            self._current += 1
+        return expired
+
+    def next_expiry(self):
+        """
+        Returns time in milliseconds at which advance() should be called next,
+        i.e., the earliest deadline in the wheel, or an earlier cascade point.
+        None is returned if the wheel is empty.
+        """
+        if not self._count:
+            return None
+        if self._overdue:
+            return (self._current - 1) * self._tick_ms
+        if self._level_counts[0]:
+            tick = self._current
+            slots = self._levels[0]
+            while True:
+                if not tick & self._mask:
+                    return tick * self._tick_ms
+                if slots[tick & self._mask]:
+                    return tick * self._tick_ms
+                tick += 1
+        level = 1
+        while not self._level_counts[level]:
+            level += 1
+        span_mask = (1 << (self._bits * level)) - 1
+        if self._current & span_mask:
+            return ((self._current | span_mask) + 1) * self._tick_ms
+        return self._current * self._tick_ms
+
+    def _link(self, item, expires):
+        delta = expires - self._current
+        if delta < 0:
+            # Already expired, hand it out on the next call of advance()
+            self._overdue[id(item)] = (item, expires)
+            self._where[id(item)] = (None, self._overdue)
+            self._count += 1
+            return
+        if delta > self._max_delta:
+            # Beyond the range of the wheel, it gets re-linked on cascade
+            delta = self._max_delta
+            slot_tick = self._current + self._max_delta
+        else:
+            slot_tick = expires
+        level = 0
+        while delta >> (self._bits * (level + 1)):
+            level += 1
+        slot = self._levels[level][
+            (slot_tick >> (self._bits * level)) & self._mask]
+        slot[id(item)] = (item, expires)
+        self._where[id(item)] = (level, slot)
+        self._level_counts[level] += 1
+        self._count += 1
+
+    def _cascade(self):
+        # Called when level 0 wraps around; moves items of the current slot
+        # of each higher level that wrapped as well one level down.
+        for level in range(1, self._num_levels):
+            index = (self._current >> (self._bits * level)) & self._mask
+            slot = self._levels[level][index]
+            if slot:
+                self._levels[level][index] = {}
+                self._level_counts[level] -= len(slot)
+                self._count -= len(slot)
+                for key, (item, expires) in slot.iteritems():
+                    del self._where[key]
+                    self._link(item, expires)
+            if index:
+                break
@@ -49,15 +49,18 @@ class AWSIoT(DataCenterComponent):
     """
     DCC for AWSIoT Platform.
     """
-    def __init__(self, con, enclose_metadata=False):
+    def __init__(self, con, enclose_metadata=False, compact_timestamps=False):
         """
         :param con: DccComms Object
         :param enclose_metadata: Include Gateway, Device and Metric names as part of payload or not
+        :param compact_timestamps: Send timestamps of clock aligned metrics once per payload, as the
+            timestamp of the first value and the interval, when values are one interval apart
         """
         super(AWSIoT, self).__init__(
             comms=con
         )
         self.enclose_metadata = enclose_metadata
+        self.compact_timestamps = compact_timestamps
 
     def register(self, entity_obj):
         """
@@ -130,16 +133,10 @@ class AWSIoT(DataCenterComponent):
         :param reg_metric: Registered Metric Object
         :return: Payload in JSON format
         """
-        met_cnt = reg_metric.values.qsize()
-        if 0 == met_cnt:
+        _timestamps, _values = reg_metric.values.drain()
+        if not _timestamps:
             return
 
-        _list = []
-        for _ in range(met_cnt):
-            m = reg_metric.values.get(block=True)
-            if m is not None:
-                _list.append(OrderedDict([('value', m[1]), ('timestamp', m[0])]))
-
         payload = OrderedDict()
         if self.enclose_metadata:
             _entity_hierarchy = self._get_entity_hierarchy(reg_metric)
@@ -156,7 +153,14 @@ class AWSIoT(DataCenterComponent):
                 # constructing payload for enclose_metadata
                 log.error("Error occurred while constructing payload")
         payload['metric_name'] = reg_metric.ref_entity.name
-        payload['metric_data'] = [_ for _ in _list]
+        start = self._batch_timestamp(reg_metric, _timestamps) if self.compact_timestamps else None
+        if start is None:
+            payload['metric_data'] = [OrderedDict([('value', v), ('timestamp', ts)])
+                                      for ts, v in zip(_timestamps, _values)]
+        else:
+            payload['metric_data'] = OrderedDict([('timestamp', start),
+                                                  ('interval', reg_metric.current_interval * 1000),
+                                                  ('values', _values)])
         # TODO: Make this as part of si_unit.py
         # Handling Base, Derived and Prefixed Units
         if reg_metric.ref_entity.unit is None:
@@ -34,6 +34,7 @@ import logging
 from abc import ABCMeta, abstractmethod
 
 from liota.entities.entity import Entity
+from liota.lib.utilities.clock import monotonic
 from liota.dcc_comms.dcc_comms import DCCComms
 from liota.entities.metrics.registered_metric import RegisteredMetric
 
@@ -76,15 +77,34 @@ class DataCenterComponent:
     def _format_data(self, reg_metric):
         pass
 
+    def _batch_timestamp(self, reg_metric, timestamps):
+        """
+        Returns the first of the timestamps of samples of a clock aligned
+        metric if they are one interval apart, so that a batch can carry
+        its timestamps as a start and an interval, or None.
+        """
+        if not timestamps or not reg_metric.ref_entity.clock_aligned:
+            return None
+        start = timestamps[0]
+        interval = reg_metric.current_interval * 1000
+        for index, ts in enumerate(timestamps):
+            if ts != start + index * interval:
+                return None
+        return start
+
     def publish(self, reg_metric):
         if not isinstance(reg_metric, RegisteredMetric):
             log.error("RegisteredMetric object is expected.")
             raise TypeError("RegisteredMetric object is expected.")
+        start = monotonic()
         message = self._format_data(reg_metric)
+        formatted = monotonic()
+        reg_metric.record_latency("format", (formatted - start) * 1000)
         if hasattr(reg_metric, 'msg_attr'):
             self.comms.send(message, reg_metric.msg_attr)
         else:
             self.comms.send(message, None)
+        reg_metric.record_latency("send", (monotonic() - formatted) * 1000)
 
     @abstractmethod
     def set_properties(self, reg_entity, properties):
@@ -56,19 +56,15 @@ class Graphite(DataCenterComponent):
         reg_entity_child.parent = reg_entity_parent
 
     def _format_data(self, reg_metric):
-        met_cnt = reg_metric.values.qsize()
+        timestamps, values = reg_metric.values.drain()
         message = ''
-        if met_cnt == 0:
-            return
-        for _ in range(met_cnt):
-            v = reg_metric.values.get(block=True)
-            if v is not None:
-                # Graphite expects time in seconds, not milliseconds. Hence,
-                # dividing by 1000
-                message += '%s %s %d\n' % (reg_metric.ref_entity.name,
-                                           v[1], v[0] / 1000)
-        if message == '':
+        if not timestamps:
             return
+        for ts, v in zip(timestamps, values):
+            # Graphite expects time in seconds, not milliseconds. Hence,
+            # dividing by 1000
+            message += '%s %s %d\n' % (reg_metric.ref_entity.name, v,
+                                       ts / 1000)
         log.info ("Publishing values to Graphite DCC")
         log.debug("Formatted message: {0}".format(message))
         return message
@@ -232,17 +232,8 @@ class IotControlCenter(DataCenterComponent):
         return msg
 
     def _format_data(self, reg_metric):
-        met_cnt = reg_metric.values.qsize()
-        if met_cnt == 0:
-            return
-        _timestamps = []
-        _values = []
-        for _ in range(met_cnt):
-            m = reg_metric.values.get(block=True)
-            if m is not None:
-                _timestamps.append(m[0])
-                _values.append(m[1])
-        if _timestamps == []:
+        _timestamps, _values = reg_metric.values.drain()
+        if not _timestamps:
             return
         return json.dumps({
             "type": "add_stats",
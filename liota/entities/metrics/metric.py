@@ -30,9 +30,12 @@
 #  THE POSSIBILITY OF SUCH DAMAGE.                                            #
 # ----------------------------------------------------------------------------#
 
+import pickle
+
 import pint
 from liota.entities.entity import Entity
-from liota.entities.metrics.registered_metric import RegisteredMetric
+from liota.entities.metrics.registered_metric import RegisteredMetric, \
+    OVERRUN_SKIP, OVERRUN_POLICIES, PRIORITY_NORMAL, PRIORITY_CLASSES, LANES
 from liota.lib.utilities.utility import systemUUID
 
 
@@ -42,14 +45,91 @@ class Metric(Entity):
                  unit=None,
                  interval=60,
                  aggregation_size=1,
-                 sampling_function=None
+                 sampling_function=None,
+                 sample_in_process=False,
+                 overrun_policy=OVERRUN_SKIP,
+                 catch_up_rate=2,
+                 priority=PRIORITY_NORMAL,
+                 staggered=True,
+                 timeout=None,
+                 lane=None,
+                 clock_aligned=False,
+                 min_interval=None,
+                 max_interval=None,
+                 change_threshold=None
                  ):
+        """
+        :param sample_in_process: Run the sampling function in a worker
+            process of the collection process pool instead of a collector
+            thread, so that CPU heavy sampling functions do not contend for
+            the GIL.  The sampling function has to be picklable, i.e., a
+            module level function, and must not depend on state changed in
+            the liota process after the pool has started.
+        :param overrun_policy: What to do with runs missed because a
+            collection or the scheduler was late: "skip" them, "coalesce"
+            them into one run, or "catch_up" on them.
+        :param catch_up_rate: Maximum number of runs per interval while
+            catching up.
+        :param priority: Priority class of the metric, "high", "normal" or
+            "low".  Collect and send queues serve higher classes first when
+            priority_scheduling is enabled in liota.conf.
+        :param staggered: Whether the first run of the metric may be placed
+            according to the placement policy in liota.conf, so that metrics
+            started together do not run together.  If False, the metric
+            first runs one interval after start_collecting().
+        :param timeout: Seconds the sampling function may run before the
+            collector watchdog gives up on it, collect_timeout in liota.conf
+            if None, 0 for no timeout.  A metric timing out is backed off.
+        :param lane: Collect lane the metric is pinned to, "fast" or "slow",
+            if collect_lanes is enabled in liota.conf.  If None, the lane
+            follows the average duration of its sampling function.
+        :param clock_aligned: Run the metric when the wall clock is a
+            multiple of its interval, and stamp its samples with that
+            multiple, so that metrics sharing an interval have identical
+            timestamps, e.g., to be joined or to have their timestamps sent
+            once per batch.  The placement policy does not apply.
+        :param min_interval: With max_interval, makes the interval adaptive:
+            starting from interval, it is halved, down to min_interval, on
+            every value that changed from the previous one by more than
+            change_threshold, and grows by half, up to max_interval, after
+            a few values that did not.
+        :param max_interval: See min_interval.
+        :param change_threshold: Change of a value from the previous one, in
+            units of the metric, that shortens an adaptive interval.  If
+            None, 5% of the previous value.
+        """
         if not (unit is None or isinstance(unit, pint.unit._Unit)) \
                 or not (
             isinstance(interval, int) or isinstance(interval, float)
         ) \
                 or not isinstance(aggregation_size, int):
             raise TypeError()
+        if overrun_policy not in OVERRUN_POLICIES:
+            raise ValueError("Unsupported overrun policy: %s" % overrun_policy)
+        if not isinstance(catch_up_rate, (int, float)) or catch_up_rate < 1:
+            raise ValueError("Catch up rate has to be at least 1")
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError("Unsupported priority class: %s" % priority)
+        if timeout is not None and \
+                (not isinstance(timeout, (int, float)) or timeout < 0):
+            raise ValueError("Timeout has to be a non-negative number")
+        if lane is not None and lane not in LANES:
+            raise ValueError("Unsupported collect lane: %s" % lane)
+        if (min_interval is None) != (max_interval is None):
+            raise ValueError("Adaptive interval needs both min_interval "
+                             "and max_interval")
+        if min_interval is not None and \
+                not 0 < min_interval <= interval <= max_interval:
+            raise ValueError("Adaptive interval needs 0 < min_interval <= "
+                             "interval <= max_interval")
+        if change_threshold is not None and change_threshold < 0:
+            raise ValueError("Change threshold has to be non-negative")
+        if sample_in_process:
+            try:
+                pickle.dumps(sampling_function)
+            except (pickle.PicklingError, TypeError):
+                raise TypeError("Sampling function has to be picklable "
+                                "to sample in process")
         super(Metric, self).__init__(
             name=name,
             entity_id=systemUUID().get_uuid(name),
@@ -59,6 +139,17 @@ class Metric(Entity):
         self.interval = interval
         self.aggregation_size = aggregation_size
         self.sampling_function = sampling_function
+        self.sample_in_process = sample_in_process
+        self.overrun_policy = overrun_policy
+        self.catch_up_rate = catch_up_rate
+        self.priority = priority
+        self.staggered = staggered
+        self.timeout = timeout
+        self.lane = lane
+        self.clock_aligned = clock_aligned
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.change_threshold = change_threshold
 
     def register(self, dcc_obj, reg_entity_id):
         return RegisteredMetric(self, dcc_obj, reg_entity_id)
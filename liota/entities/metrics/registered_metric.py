@@ -30,16 +30,69 @@
 #  THE POSSIBILITY OF SUCH DAMAGE.                                            #
 # ----------------------------------------------------------------------------#
 
-from Queue import Queue
 import inspect
 import logging
+import math
+from numbers import Number
+from threading import Lock
 from liota.core import metric_handler
+from liota.core.bounded_queue import SampleBuffer
+from liota.core.placement import wall_clock_run_time
+from liota.core.state_snapshot import plain_samples
 from liota.entities.registered_entity import RegisteredEntity
-from liota.lib.utilities.utility import getUTCmillis
+from liota.lib.utilities.histogram import Histogram
+from liota.lib.utilities.clock import monotonic as _time, monotonic_ms, \
+    wall_ms
 
 
 log = logging.getLogger(__name__)
 
+# Overrun policies, i.e., what to do with runs of a metric missed because
+# a collection or the scheduler was late
+OVERRUN_SKIP = "skip"
+OVERRUN_COALESCE = "coalesce"
+OVERRUN_CATCH_UP = "catch_up"
+
+OVERRUN_POLICIES = (OVERRUN_SKIP, OVERRUN_COALESCE, OVERRUN_CATCH_UP)
+
+# Priority classes, highest first
+PRIORITY_HIGH = "high"
+PRIORITY_NORMAL = "normal"
+PRIORITY_LOW = "low"
+
+PRIORITY_CLASSES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+
+# Collect lanes, see metric_handler.CollectLanes
+LANE_FAST = "fast"
+LANE_SLOW = "slow"
+
+LANES = (LANE_FAST, LANE_SLOW)
+
+# Weight of the latest run in the moving average of collect duration
+COLLECT_EWMA_ALPHA = 0.3
+
+# Adaptive intervals: change of a value relative to the previous one that
+# shortens the interval if the metric has no change_threshold, number of
+# values in a row without such a change that lengthen it, and the factor it
+# is then lengthened by
+ADAPT_CHANGE_RATIO = 0.05
+ADAPT_QUIET_RUNS = 3
+ADAPT_GROWTH = 1.5
+
+# A metric failing, i.e., raising an exception or timing out, n runs in a row
+# is backed off for 2^n intervals, up to this many intervals
+FAILURE_BACKOFF_MAX = 32
+
+# Stages of the pipeline of a metric latency is recorded for:
+#   schedule       - lag of dispatch for collection behind _next_run_time
+#   collect_queue  - wait in collect_queue
+#   sample         - sampling function
+#   send_queue     - wait in send queue
+#   format         - _format_data of the DCC
+#   send           - send of the DCCComms
+LATENCY_STAGES = ("schedule", "collect_queue", "sample", "send_queue",
+                  "format", "send")
+
 
 class RegisteredMetric(RegisteredEntity):
 
@@ -48,26 +101,168 @@ class RegisteredMetric(RegisteredEntity):
                                   ref_dcc=ref_dcc,
                                   reg_entity_id=reg_entity_id)
         self.flag_alive = False
+        # Index of the priority class of this metric in PRIORITY_CLASSES
+        self.priority_class = PRIORITY_CLASSES.index(ref_metric.priority)
+        # Collect lane of this metric, and exponentially weighted moving
+        # average of its sampling duration in milliseconds, None until the
+        # first run
+        self.lane = ref_metric.lane or LANE_FAST
+        self.collect_ewma_ms = None
+        # Interval in seconds the metric runs at, which moves between
+        # min_interval and max_interval if the interval is adaptive
+        self.current_interval = ref_metric.interval
+        self._last_value = None
+        self._quiet_runs = 0
         self._next_run_time = None
+        # Time the next run is due on the schedule of the metric, which may
+        # be earlier than _next_run_time while catching up
+        self._due_time = None
         self.current_aggregation_size = 0
+        # Times this metric was put in collect_queue and in its send lane,
+        # set by metric_handler
+        self.collect_enqueued_at = None
+        self.send_enqueued_at = None
+        # Latency histograms in milliseconds, by stage
+        self.latency = dict(
+            (stage, Histogram()) for stage in LATENCY_STAGES)
         # -------------------------------------------------------------------
-        # Elements in this queue are (ts, v) pairs.
+        # Samples are (ts, v) pairs, buffered in columns.
         #
-        self.values = Queue()
+        capacity, policy = metric_handler.get_metric_buffer_config()
+        if capacity > 0:
+            capacity = max(capacity, self.ref_entity.aggregation_size)
+        self.values = SampleBuffer(capacity, policy,
+                                   on_drop=self._sample_dropped)
+        # Number of drops due to overflow, by stage
+        self.num_dropped = {"collect": 0, "send": 0, "buffer": 0}
+        # Number of runs skipped and of runs started late due to overruns
+        self.num_skipped = 0
+        self.num_late = 0
+        # Number of runs, of runs raising an exception, of runs timed out, and
+        # of runs failing in a row
+        self.num_runs = 0
+        self.num_errors = 0
+        self.num_timeouts = 0
+        self.failures_in_row = 0
+        self._failed = False
+        self._stats_lock = Lock()
+        # Guards current_aggregation_size, which push() updates from device
+        # threads while a collector may update it too
+        self._aggregation_lock = Lock()
 
     def start_collecting(self):
+        """
+        Starts collecting the metric.  A metric without a sampling function
+        is not scheduled, it is only fed through push() and push_many().
+        State of the metric in the state snapshot, if any, is restored.
+        """
         self.flag_alive = True
         # TODO: Add a check to ensure that start_collecting for a metric is
         # called only once by the client code
         metric_handler.initialize()
-        self._next_run_time = getUTCmillis() + (self.ref_entity.interval * 1000)
+        metric_handler.register_metric(self)
+        restored_run_time = metric_handler.restore_state(self)
+        if self.ref_entity.sampling_function is None:
+            return
+        now = monotonic_ms()
+        interval = self.current_interval * 1000
+        if restored_run_time is not None and interval > 0:
+            # The schedule goes on from where it was, runs missed while
+            # liota was down are skipped
+            self._next_run_time = restored_run_time + interval * max(
+                int(math.ceil((now - restored_run_time) / float(interval))),
+                0)
+        elif self.ref_entity.clock_aligned:
+            self._next_run_time = wall_clock_run_time(
+                interval, now, wall_ms() - now)
+        else:
+            self._next_run_time = \
+                metric_handler.get_placement().first_run_time(
+                    interval,
+                    now,
+                    self.ref_entity.staggered
+                )
+        self._due_time = self._next_run_time
         metric_handler.event_ds.put_and_notify(self)
 
+    def get_state(self):
+        """
+        Returns the state of the metric persisted across restarts, see
+        liota.core.state_snapshot.
+        """
+        next_run_time = None
+        if self._due_time is not None:
+            next_run_time = self._due_time + wall_ms() - monotonic_ms()
+        return (next_run_time,
+                self.current_interval,
+                self.current_aggregation_size,
+                plain_samples(self.values.snapshot()))
+
+    def set_state(self, state):
+        """
+        Restores state returned by get_state(), before the metric starts
+        collecting.  Returns the next run time on the monotonic clock, or
+        None if the metric was not scheduled.
+        """
+        next_run_time, interval, aggregation_size, samples = state
+        if self.ref_entity.min_interval is not None:
+            self.current_interval = min(max(interval,
+                                            self.ref_entity.min_interval),
+                                        self.ref_entity.max_interval)
+        for sample in samples:
+            self.values.put(sample)
+        with self._aggregation_lock:
+            self.current_aggregation_size += aggregation_size
+        if next_run_time is None:
+            return None
+        return next_run_time - wall_ms() + monotonic_ms()
+
     def stop_collecting(self):
         self.flag_alive = False
+        if metric_handler.event_ds is not None:
+            metric_handler.event_ds.remove(self)
         log.debug("Metric %s is marked for deletion" %
                  str(self.ref_entity.name))
 
+    def push(self, value, ts=None):
+        """
+        Buffers a value of the metric as if it had been collected, and queues
+        the metric for sending once aggregation_size values are buffered.
+        Neither the scheduler nor a collector thread is involved, so device
+        callback threads can push values of event driven metrics.  Safe to
+        call from any thread.
+
+        :param value: Value of the metric, None (filtered out) is ignored.
+        :param ts: Timestamp in milliseconds since epoch, now if None.
+        :raises RuntimeError: If called before start_collecting().
+        """
+        self._check_pushable()
+        if value is None:
+            return
+        self.record_collected_data((wall_ms() if ts is None else ts, value))
+        metric_handler.send_if_ready(self)
+
+    def push_many(self, samples):
+        """
+        Like push(), for a list of values or (ts, value) pairs.
+        """
+        self._check_pushable()
+        now = wall_ms()
+        samples = [sample if isinstance(sample, tuple) else (now, sample)
+                   for sample in samples if sample is not None]
+        if not samples:
+            return
+        self.record_collected_data(samples)
+        metric_handler.send_if_ready(self)
+
+    def _check_pushable(self):
+        # Until the metric handler is initialized, there is no queue to send
+        # values through, they would be buffered and never sent
+        if not metric_handler.is_initialization_done:
+            raise RuntimeError(
+                "Values of metric %s pushed before start_collecting()"
+                % self.ref_entity.name)
+
     def add_collected_data(self, collected_data):
         if isinstance(collected_data, list):
             for data_sample in collected_data:
@@ -77,15 +272,213 @@ class RegisteredMetric(RegisteredEntity):
             self.values.put(collected_data)
             return 1
         else:
-            self.values.put((getUTCmillis(), collected_data))
+            self.values.put((self.get_run_timestamp(), collected_data))
             return 1
 
+    def get_run_timestamp(self):
+        """
+        Returns the timestamp of values sampled by the current run: now, or
+        for clock aligned metrics, the multiple of the interval the run is
+        due at on the wall clock, whenever it actually runs.
+        """
+        now = wall_ms()
+        if not self.ref_entity.clock_aligned or self._due_time is None:
+            return now
+        return self._snap_to_wall_clock(
+            self._due_time + now - monotonic_ms(), round)
+
+    def _snap_to_wall_clock(self, time_ms, rounding):
+        interval = self.current_interval * 1000
+        if interval <= 0:
+            return long(time_ms)
+        return long(rounding(time_ms / float(interval)) * interval)
+
+    def count_drop(self, stage):
+        with self._stats_lock:
+            self.num_dropped[stage] += 1
+
+    def _sample_dropped(self, sample):
+        self.count_drop("buffer")
+
+    def get_timeout(self):
+        """
+        Returns seconds the sampling function may run, 0 for no timeout.
+        """
+        if self.ref_entity.timeout is not None:
+            return self.ref_entity.timeout
+        return metric_handler.get_collect_timeout()
+
+    def timed_out(self):
+        """
+        Called by the watchdog when the current run has taken longer than the
+        timeout.  The next run is backed off.
+        """
+        with self._stats_lock:
+            self.num_timeouts += 1
+            self._failed = True
+        # The run is taking at least that long
+        self._update_collect_ewma(self.get_timeout() * 1000)
+
+    def collect_failed(self):
+        """
+        Called when the current run raised an exception.  The next run is
+        backed off.
+        """
+        with self._stats_lock:
+            self.num_errors += 1
+            self._failed = True
+
+    def get_error_rate(self):
+        """
+        Returns the fraction of runs raising an exception.
+        """
+        with self._stats_lock:
+            return float(self.num_errors) / self.num_runs \
+                if self.num_runs else 0.0
+
+    def _take_backoff_ms(self, interval):
+        with self._stats_lock:
+            if not self._failed:
+                self.failures_in_row = 0
+                return 0
+            self._failed = False
+            self.failures_in_row += 1
+            if interval <= 0:
+                return 0
+            return min(2 ** self.failures_in_row, FAILURE_BACKOFF_MAX) \
+                * interval
+
+    def _update_collect_ewma(self, duration_ms):
+        if self.collect_ewma_ms is None:
+            self.collect_ewma_ms = duration_ms
+        else:
+            self.collect_ewma_ms += \
+                COLLECT_EWMA_ALPHA * (duration_ms - self.collect_ewma_ms)
+
+    def _adapt_interval(self, value):
+        """
+        Shortens or lengthens an adaptive interval according to how much
+        value changed from the previous one.  The next set_next_run_time()
+        applies it.
+        """
+        value = getattr(value, 'magnitude', value)
+        if not isinstance(value, Number):
+            return
+        last, self._last_value = self._last_value, value
+        if last is None:
+            return
+        metric = self.ref_entity
+        threshold = metric.change_threshold
+        if threshold is None:
+            threshold = ADAPT_CHANGE_RATIO * abs(last)
+        if abs(value - last) > threshold:
+            self._quiet_runs = 0
+            interval = max(metric.min_interval, self.current_interval / 2.0)
+        else:
+            self._quiet_runs += 1
+            if self._quiet_runs < ADAPT_QUIET_RUNS:
+                return
+            self._quiet_runs = 0
+            interval = min(metric.max_interval,
+                           self.current_interval * ADAPT_GROWTH)
+        if interval != self.current_interval:
+            log.debug("Interval of metric %s set to %s s" %
+                      (str(metric.name), interval))
+            self.current_interval = interval
+
+    def get_lane(self, slow_threshold_ms):
+        """
+        Returns the collect lane of the metric: the lane it is pinned to, or
+        the slow lane once its average sampling duration reaches
+        slow_threshold_ms, and the fast lane again once it drops below half
+        of it.
+        """
+        if self.ref_entity.lane is not None:
+            return self.ref_entity.lane
+        if self.collect_ewma_ms is not None:
+            if self.collect_ewma_ms >= slow_threshold_ms:
+                self.lane = LANE_SLOW
+            elif self.collect_ewma_ms < slow_threshold_ms / 2.0:
+                self.lane = LANE_FAST
+        return self.lane
+
+    def record_latency(self, stage, latency_ms):
+        self.latency[stage].record(latency_ms)
+
+    def get_latency_ms(self):
+        """
+        Returns the sum of mean latencies of all stages in milliseconds.
+        """
+        return sum(histogram.mean() for histogram in self.latency.values())
+
     def get_next_run_time(self):
         return self._next_run_time
 
     def set_next_run_time(self):
-        self._next_run_time = self._next_run_time + \
-            (self.ref_entity.interval * 1000)
+        """
+        Moves the metric to its next run.  If that run is already overdue,
+        the overrun policy of the metric decides when it happens:
+
+            *  skip      - runs missed are skipped, the next run is at the
+                           next time due on the schedule of the metric
+            *  coalesce  - runs missed are coalesced into one run right away,
+                           the schedule of the metric restarts from it
+            *  catch_up  - every run missed happens, but no more often than
+                           catch_up_rate times per interval
+
+        A run that failed delays the next run by 2^n intervals, n being the
+        number of runs failed in a row.  The interval is the current one,
+        which values collected move if the interval is adaptive.
+        """
+        interval = self.current_interval * 1000
+        now = monotonic_ms()
+        if interval <= 0:
+            # Metrics without an interval run again right away, there is no
+            # schedule to overrun nor interval to back off by
+            self._take_backoff_ms(interval)
+            self._due_time = self._next_run_time = now
+            log.debug("Set next run time to:" + str(self._next_run_time))
+            return
+        self._due_time += interval
+        if self.ref_entity.clock_aligned:
+            # Back on the wall clock multiple, should the wall clock have
+            # been stepped or the run coalesced
+            wall_offset = wall_ms() - now
+            self._due_time = self._snap_to_wall_clock(
+                self._due_time + wall_offset, round) - wall_offset
+        if self._due_time > now:
+            self._next_run_time = self._due_time
+        else:
+            policy = self.ref_entity.overrun_policy
+            num_missed = int((now - self._due_time) // interval) + 1
+            if policy == OVERRUN_SKIP:
+                self._due_time += num_missed * interval
+                self._next_run_time = self._due_time
+                self.num_skipped += num_missed
+            elif policy == OVERRUN_COALESCE:
+                self._due_time = now
+                self._next_run_time = now
+                self.num_skipped += num_missed - 1
+                self.num_late += 1
+            else:
+                self._next_run_time = max(
+                    self._due_time,
+                    now + interval / float(self.ref_entity.catch_up_rate)
+                )
+                self.num_late += 1
+            log.debug("Metric %s overran by %d runs" %
+                      (str(self.ref_entity.name), num_missed))
+        backoff_ms = self._take_backoff_ms(interval)
+        if backoff_ms:
+            self._due_time = self._next_run_time = max(
+                self._next_run_time, now + backoff_ms)
+            if self.ref_entity.clock_aligned:
+                wall_offset = wall_ms() - now
+                self._due_time = self._next_run_time = \
+                    self._snap_to_wall_clock(
+                        self._due_time + wall_offset, math.ceil) - wall_offset
+            log.warning("Metric %s failed, backed off for %d ms" %
+                        (str(self.ref_entity.name), backoff_ms))
         log.debug("Set next run time to:" + str(self._next_run_time))
 
     def is_ready_to_send(self):
@@ -95,25 +488,75 @@ class RegisteredMetric(RegisteredEntity):
                   str(self.ref_entity.aggregation_size))
         return self.current_aggregation_size >= self.ref_entity.aggregation_size
 
+    def count_run(self):
+        with self._stats_lock:
+            self.num_runs += 1
+
     def collect(self):
+        self.count_run()
+        start = _time()
+        collected_data = self.sample()
+        duration_ms = (_time() - start) * 1000
+        self.record_latency("sample", duration_ms)
+        self._update_collect_ewma(duration_ms)
+        self.record_collected_data(collected_data)
+
+    def sample(self):
+        """
+        Calls the sampling function and returns what it returned.  If the
+        sampling function is a coroutine function, a coroutine is returned.
+        """
         log.debug("Collecting values for the resource {0} ".format(
             self.ref_entity.name))
         self.args_required = len(inspect.getargspec(
             self.ref_entity.sampling_function)[0])
+        if self.ref_entity.sample_in_process:
+            return metric_handler.get_process_pool().apply(
+                metric_handler.sample_in_worker,
+                (self.ref_entity.sampling_function, self.args_required,
+                 self.get_run_timestamp()
+                 if self.ref_entity.clock_aligned else None)
+            )
         if self.args_required is not 0:
-            self.collected_data = self.ref_entity.sampling_function(1)
+            return self.ref_entity.sampling_function(1)
         else:
-            self.collected_data = self.ref_entity.sampling_function()
+            return self.ref_entity.sampling_function()
+
+    def record_collected_data(self, collected_data):
+        """
+        Buffers data returned by the sampling function and accounts for it in
+        the aggregation size.
+        """
+        self.collected_data = collected_data
         log.debug("Size of the queue {0}".format(self.values.qsize()))
         #  Sampling function might return 'None' because of filtering
         if self.collected_data is not None:
             log.info("{0} Sample Value: {1}".format(
                 self.ref_entity.name, self.collected_data))
             no_of_values_added = self.add_collected_data(self.collected_data)
-            self.current_aggregation_size = self.current_aggregation_size + no_of_values_added
+            if self.ref_entity.min_interval is not None:
+                samples = collected_data \
+                    if isinstance(collected_data, list) else [collected_data]
+                for sample in samples:
+                    self._adapt_interval(
+                        sample[1] if isinstance(sample, tuple) else sample)
+            with self._aggregation_lock:
+                self.current_aggregation_size = self.current_aggregation_size + no_of_values_added
 
     def reset_aggregation_size(self):
-        self.current_aggregation_size = 0
+        with self._aggregation_lock:
+            self.current_aggregation_size = 0
+
+    def claim_ready_to_send(self):
+        """
+        Returns True, and resets the aggregation size, if the metric is ready
+        to send.  Of concurrent callers, only one claims a given aggregation.
+        """
+        with self._aggregation_lock:
+            if not self.is_ready_to_send():
+                return False
+            self.current_aggregation_size = 0
+            return True
 
     def send_data(self):
         log.info("Publishing values for the resource {0} ".format(
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2016 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import logging
+
+from liota.core import metric_handler
+from liota.entities.metrics.metric import Metric
+from liota.entities.metrics.registered_metric import RegisteredMetric
+
+log = logging.getLogger(__name__)
+
+
+class SamplerGroup(Metric):
+    """
+    Samples one source for several metrics.  The sampling function of the
+    group returns a snapshot, e.g., a dict of all counters read from a /proc
+    file, once per interval, and each metric of the group gets a value
+    extracted from it.  The group takes one scheduler entry and one collector
+    per interval, however many metrics it feeds.
+
+        group = SamplerGroup("Network", interval=5,
+                             sampling_function=read_rx_tx_bytes)
+        group.add(iotcc.register(Metric("Bytes Received", interval=5)),
+                  lambda rx_tx: rx_tx[0])
+        group.add(iotcc.register(Metric("Bytes Sent", interval=5)),
+                  lambda rx_tx: rx_tx[1])
+        group.start_collecting()
+
+    Metrics of the group should not have a sampling function of their own,
+    their values are pushed by the group.  The sampling function of the
+    group is called without arguments.
+    """
+
+    def __init__(self, name, interval=60, sampling_function=None, **kwargs):
+        if not callable(sampling_function):
+            raise TypeError("Sampling function of a sampler group is "
+                            "required")
+        super(SamplerGroup, self).__init__(
+            name=name,
+            entity_type="SamplerGroup",
+            interval=interval,
+            sampling_function=sampling_function,
+            **kwargs
+        )
+        self.members = []  # (RegisteredMetric, extract) pairs
+        self._reg_group = RegisteredSamplerGroup(self)
+
+    def add(self, reg_metric, extract=None):
+        """
+        :param reg_metric: RegisteredMetric fed by the group.
+        :param extract: Function returning the value of the metric from a
+            snapshot, or None if there is none.  The snapshot itself is the
+            value if extract is None.
+        """
+        if not isinstance(reg_metric, RegisteredMetric):
+            raise TypeError("RegisteredMetric object is expected.")
+        self.members.append((reg_metric, extract))
+
+    def start_collecting(self):
+        for reg_metric, _ in self.members:
+            reg_metric.start_collecting()
+        self._reg_group.start_collecting()
+
+    def stop_collecting(self):
+        self._reg_group.stop_collecting()
+        for reg_metric, _ in self.members:
+            reg_metric.stop_collecting()
+
+
+class RegisteredSamplerGroup(RegisteredMetric):
+    """
+    Scheduler entry of a SamplerGroup.  It is collected like any metric, but
+    fans its samples out to the metrics of the group instead of buffering
+    them, and is never sent itself.
+    """
+
+    def __init__(self, ref_group):
+        super(RegisteredSamplerGroup, self).__init__(ref_metric=ref_group,
+                                                     ref_dcc=None,
+                                                     reg_entity_id=None)
+
+    def sample(self):
+        if self.ref_entity.sample_in_process:
+            # The snapshot is not a sample, it is not time-stamped
+            return metric_handler.get_process_pool().apply(
+                self.ref_entity.sampling_function)
+        return self.ref_entity.sampling_function()
+
+    def record_collected_data(self, snapshot):
+        if snapshot is None:
+            return
+        ts = self.get_run_timestamp()
+        for reg_metric, extract in self.ref_entity.members:
+            try:
+                value = snapshot if extract is None else extract(snapshot)
+            except Exception:
+                log.exception("Error extracting value of %s from %s" %
+                              (reg_metric.ref_entity.name,
+                               self.ref_entity.name))
+                continue
+            reg_metric.push(value, ts)
+
+    def claim_ready_to_send(self):
+        return False
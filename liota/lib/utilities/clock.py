@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+"""
+Clocks of liota.
+
+    *  monotonic(), monotonic_ms()  - never go backwards nor jump, for
+                                      deadlines, intervals and durations
+    *  coarse_ms()                  - cheaper monotonic milliseconds with a
+                                      resolution of a few milliseconds, for
+                                      hot paths
+    *  wall_ms()                    - UTC milliseconds since epoch, for
+                                      stamping samples
+
+wall_ms() is the monotonic clock plus an anchor taken from the wall clock.
+The anchor is checked against the wall clock every WALL_RESYNC_SEC, and
+moved if the wall clock was stepped (by NTP on gateways without an RTC, for
+instance), so that steps show in timestamps of samples but never in
+scheduling.
+
+On Linux, clock_gettime() is called through ctypes.  Elsewhere, the wall
+clock is used with backward steps cancelled out.
+
+For tests, inject_wall_jump() steps the wall clock as seen by this module,
+and use_virtual_clock() has liota read a VirtualClock instead, e.g., to
+replay scheduling faster than real time, see liota.core.scheduler_harness.
+"""
+
+from contextlib import contextmanager
+import ctypes
+import logging
+import sys
+import time
+from threading import Lock
+
+log = logging.getLogger(__name__)
+
+# Linux clock ids
+CLOCK_MONOTONIC = 1
+CLOCK_MONOTONIC_COARSE = 6
+
+# Seconds between checks of the wall clock anchor, and milliseconds the wall
+# clock has to differ from it to be considered stepped
+WALL_RESYNC_SEC = 10
+WALL_STEP_MS = 1000
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+def _load_clock_gettime():
+    if not sys.platform.startswith("linux"):
+        return None
+    for library in ("libc.so.6", "librt.so.1"):
+        try:
+            # PyDLL keeps the GIL during calls, which is cheaper for a call
+            # this short.  The GIL may switch right after the call though,
+            # so every reading fills a timespec of its own.
+            clock_gettime = ctypes.PyDLL(library).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.restype = ctypes.c_int
+        return clock_gettime
+    return None
+
+
+_clock_gettime = _load_clock_gettime()
+
+
+def _make_readers(clock_id):
+    """
+    Returns functions reading the given clock in seconds and in
+    milliseconds, or None if it is not available.
+    """
+    if _clock_gettime is None:
+        return None
+    if _clock_gettime(clock_id, ctypes.byref(_timespec())) != 0:
+        return None
+
+    # Default arguments are the cheapest lookups
+    def read_seconds(clock_gettime=_clock_gettime, clock_id=clock_id,
+                     timespec=_timespec, byref=ctypes.byref):
+        ts = timespec()
+        clock_gettime(clock_id, byref(ts))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+
+    def read_ms(clock_gettime=_clock_gettime, clock_id=clock_id,
+                timespec=_timespec, byref=ctypes.byref):
+        ts = timespec()
+        clock_gettime(clock_id, byref(ts))
+        return ts.tv_sec * 1000 + ts.tv_nsec // 1000000
+
+    return read_seconds, read_ms
+
+
+_fallback_lock = Lock()
+_fallback_last = 0.0
+_fallback_offset = 0.0
+
+
+def _fallback_monotonic():
+    global _fallback_last, _fallback_offset
+    with _fallback_lock:
+        now = time.time() + _fallback_offset
+        if now < _fallback_last:
+            _fallback_offset += _fallback_last - now
+            now = _fallback_last
+        _fallback_last = now
+        return now
+
+
+def _fallback_monotonic_ms():
+    return long(_fallback_monotonic() * 1000)
+
+
+monotonic, monotonic_ms = _make_readers(CLOCK_MONOTONIC) or \
+    (_fallback_monotonic, _fallback_monotonic_ms)
+coarse_ms = (_make_readers(CLOCK_MONOTONIC_COARSE) or
+             (monotonic, monotonic_ms))[1]
+
+
+# Test mode only: offset added to the wall clock
+_wall_jump_ms = 0
+
+
+def _read_wall_ms():
+    return time.time() * 1000 + _wall_jump_ms
+
+
+_wall_lock = Lock()
+_wall_anchor_ms = long(_read_wall_ms()) - monotonic_ms()
+_wall_resync_at = monotonic_ms() + WALL_RESYNC_SEC * 1000
+
+
+def wall_ms():
+    now = monotonic_ms()
+    if now >= _wall_resync_at:
+        _resync_wall_anchor(now)
+    return _wall_anchor_ms + now
+
+
+def _resync_wall_anchor(now):
+    global _wall_anchor_ms, _wall_resync_at
+    with _wall_lock:
+        if now < _wall_resync_at:
+            return
+        anchor_ms = long(_read_wall_ms()) - now
+        if abs(anchor_ms - _wall_anchor_ms) >= WALL_STEP_MS:
+            log.warning("Wall clock stepped by %d ms" %
+                        (anchor_ms - _wall_anchor_ms))
+            _wall_anchor_ms = anchor_ms
+        _wall_resync_at = now + WALL_RESYNC_SEC * 1000
+
+
+def inject_wall_jump(jump_ms):
+    """
+    Test mode: steps the wall clock as seen by this module by jump_ms, and
+    has wall_ms() notice it on its next call.
+    """
+    global _wall_jump_ms, _wall_resync_at
+    with _wall_lock:
+        _wall_jump_ms += jump_ms
+        _wall_resync_at = 0
+
+
+class VirtualClock:
+    """
+    Test mode: monotonic and wall clock that only move when advanced.
+    """
+
+    def __init__(self, now_ms=0, wall_offset_ms=None):
+        """
+        :param now_ms: Initial time of the monotonic clock.
+        :param wall_offset_ms: Wall clock minus monotonic clock, the real
+            one if None.
+        """
+        self.now_ms = now_ms
+        if wall_offset_ms is None:
+            wall_offset_ms = long(_read_wall_ms()) - now_ms
+        self.wall_offset_ms = wall_offset_ms
+
+    def monotonic(self):
+        return self.now_ms / 1000.0
+
+    def monotonic_ms(self):
+        return self.now_ms
+
+    def wall_ms(self):
+        return self.wall_offset_ms + self.now_ms
+
+    def advance(self, ms):
+        if ms < 0:
+            raise ValueError("Virtual clock cannot go backwards")
+        self.now_ms += ms
+
+    def advance_to(self, now_ms):
+        """
+        Moves the clock to now_ms, unless it is already past it.
+        """
+        if now_ms > self.now_ms:
+            self.now_ms = now_ms
+
+
+@contextmanager
+def use_virtual_clock(clock):
+    """
+    Test mode: within the with block, liota modules already loaded read the
+    VirtualClock clock instead of the clocks of this module.  Clocks are
+    swapped in the namespaces of modules, which are restored on exit, so
+    that reading the clock costs the same in normal operation.  Threads
+    running meanwhile see either clock.
+    """
+    this_module = sys.modules[__name__]
+    replacements = {
+        monotonic: clock.monotonic,
+        monotonic_ms: clock.monotonic_ms,
+        coarse_ms: clock.monotonic_ms,
+        wall_ms: clock.wall_ms,
+    }
+    swapped = []  # (namespace, name, function) triples
+    for name, module in sys.modules.items():
+        if module is None or module is this_module or \
+                not name.startswith("liota"):
+            continue
+        namespace = vars(module)
+        for attribute, value in namespace.items():
+            try:
+                replacement = replacements.get(value)
+            except TypeError:  # unhashable
+                continue
+            if replacement is not None:
+                swapped.append((namespace, attribute, value))
+                namespace[attribute] = replacement
+    try:
+        yield clock
+    finally:
+        for namespace, attribute, value in swapped:
+            namespace[attribute] = value
@@ -34,7 +34,7 @@ from abc import abstractmethod
 from numbers import Number
 import logging
 
-from liota.lib.utilities.utility import getUTCmillis
+from liota.lib.utilities.clock import coarse_ms
 from liota.lib.utilities.filters.filter import Filter
 
 log = logging.getLogger(__name__)
@@ -63,7 +63,7 @@ class WindowingScheme(Filter):
         self.window_size_sec = window_size_sec
         #  To track whether at-least one sample has been passed after filtering within a window
         self.sample_passed = False
-        self.next_window_time = getUTCmillis() + (self.window_size_sec * 1000)
+        self.next_window_time = coarse_ms() + (self.window_size_sec * 1000)
 
     def filter(self, v):
         """
@@ -84,7 +84,7 @@ class WindowingScheme(Filter):
         :return: Filtered value (or) collected value at the end of every time window.
         """
         # Next window time has elapsed.
-        if getUTCmillis() >= self.next_window_time:
+        if coarse_ms() >= self.next_window_time:
             #  At-least one sample has not passed so far during this window.
             if not self.sample_passed and filtered_value is None:
                 self._set_next_window_time()
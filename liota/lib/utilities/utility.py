@@ -34,7 +34,6 @@
 
 """
 
-from datetime import datetime
 import ast
 import hashlib
 import logging
@@ -49,6 +48,8 @@ import json
 import subprocess
 import time
 
+from liota.lib.utilities.clock import wall_ms
+
 log = logging.getLogger(__name__)
 
 
@@ -148,7 +149,11 @@ def get_disk_name():
 
 
 def getUTCmillis():
-    return long(1000 * ((datetime.utcnow() - datetime(1970, 1, 1)).total_seconds()))
+    """
+    UTC milliseconds since epoch, for timestamps.  Deadlines and durations
+    should use the monotonic clocks of liota.lib.utilities.clock instead.
+    """
+    return wall_ms()
 
 
 def mkdir(path):
@@ -164,6 +164,12 @@ setup(
     # Installation requirement
     install_requires=requirements,
 
+    # Optional requirements, e.g., pip install liota[asyncio]
+    extras_require={
+        # 'engine = asyncio' in liota.conf; futures backports the executor
+        'asyncio': ['trollius', 'futures'],
+    },
+
     # 'data_file'(conf_files) at custom location
     data_files=get_data_files()
 )
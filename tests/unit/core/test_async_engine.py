@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import time
+import unittest
+
+import mock
+
+from liota.core import async_engine
+from liota.core.async_engine import AsyncMetricEngine
+from liota.dcc_comms.dcc_comms import DCCComms
+from liota.dccs.graphite import Graphite
+from liota.entities.metrics.metric import Metric
+from liota.lib.utilities.clock import monotonic_ms
+
+if async_engine.asyncio is not None:
+    from trollius import From, Return
+
+    @async_engine.asyncio.coroutine
+    def coroutine_sampling_function():
+        yield From(async_engine.asyncio.sleep(0))
+        raise Return(42)
+
+    class CoroutineComms(DCCComms):
+        """
+        DCCComms whose send is a coroutine.
+        """
+
+        def __init__(self):
+            self.messages = []
+
+        def _connect(self):
+            pass
+
+        def _disconnect(self):
+            pass
+
+        @async_engine.asyncio.coroutine
+        def send(self, message, msg_attr=None):
+            yield From(async_engine.asyncio.sleep(0))
+            self.messages.append(message)
+
+        def receive(self, msg_attr=None):
+            pass
+
+
+@unittest.skipIf(async_engine.asyncio is None, "trollius is not installed")
+class AsyncMetricEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = AsyncMetricEngine(executor_size=2)
+        self.comms = mock.create_autospec(DCCComms)
+        self.graphite = Graphite(self.comms)
+
+    def tearDown(self):
+        self.engine.put_and_notify(SystemExit())
+
+    def _run_metric(self, sampling_function, graphite=None, sent=None):
+        graphite = graphite or self.graphite
+        sent = sent or (lambda: self.comms.send.called)
+        reg_metric = graphite.register(Metric(
+            "test", interval=0.05, sampling_function=sampling_function))
+        reg_metric.flag_alive = True
+        reg_metric._due_time = reg_metric._next_run_time = monotonic_ms()
+        self.engine.put_and_notify(reg_metric)
+        deadline = time.time() + 5
+        while not sent() and time.time() < deadline:
+            time.sleep(0.01)
+        reg_metric.flag_alive = False
+        self.engine.remove(reg_metric)
+
+    def test_coroutine_sampling_function(self):
+        self._run_metric(coroutine_sampling_function)
+        self.assertTrue(self.comms.send.called)
+        self.assertTrue(self.comms.send.call_args[0][0].startswith("test 42 "))
+
+    def test_blocking_sampling_function(self):
+        self._run_metric(lambda: 7)
+        self.assertTrue(self.comms.send.called)
+        self.assertTrue(self.comms.send.call_args[0][0].startswith("test 7 "))
+
+    def test_coroutine_send(self):
+        comms = CoroutineComms()
+        self._run_metric(lambda: 5, Graphite(comms),
+                         lambda: bool(comms.messages))
+        self.assertEquals(len(comms.messages), 1)
+        self.assertTrue(comms.messages[0].startswith("test 5 "))
+
+if __name__ == '__main__':
+    unittest.main()
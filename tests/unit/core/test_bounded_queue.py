@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import unittest
+from Queue import Full
+
+import mock
+
+from liota.core.bounded_queue import BoundedQueue, SampleBuffer, \
+    PriorityClassQueue, DROP_OLDEST, DROP_NEWEST, BLOCK, COALESCE, \
+    STRICT, WEIGHTED
+
+
+class Item(object):
+    pass
+
+
+def drain(queue):
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return items
+
+
+class BoundedQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dropped = []
+
+    def test_init_policy(self):
+        """Overflow policy must be one of the supported ones"""
+        self.assertRaises(ValueError, lambda: BoundedQueue(1, "discard"))
+
+    def test_unbounded(self):
+        queue = BoundedQueue(0, DROP_NEWEST, on_drop=self.dropped.append)
+        for i in range(100):
+            queue.put(i)
+        self.assertEquals(queue.qsize(), 100)
+        self.assertEquals(queue.num_dropped, 0)
+
+    def test_drop_oldest(self):
+        queue = BoundedQueue(2, DROP_OLDEST, on_drop=self.dropped.append)
+        for i in range(4):
+            queue.put(i)
+        self.assertEquals(drain(queue), [2, 3])
+        self.assertEquals(self.dropped, [0, 1])
+        self.assertEquals(queue.num_dropped, 2)
+
+    def test_drop_newest(self):
+        queue = BoundedQueue(2, DROP_NEWEST, on_drop=self.dropped.append)
+        for i in range(4):
+            self.assertEquals(queue.put(i), None if i < 2 else i)
+        self.assertEquals(drain(queue), [0, 1])
+        self.assertEquals(self.dropped, [2, 3])
+
+    def test_block(self):
+        queue = BoundedQueue(1, BLOCK, on_drop=self.dropped.append)
+        queue.put(0)
+        self.assertRaises(Full, lambda: queue.put(1, block=False))
+        self.assertRaises(Full, lambda: queue.put(1, timeout=0.01))
+        self.assertEquals(drain(queue), [0])
+        self.assertEquals(self.dropped, [])
+
+    def test_coalesce(self):
+        queue = BoundedQueue(3, COALESCE, on_drop=self.dropped.append)
+        first, second = Item(), Item()
+        queue.put(first)
+        queue.put(second)
+        queue.put(first)
+        self.assertEquals(drain(queue), [first, second])
+        self.assertEquals(self.dropped, [first])
+        # Once taken off the queue, an item can be queued again
+        queue.put(first)
+        self.assertEquals(drain(queue), [first])
+
+    def test_coalesce_full(self):
+        queue = BoundedQueue(1, COALESCE, on_drop=self.dropped.append)
+        first, second = Item(), Item()
+        queue.put(first)
+        queue.put(second)
+        self.assertEquals(drain(queue), [second])
+        self.assertEquals(self.dropped, [first])
+
+    def test_control_items_bypass_capacity(self):
+        queue = BoundedQueue(1, DROP_NEWEST, on_drop=self.dropped.append)
+        queue.put(0)
+        queue.put(SystemExit())
+        self.assertEquals(queue.qsize(), 2)
+        self.assertEquals(self.dropped, [])
+
+    def test_control_items_are_never_dropped(self):
+        queue = BoundedQueue(2, DROP_OLDEST, on_drop=self.dropped.append)
+        stop = SystemExit()
+        queue.put(stop)
+        queue.put(0)
+        queue.put(1)
+        self.assertEquals(drain(queue), [stop, 1])
+        self.assertEquals(self.dropped, [0])
+
+
+class SampleBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dropped = []
+
+    def test_drain_swaps_columns(self):
+        buf = SampleBuffer()
+        for i in range(3):
+            buf.put((1000 * i, i))
+        self.assertEquals(buf.drain(), ([0, 1000, 2000], [0, 1, 2]))
+        self.assertTrue(buf.empty())
+        self.assertEquals(buf.drain(), ([], []))
+        buf.put((3000, 3.5))
+        self.assertEquals(buf.snapshot(), [(3000, 3.5)])
+
+    def test_mixed_values_keep_their_types(self):
+        buf = SampleBuffer()
+        samples = [(0, 1), (1, 2.5), (2, True), (3, "x"), (4, 2 ** 70)]
+        for sample in samples:
+            buf.put(sample)
+        timestamps, values = buf.drain()
+        self.assertEquals(zip(timestamps, values), samples)
+        self.assertEquals([type(v) for v in values],
+                          [type(v) for _, v in samples])
+
+    def test_float_timestamps(self):
+        buf = SampleBuffer()
+        buf.put((1000, 1.0))
+        buf.put((1500.5, 2.0))
+        self.assertEquals(buf.drain(), ([1000, 1500.5], [1.0, 2.0]))
+
+    def test_drop_oldest(self):
+        buf = SampleBuffer(2, DROP_OLDEST, on_drop=self.dropped.append)
+        for i in range(5):
+            buf.put((i, i))
+        self.assertEquals(buf.qsize(), 2)
+        self.assertEquals(buf.drain(), ([3, 4], [3, 4]))
+        self.assertEquals(self.dropped, [(0, 0), (1, 1), (2, 2)])
+        self.assertEquals(buf.num_dropped, 3)
+
+    def test_drop_newest(self):
+        buf = SampleBuffer(2, DROP_NEWEST, on_drop=self.dropped.append)
+        for i in range(3):
+            buf.put((i, i))
+        self.assertEquals(buf.drain(), ([0, 1], [0, 1]))
+        self.assertEquals(self.dropped, [(2, 2)])
+
+    def test_coalesce_replaces_newest(self):
+        buf = SampleBuffer(2, COALESCE, on_drop=self.dropped.append)
+        for i in range(4):
+            buf.put((i, i))
+        self.assertEquals(buf.drain(), ([0, 3], [0, 3]))
+        self.assertEquals(self.dropped, [(1, 1), (2, 2)])
+        self.assertEquals(buf.num_dropped, 2)
+
+    def test_block(self):
+        buf = SampleBuffer(1, BLOCK)
+        buf.put((0, 0))
+        self.assertRaises(Full, buf.put, (1, 1), False)
+        self.assertRaises(Full, buf.put, (1, 1), True, 0.01)
+        buf.drain()
+        buf.put((1, 1))
+        self.assertEquals(buf.snapshot(), [(1, 1)])
+
+
+def priority_of(item):
+    return item[0]
+
+
+class PriorityClassQueueTest(unittest.TestCase):
+
+    def test_strict(self):
+        queue = PriorityClassQueue(priority_of, (1, 1, 1), STRICT)
+        for item in ((2, "a"), (1, "b"), (0, "c"), (1, "d")):
+            queue.put(item)
+        self.assertEquals(drain(queue), [(0, "c"), (1, "b"), (1, "d"),
+                                         (2, "a")])
+
+    @mock.patch("liota.core.bounded_queue._time")
+    def test_strict_starvation(self, _time):
+        queue = PriorityClassQueue(priority_of, (1, 1, 1), STRICT,
+                                   max_wait_ms=1000)
+        _time.return_value = 0
+        queue.put((2, "a"))
+        _time.return_value = 0.5
+        queue.put((0, "b"))
+        queue.put((0, "c"))
+        self.assertEquals(queue.get_nowait(), (0, "b"))
+        _time.return_value = 1.0
+        self.assertEquals(queue.get_nowait(), (2, "a"))
+        self.assertEquals(queue.get_nowait(), (0, "c"))
+
+    def test_weighted(self):
+        queue = PriorityClassQueue(priority_of, (4, 2, 1), WEIGHTED)
+        for index in range(3):
+            for _ in range(7):
+                queue.put((index, ))
+        served = [item[0] for item in drain(queue)[:7]]
+        self.assertEquals([served.count(index) for index in range(3)],
+                          [4, 2, 1])
+
+    def test_control_items_go_to_lowest_class(self):
+        queue = PriorityClassQueue(priority_of, (1, 1), STRICT)
+        stop = SystemExit()
+        queue.put(stop)
+        queue.put((1, "a"))
+        self.assertEquals(drain(queue), [stop, (1, "a")])
+
+    def test_drop_oldest_of_lowest_class(self):
+        dropped = []
+        queue = PriorityClassQueue(priority_of, (1, 1), STRICT, capacity=2,
+                                   policy=DROP_OLDEST, on_drop=dropped.append)
+        queue.put((1, "a"))
+        queue.put((0, "b"))
+        queue.put((0, "c"))
+        self.assertEquals(dropped, [(1, "a")])
+        self.assertEquals(drain(queue), [(0, "b"), (0, "c")])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
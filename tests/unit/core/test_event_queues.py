@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import unittest
+
+from liota.core.metric_handler import EventsPriorityQueue, \
+    TimingWheelEventQueue
+from liota.lib.utilities.clock import monotonic_ms
+
+
+class ScheduledItem(object):
+    """
+    Stands in for RegisteredMetric in event queues.
+    """
+
+    def __init__(self, next_run_time):
+        self.flag_alive = True
+        self._next_run_time = next_run_time
+
+    def get_next_run_time(self):
+        return self._next_run_time
+
+    def __cmp__(self, other):
+        if not isinstance(other, ScheduledItem):
+            return -1
+        return cmp(self._next_run_time, other._next_run_time)
+
+
+class EventQueuesTest(unittest.TestCase):
+
+    def _queues(self):
+        return [EventsPriorityQueue(), TimingWheelEventQueue(tick_ms=10)]
+
+    def test_get_next_element_in_order(self):
+        now = monotonic_ms()
+        for queue in self._queues():
+            late, early = ScheduledItem(now - 10), ScheduledItem(now - 500)
+            queue.put_and_notify(late)
+            queue.put_and_notify(early)
+            self.assertEquals(queue.qsize(), 2)
+            first = queue.get_next_element_when_ready()
+            second = queue.get_next_element_when_ready()
+            if isinstance(queue, EventsPriorityQueue):
+                self.assertEquals([first, second], [early, late])
+            else:
+                self.assertEquals(set([first, second]), set([early, late]))
+
+    def test_get_ready_elements_within_tolerance(self):
+        now = monotonic_ms()
+        for queue in self._queues():
+            due = [ScheduledItem(now - 100), ScheduledItem(now)]
+            within_tolerance = ScheduledItem(now + 200)
+            later = ScheduledItem(now + 60000)
+            for item in due + [within_tolerance, later]:
+                queue.put_and_notify(item)
+            elements = queue.get_ready_elements(tolerance_ms=1000)
+            self.assertEquals(set(elements), set(due + [within_tolerance]))
+            self.assertEquals(queue.qsize(), 1)
+
+    def test_exit_signal(self):
+        for queue in self._queues():
+            queue.put_and_notify(SystemExit(), timeout=0)
+            elements = queue.get_ready_elements()
+            self.assertTrue(isinstance(elements[0], SystemExit))
+
+    def test_remove(self):
+        now = monotonic_ms()
+        for queue in self._queues():
+            removed, kept = ScheduledItem(now - 100), ScheduledItem(now - 10)
+            queue.put_and_notify(removed)
+            queue.put_and_notify(kept)
+            self.assertTrue(queue.remove(removed))
+            self.assertFalse(queue.remove(removed))
+            self.assertEquals(queue.qsize(), 1)
+            self.assertEquals(queue.get_ready_elements(), [kept])
+            self.assertEquals(queue.qsize(), 0)
+
+    def test_remove_and_put_again(self):
+        now = monotonic_ms()
+        queue = EventsPriorityQueue()
+        item = ScheduledItem(now - 100)
+        queue.put_and_notify(item)
+        queue.remove(item)
+        queue.put_and_notify(item)
+        self.assertEquals(queue.qsize(), 1)
+        self.assertEquals(queue.get_next_element_when_ready(), item)
+        self.assertEquals(queue.get_stats_removed(), [0, 1])
+
+    def test_heap_compaction(self):
+        now = monotonic_ms()
+        queue = EventsPriorityQueue()
+        items = [ScheduledItem(now + i) for i in range(200)]
+        for item in items:
+            queue.put_and_notify(item)
+        for item in items[:100]:
+            queue.remove(item)
+        self.assertEquals(queue.get_stats_removed(), [100, 0])
+        queue.remove(items[100])
+        self.assertEquals(queue.get_stats_removed(), [0, 1])
+        self.assertEquals(len(queue.queue), 99)
+        self.assertEquals(queue.get_next_element_when_ready(), items[101])
+
+
+if __name__ == '__main__':
+    unittest.main()
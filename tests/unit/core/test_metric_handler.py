@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import gc
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from Queue import Queue
+from threading import Event, Thread
+
+import mock
+import pint
+
+from liota.core import async_engine, metric_handler, state_snapshot
+from liota.core.async_engine import AsyncMetricEngine
+from liota.core.metric_handler import sample_in_worker, \
+    CollectionThreadPool, CollectLanes, SendLanes, RetireWorker
+from liota.entities.metrics.metric import Metric
+from liota.entities.metrics.registered_metric import RegisteredMetric
+from liota.lib.utilities.clock import monotonic, monotonic_ms
+
+ureg = pint.UnitRegistry()
+
+
+def sample_quantity():
+    return 5 * ureg.meter
+
+
+def sample_series(count):
+    return [(1000, 1), (2000, ureg.meter * 2)]
+
+
+class MetricHandlerTest(unittest.TestCase):
+
+    def test_sample_in_worker_stamps_and_reduces_quantities(self):
+        ts, v = sample_in_worker(sample_quantity, 0)
+        self.assertEquals(v, 5)
+        self.assertTrue(isinstance(ts, long))
+
+    def test_sample_in_worker_passes_series(self):
+        self.assertEquals(sample_in_worker(sample_series, 1),
+                          [(1000, 1), (2000, 2)])
+
+    def test_sample_in_worker_filtered_sample(self):
+        self.assertEquals(sample_in_worker(lambda: None, 0), None)
+
+
+class BlockingMetric(object):
+    """
+    Stands in for RegisteredMetric, collection blocks until released.
+    """
+
+    def __init__(self, release, timeout=0):
+        self.flag_alive = True
+        self.collect_enqueued_at = None
+        self.ref_entity = mock.Mock()
+        self.num_timeouts = 0
+        self._release = release
+        self._timeout = timeout
+
+    def record_latency(self, stage, latency_ms):
+        pass
+
+    def get_timeout(self):
+        return self._timeout
+
+    def timed_out(self):
+        self.num_timeouts += 1
+
+    def collect(self):
+        self._release.wait()
+        self.flag_alive = False
+
+
+class FailingMetric(BlockingMetric):
+    """
+    Stands in for RegisteredMetric, collection raises exception.
+    """
+
+    def __init__(self, exception):
+        super(FailingMetric, self).__init__(None)
+        self.num_errors = 0
+        self._exception = exception
+
+    def collect_failed(self):
+        self.num_errors += 1
+
+    def collect(self):
+        self.flag_alive = False
+        raise self._exception
+
+
+class CollectionThreadPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(metric_handler, "collect_queue", Queue())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self._pools = []
+        self._releases = []
+
+    def tearDown(self):
+        # Collector threads exit before collect_queue is restored, later
+        # tests do not share them
+        for release in self._releases:
+            release.set()
+        threads = []
+        for pool in self._pools:
+            with pool._worker_stat_lock:
+                threads.extend(pool._pool + pool._stuck)
+        for _ in threads:
+            metric_handler.collect_queue.put(RetireWorker())
+        for tref in threads:
+            tref.join(5)
+        self.assertFalse(any(tref.isAlive() for tref in threads))
+
+    def _pool(self, *args, **kwargs):
+        pool = CollectionThreadPool(*args, **kwargs)
+        self._pools.append(pool)
+        return pool
+
+    def _event(self):
+        release = Event()
+        self._releases.append(release)
+        return release
+
+    def _wait_for(self, condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_grow_and_shrink(self):
+        release = self._event()
+        pool = self._pool(2, min_threads=1, max_threads=4,
+                          idle_timeout=0)
+        pool.adjust_interval = 0
+        for _ in range(5):
+            metric_handler.collect_queue.put(BlockingMetric(release))
+        self._wait_for(lambda: pool.get_stats_working()[0] == 2)
+        pool.adjust()
+        self.assertEquals(pool.get_stats_elastic()[0], 4)
+        self._wait_for(lambda: pool.get_stats_working()[0] == 4)
+        release.set()
+        self._wait_for(lambda: metric_handler.collect_queue.qsize() == 0)
+        self._wait_for(lambda: pool.get_stats_working()[0] == 0)
+        time.sleep(0.01)
+        pool.adjust()
+        self._wait_for(lambda: pool.get_stats_elastic()[0] == 1)
+        self.assertEquals(pool.get_stats_elastic(), [1, 1, 4, 2, 3])
+
+    def test_fixed_size(self):
+        pool = self._pool(2)
+        pool.adjust_interval = 0
+        metric_handler.collect_queue.put(BlockingMetric(self._event()))
+        metric_handler.collect_queue.put(BlockingMetric(self._event()))
+        self._wait_for(lambda: pool.get_stats_working()[0] == 2)
+        pool.adjust()
+        self.assertEquals(pool.get_stats_elastic(), [2, 2, 2, 0, 0])
+
+    def test_check_timeouts(self):
+        release = self._event()
+        pool = self._pool(2)
+        stuck = BlockingMetric(release, timeout=0.01)
+        metric_handler.collect_queue.put(stuck)
+        metric_handler.collect_queue.put(BlockingMetric(release))
+        self._wait_for(lambda: pool.get_stats_working()[0] == 2)
+        time.sleep(0.05)
+        pool.check_timeouts()
+        self.assertEquals(pool.get_stats_timeouts(), [1, 1])
+        self.assertEquals(stuck.num_timeouts, 1)
+        self.assertEquals(pool.get_stats_working(), [1, 2, 2, 2])
+        pool.check_timeouts()
+        self.assertEquals(pool.get_stats_timeouts(), [1, 1])
+        release.set()
+        self._wait_for(lambda: pool.get_stats_timeouts() == [0, 1])
+        self.assertEquals(pool.get_stats_elastic()[0], 2)
+
+    def test_collect_error_does_not_kill_thread(self):
+        pool = self._pool(1)
+        metric = FailingMetric(ValueError())
+        metric_handler.collect_queue.put(metric)
+        metric_handler.collect_queue.put(FailingMetric(ValueError()))
+        self._wait_for(lambda: metric_handler.collect_queue.qsize() == 0)
+        self._wait_for(lambda: pool.get_stats_working() == [0, 1, 1, 1])
+        self.assertEquals(metric.num_errors, 1)
+
+    def test_restart_dead(self):
+        pool = self._pool(2)
+        metric_handler.collect_queue.put(FailingMetric(SystemExit()))
+        self._wait_for(lambda: pool.get_stats_working()[1] == 1)
+        pool.restart_dead()
+        self.assertEquals(pool.get_stats_restarted(), 1)
+        self._wait_for(lambda: pool.get_stats_working() == [0, 2, 2, 2])
+        pool.restart_dead()
+        self.assertEquals(pool.get_stats_restarted(), 1)
+
+
+class Comms(object):
+    """
+    Stands in for DCCComms.
+    """
+    pass
+
+
+class SendingMetric(object):
+    """
+    Stands in for RegisteredMetric, sending blocks until released.
+    """
+
+    def __init__(self, comms, release):
+        self.flag_alive = True
+        self.ref_dcc = mock.Mock(comms=comms)
+        self.sent = Event()
+        self._release = release
+        self.drops = []
+
+    def record_latency(self, stage, latency_ms):
+        pass
+
+    def count_drop(self, stage):
+        self.drops.append(stage)
+
+    def send_data(self):
+        self._release.wait()
+        self.sent.set()
+
+
+class SendLanesTest(unittest.TestCase):
+
+    def test_blocked_lane_does_not_hold_up_others(self):
+        lanes = SendLanes()
+        blocked_comms, comms = Comms(), Comms()
+        release = Event()
+        blocked = SendingMetric(blocked_comms, release)
+        lanes.put(blocked)
+        lanes.put(SendingMetric(blocked_comms, release))
+        metric = SendingMetric(comms, Event())
+        metric._release.set()
+        lanes.put(metric)
+        self.assertTrue(metric.sent.wait(5))
+        self.assertFalse(blocked.sent.is_set())
+        self.assertEquals(lanes.qsize(), 1)
+        release.set()
+        self.assertTrue(blocked.sent.wait(5))
+        lanes.put(SystemExit())
+        stats = sorted(lanes.get_stats())
+        self.assertEquals([stats[0][0], stats[0][2]], ["Sender-Comms-1", 1])
+        self.assertEquals([stats[1][0], stats[1][3]], ["Sender-Comms-2", 1])
+
+    def test_lane_is_retired_with_its_comms(self):
+        lanes = SendLanes()
+        comms = Comms()
+        metric = SendingMetric(comms, Event())
+        metric._release.set()
+        lanes.put(metric)
+        self.assertTrue(metric.sent.wait(5))
+        lane = lanes.get_lane(comms)
+        del comms, metric
+        gc.collect()
+        self.assertEquals(lanes.get_stats(), [])
+        self.assertTrue(lane.join(monotonic() + 5))
+
+    def test_put_after_stop_is_dropped(self):
+        lanes = SendLanes()
+        comms = Comms()
+        metric = SendingMetric(comms, Event())
+        metric._release.set()
+        lanes.put(metric)
+        self.assertTrue(metric.sent.wait(5))
+        lane = lanes.get_lane(comms)
+        lanes.put(SystemExit())
+        self.assertTrue(lane.join(monotonic() + 5))
+        late, new = SendingMetric(comms, Event()), SendingMetric(Comms(),
+                                                                 Event())
+        lanes.put(late)
+        lanes.put(new)
+        self.assertEquals([late.drops, new.drops], [["send"], ["send"]])
+        self.assertEquals(lanes.qsize(), 0)
+        # No lane, hence no SendThread, is created for new comms
+        self.assertEquals(len(lanes.get_stats()), 1)
+
+
+class CollectLanesTest(unittest.TestCase):
+
+    def _metric(self, lane):
+        return mock.Mock(get_lane=mock.Mock(return_value=lane))
+
+    def test_routing(self):
+        lanes = CollectLanes(100)
+        fast, slow = Queue(), Queue()
+        lanes.add_lane("fast", fast)
+        lanes.add_lane("slow", slow)
+        fast_metric, slow_metric = self._metric("fast"), self._metric("slow")
+        lanes.put(fast_metric)
+        lanes.put([slow_metric, fast_metric, slow_metric])
+        fast_metric.get_lane.assert_called_with(100)
+        self.assertEquals(fast.get_nowait(), fast_metric)
+        self.assertEquals(fast.get_nowait(), [fast_metric])
+        self.assertEquals(slow.get_nowait(), [slow_metric, slow_metric])
+        self.assertEquals(lanes.get_stats(), [["fast", 0, 2], ["slow", 0, 2]])
+
+    def test_pool_takes_from_its_lane(self):
+        release = Event()
+        queue = Queue()
+        pool = CollectionThreadPool(1, queue=queue, name="SlowCollector")
+        queue.put(BlockingMetric(release))
+        deadline = time.time() + 5
+        while pool.get_stats_working()[0] == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEquals(pool.get_stats_working()[0], 1)
+        release.set()
+        tref = pool._pool[0]
+        queue.put(RetireWorker())
+        tref.join(5)
+        self.assertFalse(tref.isAlive())
+
+
+class DrainTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.multiple(
+            metric_handler, event_checker_thread=None, event_ds=None,
+            collect_queue=None, send_queue=None, is_drained=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _metric(self, comms, values):
+        metric = RegisteredMetric(Metric("test", aggregation_size=10),
+                                  mock.Mock(comms=comms), None)
+        metric.flag_alive = True
+        metric.record_collected_data([(1000, value) for value in values])
+        return metric
+
+    def test_flush(self):
+        metric = self._metric(Comms(), [1, 2, 3])
+        dead = self._metric(Comms(), [1, 2])
+        dead.flag_alive = False
+        with mock.patch.object(metric_handler, "get_registered_metrics",
+                               return_value=[metric, dead]):
+            self.assertEquals(metric_handler.drain(1), (3, 2))
+        metric.ref_dcc.publish.assert_called_once_with(metric)
+        self.assertEquals(metric.current_aggregation_size, 0)
+        self.assertFalse(dead.ref_dcc.publish.called)
+
+    def test_busy_lane_is_not_flushed(self):
+        lanes = SendLanes()
+        blocked_comms = Comms()
+        release = Event()
+        lanes.put(SendingMetric(blocked_comms, release))
+        metric_handler.send_queue = lanes
+        metric = self._metric(blocked_comms, [1])
+        other = self._metric(Comms(), [1, 2])
+        with mock.patch.object(metric_handler, "get_registered_metrics",
+                               return_value=[metric, other]):
+            self.assertEquals(metric_handler.drain(0.2), (0, 3))
+        self.assertFalse(metric.ref_dcc.publish.called)
+        release.set()
+
+    def test_terminate_does_not_drain_twice(self):
+        metric_handler.drain(0)
+        with mock.patch.object(metric_handler, "drain") as drain:
+            metric_handler.terminate()
+        self.assertFalse(drain.called)
+
+    @unittest.skipIf(async_engine.asyncio is None,
+                     "trollius is not installed")
+    def test_waits_for_async_engine(self):
+        release = Event()
+        engine = AsyncMetricEngine(executor_size=1)
+        metric = RegisteredMetric(
+            Metric("test", interval=10, aggregation_size=10,
+                   sampling_function=lambda: release.wait() or 1),
+            mock.Mock(comms=Comms()), None)
+        metric.flag_alive = True
+        metric._due_time = metric._next_run_time = monotonic_ms()
+        engine.put_and_notify(metric)
+        metric_handler.event_ds = engine
+        Thread(target=lambda: time.sleep(0.1) or release.set()).start()
+        with mock.patch.object(metric_handler, "get_registered_metrics",
+                               return_value=[metric]):
+            self.assertEquals(metric_handler.drain(5), (1, 0))
+        metric.ref_dcc.publish.assert_called_once_with(metric)
+
+
+class StateSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, "state")
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _metric(self, name, dcc):
+        metric = RegisteredMetric(Metric(name), dcc, None)
+        metric.flag_alive = True
+        return metric
+
+    def test_shared_keys_are_not_written(self):
+        dcc = mock.Mock(comms=Comms())
+        metrics = [self._metric("shared", dcc), self._metric("shared", dcc),
+                   self._metric("unique", dcc)]
+        restored = state_snapshot.Snapshot()
+        with mock.patch.multiple(metric_handler,
+                                 state_snapshot_path=self._path,
+                                 restored_state=restored,
+                                 ambiguous_state_keys=set()), \
+                mock.patch.object(metric_handler, "get_registered_metrics",
+                                  return_value=metrics):
+            metric_handler.write_state_snapshot()
+        self.assertEquals(
+            [key for key, _ in state_snapshot.read(self._path).items()],
+            [metric_handler._state_key(metrics[2])])
+
+
+if __name__ == '__main__':
+    unittest.main()
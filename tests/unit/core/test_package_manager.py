@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from liota.core import metric_handler
+from liota.entities.metrics.metric import Metric
+from liota.entities.metrics.registered_metric import RegisteredMetric
+from liota.lib.utilities.utility import LiotaConfigPath
+
+# Package manager reads paths from liota.conf and initializes on import.
+# The messenger pipe path given is not a pipe, so that initialization stops
+# before starting package threads.
+_config_dir = tempfile.mkdtemp()
+try:
+    _config_path = os.path.join(_config_dir, "liota.conf")
+    with open(_config_path, "w") as config_file:
+        config_file.write("[PKG_CFG]\n"
+                          "pkg_path = %s\n"
+                          "pkg_msg_pipe = %s\n"
+                          "pkg_list = %s\n" % (
+                              _config_dir, _config_path,
+                              os.path.join(_config_dir, "packages_auto.txt")))
+    with mock.patch.object(LiotaConfigPath, "path_liota_config",
+                           _config_path):
+        from liota.core.package_manager import LiotaPackage, \
+            PackageRecord, PackageThread
+finally:
+    shutil.rmtree(_config_dir)
+
+
+class MetricsPackage(LiotaPackage):
+    """
+    Package stopping its metrics on clean-up, as packages do.
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def run(self, registry):
+        pass
+
+    def clean_up(self):
+        for metric in self.metrics:
+            metric.stop_collecting()
+
+
+class PackageUnloadTest(unittest.TestCase):
+
+    def setUp(self):
+        # Unloads run on a PackageThread which is not started
+        self.thread = PackageThread.__new__(PackageThread)
+        self.thread._packages_loaded = {}
+        self.thread._resource_registry = mock.Mock(_packages={})
+        self.thread._remove_package_from_autoload = mock.Mock()
+
+    def _load(self, name, package):
+        record = PackageRecord(name)
+        record.set_instance(package)
+        self.thread._packages_loaded[name] = record
+
+    def _metric(self, values):
+        metric = RegisteredMetric(Metric("test", aggregation_size=10),
+                                  mock.Mock(), None)
+        metric.flag_alive = True
+        metric.record_collected_data([(1000, value) for value in values])
+        return metric
+
+    def test_unload_flushes_stopped_metrics(self):
+        stopped = self._metric([1, 2])
+        other = self._metric([3])
+        self._load("pkg", MetricsPackage([stopped]))
+        with mock.patch.object(metric_handler, "event_ds", None), \
+                mock.patch.object(metric_handler, "get_registered_metrics",
+                                  return_value=[stopped, other]):
+            self.assertTrue(self.thread._package_unload("pkg"))
+        stopped.ref_dcc.publish.assert_called_once_with(stopped)
+        self.assertEquals(stopped.current_aggregation_size, 0)
+        self.assertFalse(other.ref_dcc.publish.called)
+        self.assertEquals(self.thread._packages_loaded, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
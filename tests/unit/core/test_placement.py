@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import unittest
+
+from liota.core.placement import Placement, ALIGNED, SPREAD, JITTER, \
+    wall_clock_run_time
+
+
+class PlacementTest(unittest.TestCase):
+
+    def test_init_policy(self):
+        """Placement policy must be one of the supported ones"""
+        self.assertRaises(ValueError, lambda: Placement("random"))
+
+    def test_aligned(self):
+        placement = Placement(ALIGNED)
+        self.assertEquals(placement.first_run_time(5000, 12345), 17345)
+
+    def test_spread(self):
+        placement = Placement(SPREAD)
+        phases = sorted(placement.first_run_time(4000, 10000) % 4000
+                        for _ in range(8))
+        self.assertEquals(phases, range(0, 4000, 500))
+
+    def test_spread_runs_within_one_interval(self):
+        placement = Placement(SPREAD)
+        for now in (10000, 10001, 13999):
+            for _ in range(4):
+                run_time = placement.first_run_time(4000, now)
+                self.assertTrue(now < run_time <= now + 4000)
+
+    def test_spread_per_interval(self):
+        placement = Placement(SPREAD)
+        self.assertEquals(placement.first_run_time(4000, 10000), 12000)
+        self.assertEquals(placement.first_run_time(4000, 10000), 14000)
+        # First metric with another interval gets phase 0 of it
+        self.assertEquals(placement.first_run_time(3000, 10000), 12000)
+
+    def test_jitter_is_bounded(self):
+        placement = Placement(JITTER, jitter_ms=100)
+        for _ in range(100):
+            run_time = placement.first_run_time(4000, 10000)
+            self.assertTrue(14000 <= run_time <= 14100)
+        self.assertTrue(placement.first_run_time(50, 10000) <= 10100)
+
+    def test_not_staggered(self):
+        placement = Placement(SPREAD)
+        for _ in range(4):
+            self.assertEquals(
+                placement.first_run_time(4000, 10000, staggered=False), 14000)
+
+    def test_wall_clock_run_time(self):
+        # Wall clock 1000500 ms ahead of the monotonic clock
+        self.assertEquals(wall_clock_run_time(5000, 12000, 1000500), 14500)
+        # On a multiple already, the next one
+        self.assertEquals(wall_clock_run_time(5000, 14500, 1000500), 19500)
+        self.assertEquals(wall_clock_run_time(0, 12000, 1000500), 12000)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
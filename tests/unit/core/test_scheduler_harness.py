@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import unittest
+
+from liota.core import metric_handler
+from liota.core.metric_handler import EventsPriorityQueue, \
+    TimingWheelEventQueue
+from liota.core.placement import Placement, ALIGNED, SPREAD
+from liota.core.scheduler_harness import SchedulerHarness
+from liota.entities.metrics.metric import Metric
+from liota.lib.utilities import clock as liota_clock
+from liota.lib.utilities.clock import VirtualClock, use_virtual_clock
+
+TEN_MINUTES_MS = 600 * 1000
+
+
+def sample():
+    return 1
+
+
+class VirtualClockTest(unittest.TestCase):
+
+    def test_use_virtual_clock(self):
+        clock = VirtualClock(5000, wall_offset_ms=1000000)
+        with use_virtual_clock(clock):
+            self.assertEquals(metric_handler.monotonic_ms(), 5000)
+            clock.advance(1500)
+            self.assertEquals(metric_handler._time(), 6.5)
+            self.assertEquals(metric_handler.wall_ms(), 1006500)
+        self.assertTrue(metric_handler.monotonic_ms is liota_clock.monotonic_ms)
+        self.assertRaises(ValueError, lambda: clock.advance(-1))
+
+
+class SchedulerHarnessTest(unittest.TestCase):
+
+    def _harness(self, policy=SPREAD, **kwargs):
+        kwargs.setdefault("event_ds", EventsPriorityQueue)
+        return SchedulerHarness(placement=Placement(policy), **kwargs)
+
+    def test_spread_metrics_run_on_time(self):
+        with self._harness(num_collectors=2) as harness:
+            for i in range(50):
+                harness.add_metric(
+                    Metric("m%d" % i, interval=5, sampling_function=sample),
+                    sample_ms=10)
+            harness.run(TEN_MINUTES_MS)
+        self.assertEquals(harness.num_runs, 50 * 120)
+        self.assertEquals(harness.lag.max, 0)
+        self.assertEquals(harness.num_out_of_order, 0)
+        self.assertEquals(harness.clock.now_ms, TEN_MINUTES_MS)
+
+    def test_aligned_metrics_queue_for_collectors(self):
+        with self._harness(ALIGNED, num_collectors=2,
+                           record_runs=True) as harness:
+            for i in range(4):
+                harness.add_metric(
+                    Metric("m%d" % i, interval=5, sampling_function=sample),
+                    sample_ms=100)
+            harness.run(5100)
+        self.assertEquals(sorted((due, start)
+                                 for name, due, start in harness.runs),
+                          [(5000, 5000), (5000, 5000),
+                           (5000, 5100), (5000, 5100)])
+
+    def test_overrun_policies(self):
+        num_runs = {}
+        for policy in ("skip", "coalesce", "catch_up"):
+            with self._harness(ALIGNED) as harness:
+                metric = harness.add_metric(
+                    Metric("slow", interval=1, sampling_function=sample,
+                           overrun_policy=policy),
+                    sample_ms=1200)
+                harness.run(60000)
+            num_runs[policy] = harness.num_runs
+            if policy == "skip":
+                self.assertEquals(metric.num_skipped, 29)
+        # Next run at the next time due, right away, and half an interval
+        # later while catching up
+        self.assertEquals(num_runs, {"skip": 30, "coalesce": 50,
+                                     "catch_up": 35})
+
+    def test_timeout_backs_off(self):
+        with self._harness(ALIGNED, num_collectors=1) as harness:
+            metric = harness.add_metric(
+                Metric("hung", interval=1, sampling_function=sample,
+                       timeout=1),
+                sample_ms=5000)
+            other = harness.add_metric(
+                Metric("ok", interval=1, sampling_function=sample))
+            harness.run(60000)
+        self.assertTrue(harness.num_timeouts > 0)
+        self.assertTrue(metric.failures_in_row > 1)
+        # The watchdog replaces the stuck collector
+        self.assertTrue(harness.lag.percentile(50) <= 1000)
+        self.assertTrue(other.num_runs > 50)
+
+    def test_timing_wheel(self):
+        with self._harness(num_collectors=2,
+                           event_ds=lambda: TimingWheelEventQueue(10)) \
+                as harness:
+            for i in range(50):
+                harness.add_metric(
+                    Metric("m%d" % i, interval=5, sampling_function=sample))
+            harness.run(TEN_MINUTES_MS)
+        self.assertEquals(harness.num_runs, 50 * 120)
+        self.assertTrue(harness.lag.max <= 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import time
+import unittest
+from threading import Thread
+
+from liota.core.sharded_queue import ShardedQueue
+
+
+class ShardedQueueTest(unittest.TestCase):
+
+    def _wait_for(self, condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_round_robin_and_stealing(self):
+        queue = ShardedQueue(2)
+        for item in range(4):
+            queue.put(item)
+        self.assertEquals(queue.qsize(), 4)
+        self.assertEquals([queue.get(0), queue.get(0)], [0, 2])
+        self.assertEquals(queue.get_stats(), [2, 2, 0])
+        self.assertEquals([queue.get(0), queue.get(0)], [1, 3])
+        self.assertEquals(queue.get_stats(), [2, 0, 2])
+        self.assertTrue(queue.empty())
+
+    def test_put_wakes_idle_worker(self):
+        queue = ShardedQueue(4)
+        got = []
+        worker = Thread(target=lambda: got.append(queue.get(2)))
+        worker.daemon = True
+        worker.start()
+        self._wait_for(lambda: len(queue._idle) == 1)
+        queue.put("item")
+        worker.join(5)
+        self.assertEquals(got, ["item"])
+        self.assertEquals(queue.get_stats(), [4, 0, 0])
+
+    def test_many_workers(self):
+        queue = ShardedQueue(4)
+        got = []
+
+        def work(shard):
+            while True:
+                item = queue.get(shard)
+                if item is None:
+                    return
+                got.append(item)
+
+        workers = [Thread(target=work, args=(shard,)) for shard in range(8)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for item in range(10000):
+            queue.put(item)
+        for _ in workers:
+            queue.put(None)
+        for worker in workers:
+            worker.join(5)
+        self.assertEquals(sorted(got), range(10000))
+
+    def test_invalid_shards(self):
+        with self.assertRaises(ValueError):
+            ShardedQueue(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
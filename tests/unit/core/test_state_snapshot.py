@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import pint
+
+from liota.core import state_snapshot
+
+ureg = pint.UnitRegistry()
+
+
+class StateSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, "state")
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_round_trip(self):
+        state = {("id-1", "Graphite"): (1000L, 5, 2, [(900L, 1.5), (950L, 2),
+                                                      (960L, "on"), (970L, None),
+                                                      (980L, 2 ** 60)]),
+                 ("id-2", "AWSIoT"): (None, 0.5, 0, []),
+                 ("id-3", "AWSIoT"): (2000L, 60, 1, [(1900L, True)])}
+        state_snapshot.write(self._path, state)
+        snapshot = state_snapshot.read(self._path)
+        self.assertEquals(len(snapshot), 3)
+        self.assertEquals(snapshot.pop(("id-1", "Graphite")),
+                          state[("id-1", "Graphite")])
+        self.assertEquals(snapshot.pop(("id-1", "Graphite")), None)
+        self.assertEquals(sorted(snapshot.items()),
+                          [(("id-2", "AWSIoT"), state[("id-2", "AWSIoT")]),
+                           (("id-3", "AWSIoT"), state[("id-3", "AWSIoT")])])
+        self.assertTrue(snapshot.pop(("id-3", "AWSIoT"))[3][0][1] is True)
+        self.assertEquals(len(snapshot), 1)
+        self.assertFalse(os.path.exists(self._path + ".tmp"))
+
+    def test_missing_or_corrupt(self):
+        self.assertEquals(len(state_snapshot.read(self._path)), 0)
+        with open(self._path, "wb") as fp:
+            fp.write("not a snapshot")
+        self.assertEquals(len(state_snapshot.read(self._path)), 0)
+        with open(self._path, "wb") as fp:
+            fp.write(state_snapshot.MAGIC + chr(state_snapshot.VERSION) +
+                     state_snapshot.BYTE_ORDER + "x")
+        self.assertEquals(len(state_snapshot.read(self._path)), 0)
+
+    def test_plain_samples(self):
+        self.assertEquals(
+            state_snapshot.plain_samples(
+                [(1, 5 * ureg.meter), (2, object()), (3, "on"), (4, None)]),
+            [(1, 5), (3, "on"), (4, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
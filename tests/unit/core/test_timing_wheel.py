@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import random
+import unittest
+
+from liota.core.timing_wheel import TimingWheel
+
+
+class Item(object):
+    pass
+
+
+class TimingWheelTest(unittest.TestCase):
+
+    def test_init_tick_ms(self):
+        """Tick resolution must be a positive number"""
+        self.assertRaises(ValueError, lambda: TimingWheel(tick_ms=0))
+
+    def test_items_never_expire_early(self):
+        wheel = TimingWheel(tick_ms=10, now_ms=1000)
+        item = Item()
+        wheel.add(item, 1015)
+        self.assertEquals(wheel.advance(1019), [])
+        self.assertEquals(wheel.advance(1020), [item])
+        self.assertEquals(len(wheel), 0)
+
+    def test_overdue_item_expires_on_next_advance(self):
+        wheel = TimingWheel(tick_ms=10, now_ms=1000)
+        item = Item()
+        wheel.add(item, 500)
+        self.assertEquals(wheel.next_expiry(), 990)
+        self.assertEquals(wheel.advance(1000), [item])
+
+    def test_reschedule_and_remove(self):
+        wheel = TimingWheel(tick_ms=1, now_ms=0)
+        first, second = Item(), Item()
+        wheel.add(first, 100)
+        wheel.add(second, 200)
+        wheel.add(first, 300)
+        self.assertEquals(len(wheel), 2)
+        self.assertTrue(wheel.remove(second))
+        self.assertFalse(wheel.remove(second))
+        self.assertEquals(wheel.advance(299), [])
+        self.assertEquals(wheel.advance(300), [first])
+
+    def test_deadline_beyond_range_of_wheel(self):
+        wheel = TimingWheel(tick_ms=1, slot_bits=2, levels=2, now_ms=0)
+        item = Item()
+        wheel.add(item, 1000)
+        self.assertEquals(wheel.advance(999), [])
+        self.assertEquals(wheel.advance(1000), [item])
+
+    def test_matches_sorted_deadlines(self):
+        """Items expire in the tick of their deadline, across all levels"""
+        random.seed(0)
+        wheel = TimingWheel(tick_ms=5, slot_bits=3, levels=3, now_ms=0)
+        deadlines = {}
+        for _ in range(500):
+            item = Item()
+            deadlines[item] = random.randint(0, 20000)
+            wheel.add(item, deadlines[item])
+        now = 0
+        while deadlines:
+            next_expiry = wheel.next_expiry()
+            earliest = min(deadlines.values())
+            self.assertTrue(next_expiry <= -(-earliest // 5) * 5)
+            now += random.randint(0, 300)
+            for item in wheel.advance(now):
+                self.assertTrue(deadlines.pop(item) <= now)
+            for deadline in deadlines.values():
+                self.assertTrue(-(-deadline // 5) * 5 > now)
+        self.assertEquals(wheel.next_expiry(), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import json
+import unittest
+
+import mock
+
+from liota.dccs.aws_iot import AWSIoT
+from liota.dcc_comms.dcc_comms import DCCComms
+from liota.entities.metrics.metric import Metric
+from liota.entities.metrics.registered_metric import RegisteredMetric
+
+
+class TestDCCAWSIoT(unittest.TestCase):
+
+    def _format(self, aws, samples, clock_aligned=True):
+        reg_metric = RegisteredMetric(
+            Metric("temp", interval=5, clock_aligned=clock_aligned),
+            aws, None)
+        for sample in samples:
+            reg_metric.values.put(sample)
+        return json.loads(aws._format_data(reg_metric))["metric_data"]
+
+    def test_compact_timestamps(self):
+        aws = AWSIoT(mock.create_autospec(DCCComms), compact_timestamps=True)
+        self.assertEquals(
+            self._format(aws, [(1000, 1), (6000, 2), (11000, 3)]),
+            {"timestamp": 1000, "interval": 5000, "values": [1, 2, 3]})
+        # A run skipped, or a metric not clock aligned
+        self.assertEquals(
+            self._format(aws, [(1000, 1), (11000, 3)]),
+            [{"value": 1, "timestamp": 1000}, {"value": 3, "timestamp": 11000}])
+        self.assertEquals(
+            self._format(aws, [(1000, 1)], clock_aligned=False),
+            [{"value": 1, "timestamp": 1000}])
+
+    def test_timestamps_per_value_by_default(self):
+        aws = AWSIoT(mock.create_autospec(DCCComms))
+        self.assertEquals(
+            self._format(aws, [(1000, 1), (6000, 2)]),
+            [{"value": 1, "timestamp": 1000}, {"value": 2, "timestamp": 6000}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -61,5 +61,18 @@ class TestEntitiesMetric(unittest.TestCase):
             m = Metric("test5s", interval=(5 * ureg.second))
             assert m is None
 
+    def test_metric_sample_in_process(self):
+        m = Metric("test", sampling_function=sample, sample_in_process=True)
+        assert isinstance(m, Metric)
+
+        with self.assertRaises(TypeError):
+            m = Metric("test", sampling_function=lambda: 1,
+                       sample_in_process=True)
+            assert m is None
+
+
+def sample():
+    return 1
+
 if __name__ == '__main__':
     unittest.main()
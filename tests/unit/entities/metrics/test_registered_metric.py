@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import unittest
+from Queue import Queue
+from threading import Thread
+
+import mock
+
+from liota.core import metric_handler
+from liota.entities.metrics.metric import Metric
+from liota.entities.metrics.registered_metric import RegisteredMetric
+
+
+class TestRegisteredMetricOverrun(unittest.TestCase):
+
+    def _scheduled(self, overrun_policy, now=1000, **kwargs):
+        metric = RegisteredMetric(
+            Metric("test", interval=10, overrun_policy=overrun_policy,
+                   **kwargs),
+            None, None)
+        metric._due_time = metric._next_run_time = now + 10000
+        return metric
+
+    @mock.patch("liota.entities.metrics.registered_metric.monotonic_ms")
+    def test_on_time(self, monotonic_ms):
+        metric = self._scheduled("skip")
+        monotonic_ms.return_value = 11500
+        metric.set_next_run_time()
+        self.assertEquals(metric.get_next_run_time(), 21000)
+        self.assertEquals((metric.num_skipped, metric.num_late), (0, 0))
+
+    @mock.patch("liota.entities.metrics.registered_metric.monotonic_ms")
+    def test_skip(self, monotonic_ms):
+        metric = self._scheduled("skip")
+        monotonic_ms.return_value = 45000
+        metric.set_next_run_time()
+        self.assertEquals(metric.get_next_run_time(), 51000)
+        self.assertEquals((metric.num_skipped, metric.num_late), (3, 0))
+
+    @mock.patch("liota.entities.metrics.registered_metric.monotonic_ms")
+    def test_coalesce(self, monotonic_ms):
+        metric = self._scheduled("coalesce")
+        monotonic_ms.return_value = 45000
+        metric.set_next_run_time()
+        self.assertEquals(metric.get_next_run_time(), 45000)
+        self.assertEquals((metric.num_skipped, metric.num_late), (2, 1))
+        monotonic_ms.return_value = 45100
+        metric.set_next_run_time()
+        self.assertEquals(metric.get_next_run_time(), 55000)
+
+    @mock.patch("liota.entities.metrics.registered_metric.monotonic_ms")
+    def test_catch_up(self, monotonic_ms):
+        metric = self._scheduled("catch_up", catch_up_rate=4)
+        monotonic_ms.return_value = 45000
+        run_times = []
+        for i in range(5):
+            metric.set_next_run_time()
+            run_times.append(metric.get_next_run_time())
+            monotonic_ms.return_value = metric.get_next_run_time()
+        self.assertEquals(run_times, [47500, 50000, 52500, 55000, 61000])
+        self.assertEquals((metric.num_skipped, metric.num_late), (0, 4))
+
+    @mock.patch("liota.entities.metrics.registered_metric.monotonic_ms")
+    def test_zero_interval(self, monotonic_ms):
+        for policy in ("skip", "coalesce", "catch_up"):
+            metric = RegisteredMetric(
+                Metric("test", interval=0, overrun_policy=policy),
+                None, None)
+            metric._due_time = metric._next_run_time = 1000
+            monotonic_ms.return_value = 1500
+            metric.set_next_run_time()
+            self.assertEquals(metric.get_next_run_time(), 1500)
+            metric.timed_out()
+            monotonic_ms.return_value = 1600
+            metric.set_next_run_time()
+            self.assertEquals(metric.get_next_run_time(), 1600)
+            self.assertEquals(metric.failures_in_row, 1)
+            self.assertEquals((metric.num_skipped, metric.num_late), (0, 0))
+
+    def test_unsupported_policy(self):
+        with self.assertRaises(ValueError):
+            Metric("test", overrun_policy="burst")
+        with self.assertRaises(ValueError):
+            Metric("test", overrun_policy="catch_up", catch_up_rate=0.5)
+
+
+class TestRegisteredMetricTimeout(unittest.TestCase):
+
+    @mock.patch("liota.entities.metrics.registered_metric.monotonic_ms")
+    def test_backoff(self, monotonic_ms):
+        metric = RegisteredMetric(Metric("test", interval=10, timeout=1),
+                                  None, None)
+        metric._due_time = metric._next_run_time = 11000
+        self.assertEquals(metric.get_timeout(), 1)
+        monotonic_ms.return_value = 13000
+        metric.timed_out()
+        metric.set_next_run_time()
+        self.assertEquals(metric.get_next_run_time(), 33000)
+        monotonic_ms.return_value = 34000
+        metric.timed_out()
+        metric.set_next_run_time()
+        self.assertEquals(metric.get_next_run_time(), 74000)
+        self.assertEquals((metric.num_timeouts, metric.failures_in_row),
+                          (2, 2))
+        monotonic_ms.return_value = 74500
+        metric.set_next_run_time()
+        self.assertEquals(metric.get_next_run_time(), 84000)
+        self.assertEquals(metric.failures_in_row, 0)
+
+    def test_error_rate(self):
+        metric = RegisteredMetric(
+            Metric("test", interval=10, sampling_function=lambda: 1),
+            None, None)
+        metric.collect()
+        metric.collect()
+        metric.collect_failed()
+        self.assertEquals(metric.get_error_rate(), 0.5)
+        metric._due_time = metric._next_run_time = 0
+        metric.set_next_run_time()
+        self.assertEquals(metric.failures_in_row, 1)
+
+    def test_invalid_timeout(self):
+        with self.assertRaises(ValueError):
+            Metric("test", timeout=-1)
+
+
+class TestRegisteredMetricClockAligned(unittest.TestCase):
+
+    @mock.patch("liota.entities.metrics.registered_metric.wall_ms")
+    @mock.patch("liota.entities.metrics.registered_metric.monotonic_ms")
+    def test_timestamps(self, monotonic_ms, wall_ms):
+        metrics = [RegisteredMetric(Metric(name, interval=5,
+                                           clock_aligned=True), None, None)
+                   for name in ("a", "b")]
+        # Wall clock 1000500 ms ahead of the monotonic clock
+        metrics[0]._due_time = metrics[0]._next_run_time = 14500
+        metrics[1]._due_time = metrics[1]._next_run_time = 19500
+        monotonic_ms.return_value = 15623
+        wall_ms.return_value = 1016123
+        self.assertEquals(metrics[0].get_run_timestamp(), 1015000)
+        metrics[0].add_collected_data(1)
+        self.assertEquals(metrics[0].values.drain(), ([1015000], [1]))
+        metrics[0].set_next_run_time()
+        monotonic_ms.return_value = 19987
+        wall_ms.return_value = 1020487
+        self.assertEquals([metric.get_run_timestamp() for metric in metrics],
+                          [1020000, 1020000])
+        # Wall clock stepped by 200 ms
+        wall_ms.return_value = 1020687
+        metrics[0].set_next_run_time()
+        self.assertEquals(metrics[0].get_next_run_time(), 24300)
+
+    @mock.patch("liota.entities.metrics.registered_metric.wall_ms")
+    @mock.patch("liota.entities.metrics.registered_metric.monotonic_ms")
+    def test_backoff_stays_aligned(self, monotonic_ms, wall_ms):
+        metric = RegisteredMetric(Metric("test", interval=5,
+                                         clock_aligned=True), None, None)
+        metric._due_time = metric._next_run_time = 14500
+        monotonic_ms.return_value = 16000
+        wall_ms.return_value = 1016500
+        metric.collect_failed()
+        metric.set_next_run_time()
+        # Backed off for 2 intervals from now, up to the next multiple
+        self.assertEquals(metric.get_next_run_time(), 29500)
+
+
+class TestRegisteredMetricAdaptiveInterval(unittest.TestCase):
+
+    def _metric(self, **kwargs):
+        return RegisteredMetric(
+            Metric("test", interval=8, min_interval=2, max_interval=16,
+                   **kwargs), None, None)
+
+    @mock.patch("liota.entities.metrics.registered_metric.monotonic_ms")
+    def test_adapt(self, monotonic_ms):
+        metric = self._metric()
+        metric._due_time = metric._next_run_time = 10000
+        monotonic_ms.return_value = 10000
+        for value in (100, 120, 90):
+            metric.record_collected_data(value)
+        self.assertEquals(metric.current_interval, 2)
+        metric.set_next_run_time()
+        self.assertEquals(metric.get_next_run_time(), 12000)
+        # Quiet values lengthen it, up to max_interval
+        metric.record_collected_data([(1, 91), (2, 92), (3, 92)])
+        self.assertEquals(metric.current_interval, 3)
+        for _ in range(30):
+            metric.record_collected_data(92)
+        self.assertEquals(metric.current_interval, 16)
+        metric.set_next_run_time()
+        self.assertEquals(metric.get_next_run_time(), 28000)
+
+    def test_change_threshold(self):
+        metric = self._metric(change_threshold=10)
+        for value in (100, 109, 100, 91):
+            metric.record_collected_data(value)
+        self.assertEquals(metric.current_interval, 12)
+        metric.record_collected_data(80)
+        self.assertEquals(metric.current_interval, 6)
+        # Values that are not numbers are ignored
+        metric.record_collected_data("on")
+        self.assertEquals(metric.current_interval, 6)
+
+    def test_fixed_interval(self):
+        metric = RegisteredMetric(Metric("test", interval=8), None, None)
+        for value in (1, 100, 1):
+            metric.record_collected_data(value)
+        self.assertEquals(metric.current_interval, 8)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Metric("test", interval=8, min_interval=2)
+        with self.assertRaises(ValueError):
+            Metric("test", interval=8, min_interval=10, max_interval=16)
+        with self.assertRaises(ValueError):
+            Metric("test", interval=8, min_interval=0, max_interval=16)
+
+
+class TestRegisteredMetricState(unittest.TestCase):
+
+    @mock.patch("liota.entities.metrics.registered_metric.wall_ms")
+    @mock.patch("liota.entities.metrics.registered_metric.monotonic_ms")
+    def test_state_round_trip(self, monotonic_ms, wall_ms):
+        metric = RegisteredMetric(Metric("test", interval=5,
+                                          aggregation_size=3), None, None)
+        metric._due_time = metric._next_run_time = 14500
+        metric.record_collected_data([(1000, 1), (2000, 2)])
+        monotonic_ms.return_value = 12000
+        wall_ms.return_value = 1012000
+        state = metric.get_state()
+        self.assertEquals(state, (1014500, 5, 2, [(1000, 1), (2000, 2)]))
+        # After a restart, with the monotonic clock starting over
+        restored = RegisteredMetric(Metric("test", interval=5,
+                                            aggregation_size=3), None, None)
+        monotonic_ms.return_value = 300
+        wall_ms.return_value = 1020000
+        self.assertEquals(restored.set_state(state), -5200)
+        self.assertEquals(restored.values.snapshot(),
+                          [(1000, 1), (2000, 2)])
+        self.assertEquals(restored.current_aggregation_size, 2)
+
+
+class TestRegisteredMetricLane(unittest.TestCase):
+
+    def _metric(self, lane=None):
+        return RegisteredMetric(Metric("test", interval=10, lane=lane),
+                                None, None)
+
+    def test_lane_follows_collect_duration(self):
+        metric = self._metric()
+        self.assertEquals(metric.get_lane(100), "fast")
+        metric._update_collect_ewma(150)
+        self.assertEquals(metric.get_lane(100), "slow")
+        metric._update_collect_ewma(0)
+        self.assertEquals(metric.collect_ewma_ms, 105)
+        metric._update_collect_ewma(0)
+        self.assertEquals(metric.get_lane(100), "slow")
+        metric._update_collect_ewma(0)
+        metric._update_collect_ewma(0)
+        self.assertEquals(metric.get_lane(100), "fast")
+
+    def test_pinned_lane(self):
+        metric = self._metric("slow")
+        metric._update_collect_ewma(1)
+        self.assertEquals(metric.get_lane(100), "slow")
+        with self.assertRaises(ValueError):
+            Metric("test", lane="medium")
+
+
+class TestRegisteredMetricPush(unittest.TestCase):
+
+    def setUp(self):
+        self.send_queue = Queue()
+        patcher = mock.patch.multiple(metric_handler,
+                                      send_queue=self.send_queue,
+                                      is_initialization_done=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _metric(self, aggregation_size):
+        return RegisteredMetric(
+            Metric("test", interval=0, aggregation_size=aggregation_size),
+            None, None)
+
+    def test_push(self):
+        metric = self._metric(2)
+        metric.push(1, ts=1000)
+        self.assertTrue(self.send_queue.empty())
+        metric.push(2)
+        metric.push(None)
+        self.assertEquals(self.send_queue.get_nowait(), metric)
+        timestamps, values = metric.values.drain()
+        self.assertEquals(timestamps[0], 1000)
+        self.assertEquals(values, [1, 2])
+        self.assertTrue(metric.values.empty())
+
+    def test_push_many(self):
+        metric = self._metric(3)
+        metric.push_many([(1000, 1), 2, None])
+        self.assertTrue(self.send_queue.empty())
+        metric.push_many([3])
+        self.assertEquals(self.send_queue.qsize(), 1)
+        self.assertEquals(metric.current_aggregation_size, 0)
+
+    def test_push_before_start_collecting(self):
+        metric = self._metric(1)
+        with mock.patch.object(metric_handler, "is_initialization_done",
+                               False):
+            self.assertRaises(RuntimeError, metric.push, 1)
+            self.assertRaises(RuntimeError, metric.push_many, [1, 2])
+        self.assertTrue(metric.values.empty())
+        self.assertEquals(metric.current_aggregation_size, 0)
+        self.assertTrue(self.send_queue.empty())
+
+    def test_push_from_threads(self):
+        metric = self._metric(10)
+
+        def push():
+            for value in range(1000):
+                metric.push(value)
+
+        threads = [Thread(target=push) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Pushes racing past aggregation_size are sent together
+        self.assertTrue(300 < self.send_queue.qsize() <= 400)
+        self.assertFalse(metric.is_ready_to_send())
+        self.assertEquals(metric.values.qsize(), 4000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import unittest
+from Queue import Queue
+
+import mock
+
+from liota.core import metric_handler
+from liota.entities.metrics.metric import Metric
+from liota.entities.metrics.registered_metric import RegisteredMetric
+from liota.entities.metrics.sampler_group import SamplerGroup
+
+
+class TestSamplerGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.send_queue = Queue()
+        patcher = mock.patch.multiple(metric_handler,
+                                      send_queue=self.send_queue,
+                                      is_initialization_done=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sampling_function = mock.Mock(return_value={"rx": 10, "tx": 20})
+        self.group = SamplerGroup("net", interval=5,
+                                  sampling_function=self.sampling_function)
+        self.rx = RegisteredMetric(Metric("rx", interval=5), None, None)
+        self.tx = RegisteredMetric(Metric("tx", interval=5), None, None)
+        self.group.add(self.rx, lambda snapshot: snapshot["rx"])
+        self.group.add(self.tx, lambda snapshot: snapshot["tx"])
+
+    def test_fan_out(self):
+        self.group._reg_group.collect()
+        self.assertEquals(self.sampling_function.call_count, 1)
+        self.assertEquals(self.send_queue.qsize(), 2)
+        (rx_ts, rx_value), = self.rx.values.snapshot()
+        (tx_ts, tx_value), = self.tx.values.snapshot()
+        self.assertEquals((rx_value, tx_value), (10, 20))
+        self.assertEquals(rx_ts, tx_ts)
+        self.assertFalse(self.group._reg_group.claim_ready_to_send())
+
+    def test_extract_error_skips_member(self):
+        self.group.add(RegisteredMetric(Metric("err", interval=5),
+                                        None, None),
+                       lambda snapshot: snapshot["err"])
+        self.group._reg_group.collect()
+        self.assertEquals(self.send_queue.qsize(), 2)
+
+    def test_filtered_snapshot(self):
+        self.sampling_function.return_value = None
+        self.group._reg_group.collect()
+        self.assertTrue(self.send_queue.empty())
+
+    def test_sampling_function_required(self):
+        with self.assertRaises(TypeError):
+            SamplerGroup("net", interval=5)
+        with self.assertRaises(TypeError):
+            self.group.add(Metric("rx", interval=5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import sys
+import time
+import unittest
+from threading import Thread
+
+import mock
+
+from liota.lib.utilities import clock
+
+
+class ClockTest(unittest.TestCase):
+
+    def test_monotonic(self):
+        readings = [clock.monotonic_ms() for _ in range(1000)]
+        self.assertEquals(readings, sorted(readings))
+        self.assertTrue(abs(clock.monotonic() * 1000 - readings[-1]) < 100)
+        self.assertTrue(abs(clock.coarse_ms() - readings[-1]) < 100)
+
+    def test_monotonic_across_threads(self):
+        backward = []
+
+        def read():
+            last_s = clock.monotonic()
+            last_ms = clock.monotonic_ms()
+            for _ in range(20000):
+                now_s = clock.monotonic()
+                now_ms = clock.monotonic_ms()
+                if now_s < last_s or now_ms < last_ms:
+                    backward.append((last_s, now_s, last_ms, now_ms))
+                last_s, last_ms = now_s, now_ms
+
+        # Switching threads every bytecode makes readings interleave
+        check_interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        try:
+            threads = [Thread(target=read) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setcheckinterval(check_interval)
+        self.assertEquals(backward, [])
+
+    def test_wall_ms(self):
+        self.assertTrue(isinstance(clock.wall_ms(), long))
+        self.assertTrue(abs(clock.wall_ms() - time.time() * 1000) < 100)
+
+    def test_wall_jump_does_not_move_monotonic_clock(self):
+        monotonic_before = clock.monotonic_ms()
+        wall_before = clock.wall_ms()
+        clock.inject_wall_jump(-3600 * 1000)
+        try:
+            self.assertTrue(clock.monotonic_ms() - monotonic_before < 100)
+            self.assertTrue(
+                abs(wall_before - clock.wall_ms() - 3600 * 1000) < 100)
+        finally:
+            clock.inject_wall_jump(3600 * 1000)
+        self.assertTrue(abs(clock.wall_ms() - wall_before) < 100)
+
+    @mock.patch("liota.lib.utilities.clock.time")
+    @mock.patch.multiple("liota.lib.utilities.clock",
+                         _fallback_last=0.0, _fallback_offset=0.0)
+    def test_fallback_cancels_backward_steps(self, time):
+        time.time.return_value = 1000.0
+        self.assertEquals(clock._fallback_monotonic(), 1000.0)
+        time.time.return_value = 900.0
+        self.assertEquals(clock._fallback_monotonic(), 1000.0)
+        time.time.return_value = 901.0
+        self.assertEquals(clock._fallback_monotonic(), 1001.0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
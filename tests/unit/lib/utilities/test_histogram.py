@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------#
+#  Copyright © 2015-2017 VMware, Inc. All Rights Reserved.                    #
+#                                                                             #
+#  Licensed under the BSD 2-Clause License (the “License”); you may not use   #
+#  this file except in compliance with the License.                           #
+#                                                                             #
+#  The BSD 2-Clause License                                                   #
+#                                                                             #
+#  Redistribution and use in source and binary forms, with or without         #
+#  modification, are permitted provided that the following conditions are met:#
+#                                                                             #
+#  - Redistributions of source code must retain the above copyright notice,   #
+#      this list of conditions and the following disclaimer.                  #
+#                                                                             #
+#  - Redistributions in binary form must reproduce the above copyright        #
+#      notice, this list of conditions and the following disclaimer in the    #
+#      documentation and/or other materials provided with the distribution.   #
+#                                                                             #
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"#
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE  #
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE #
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE  #
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR        #
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF       #
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS   #
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN    #
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)    #
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF     #
+#  THE POSSIBILITY OF SUCH DAMAGE.                                            #
+# ----------------------------------------------------------------------------#
+
+import unittest
+
+from liota.lib.utilities.histogram import Histogram
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_empty(self):
+        histogram = Histogram()
+        self.assertEquals(histogram.mean(), 0.0)
+        self.assertEquals(histogram.percentile(99), 0.0)
+
+    def test_record(self):
+        histogram = Histogram(bounds=(1, 10, 100))
+        for value in (0.5, 5, 5, 50, 500):
+            histogram.record(value)
+        self.assertEquals(histogram.buckets, [1, 2, 1, 1])
+        self.assertEquals(histogram.count, 5)
+        self.assertEquals(histogram.mean(), 112.1)
+        self.assertEquals(histogram.max, 500)
+
+    def test_percentile(self):
+        histogram = Histogram(bounds=(1, 10, 100))
+        for value in range(1, 11):
+            histogram.record(value)
+        self.assertEquals(histogram.percentile(10), 1)
+        self.assertEquals(histogram.percentile(50), 10)
+        self.assertEquals(histogram.percentile(100), 10)
+        histogram.record(1000)
+        self.assertEquals(histogram.percentile(100), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)